@@ -0,0 +1,50 @@
+""" Benchmark of reading the training tables as rows of Python objects, then
+    converting them to columns, and streaming them straight into NumPy
+    columns, timing each and measuring the peak memory allocated. """
+
+import time
+import logging
+import tracemalloc
+import numpy as np
+from ..common.db import TRAINING_TABLES
+from .dataset import benchmark_database, populate
+from .window_queries import FULL_HISTORY_SEASONS
+
+def rows_to_columns(database, query, dtypes):
+    """ Fetches every row, then converts each column as before query_columns. """
+    cursor = database.query(query)
+    rows = cursor.fetchall()
+    cursor.close()
+    return [
+        (np.array([row[index] if row[index] is not None else 0 for row in rows], dtype=dtype),
+         np.array([row[index] is None for row in rows], dtype=bool))
+        for index, dtype in enumerate(dtypes)
+    ]
+
+def fetch_columns(database, query, dtypes):
+    """ Streams the rows into columns. """
+    return database.query_columns(query, dtypes=dtypes)
+
+def measure(function, database):
+    """ Reads every training table, returning the time taken and peak memory. """
+    tracemalloc.start()
+    start = time.time()
+    tables = {
+        table: function(database, query, dtypes)
+        for table, (query, dtypes) in TRAINING_TABLES.items()
+    }
+    elapsed = time.time() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del tables
+    return elapsed, peak
+
+if __name__ == '__main__':
+    logging.basicConfig()
+    logging.root.setLevel(logging.INFO)
+    with benchmark_database() as database:
+        populate(database, FULL_HISTORY_SEASONS)
+        logging.info("%-20s %12s %12s", 'Method', 'Time (ms)', 'Peak (MB)')
+        for name, function in [('rows', rows_to_columns), ('query_columns', fetch_columns)]:
+            elapsed, peak = measure(function, database)
+            logging.info("%-20s %12.2f %12.2f", name, elapsed * 1000, peak / 1024 / 1024)
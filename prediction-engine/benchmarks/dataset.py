@@ -0,0 +1,161 @@
+""" Synthetic multi-season dataset for the database benchmarks. Each benchmark
+    runs on its own database, which is created, filled and then dropped. """
+
+import os
+import time
+import logging
+from contextlib import contextmanager
+import numpy as np
+import mysql.connector as mysql
+from ..common import db as db_module
+from ..common.db import Database
+
+BENCHMARK_DATABASE = os.getenv('BENCHMARK_DB', 'f1_forecast_benchmark')
+SEASONS = int(os.getenv('BENCHMARK_SEASONS', '10'))
+LAST_SEASON = 2019
+RACES_PER_SEASON = 20
+CARS = 20
+DRIVERS = 60
+CONSTRUCTORS = CARS // 2
+CIRCUITS = 25
+
+def server_connection():
+    """ Opens a connection to the server without selecting a database. """
+    connection = mysql.connection.MySQLConnection(
+        user=db_module.SQL_USER,
+        password=db_module.SQL_PASSWORD,
+        host=db_module.SQL_HOST
+    )
+    connection.autocommit = True
+    return connection
+
+@contextmanager
+def benchmark_database():
+    """ Creates an empty benchmark database, dropping it once done. The
+        database is used by the returned Database, which has migrated it. """
+    connection = server_connection()
+    cursor = connection.cursor()
+    cursor.execute("DROP DATABASE IF EXISTS `%s`;" % BENCHMARK_DATABASE)
+    cursor.execute("CREATE DATABASE `%s`;" % BENCHMARK_DATABASE)
+    db_module.SQL_DATABASE = BENCHMARK_DATABASE
+    try:
+        yield Database.get_database()
+    finally:
+        cursor.execute("DROP DATABASE IF EXISTS `%s`;" % BENCHMARK_DATABASE)
+        cursor.close()
+        connection.close()
+
+def insert_rows(database, statement, rows):
+    """ Inserts the rows in batches on a single connection. """
+    connection = database.pool.get()
+    try:
+        cursor = connection.cursor()
+        for start in range(0, len(rows), 1000):
+            cursor.executemany(statement, rows[start:start + 1000])
+        cursor.close()
+    finally:
+        database.pool.put(connection)
+
+def populate(database, seasons=SEASONS, seed=0):
+    """ Fills the database with the given number of seasons of races, each
+        with results, qualifying and standings for every car. Returns the
+        ID of the last race. """
+    random = np.random.RandomState(seed)
+    insert_rows(database, "INSERT INTO circuits (circuitRef, name, url) VALUES (%s, %s, %s)", [
+        ('circuit%i' % index, 'Circuit %i' % index, 'circuit%i' % index)
+        for index in range(1, CIRCUITS + 1)
+    ])
+    insert_rows(database, "INSERT INTO drivers (driverRef, forename, surname, url) "
+                          "VALUES (%s, %s, %s, %s)", [
+                              ('driver%i' % index, 'Driver', str(index), 'driver%i' % index)
+                              for index in range(1, DRIVERS + 1)
+                          ])
+    insert_rows(database, "INSERT INTO constructors (constructorRef, name, url) "
+                          "VALUES (%s, %s, %s)", [
+                              ('constructor%i' % index, 'Constructor %i' % index, '')
+                              for index in range(1, CONSTRUCTORS + 1)
+                          ])
+
+    races, results, qualifying, driver_standings, constructor_standings = [], [], [], [], []
+    race_id = 0
+    for year in range(LAST_SEASON - seasons + 1, LAST_SEASON + 1):
+        lineup = random.choice(np.arange(1, DRIVERS + 1), CARS, replace=False)
+        points = np.zeros(CARS)
+        for race_round in range(1, RACES_PER_SEASON + 1):
+            race_id += 1
+            races.append((
+                race_id, year, race_round, int(random.randint(1, CIRCUITS + 1)),
+                'Grand Prix %i' % race_round, '%i-01-01' % year, 'race%i' % race_id, False, False
+            ))
+            grid = random.permutation(CARS) + 1
+            finish = random.permutation(CARS) + 1
+            pace = np.sort(random.uniform(0, 3, CARS))
+            points += np.maximum(CARS - finish, 0)
+            standings = np.argsort(np.argsort(-points)) + 1
+            for car, driver in enumerate(lineup):
+                constructor = car // 2 + 1
+                # Some cars do not finish, and are left without a position
+                position = int(finish[car]) if random.random_sample() > 0.1 else None
+                results.append((
+                    race_id, int(driver), constructor, int(grid[car]), position,
+                    str(position or 'R'), int(finish[car]), float(CARS - finish[car])
+                ))
+                best = 80 + pace[grid[car] - 1]
+                qualifying.append((
+                    race_id, int(driver), constructor, int(grid[car]),
+                    float(best), float(best), float(pace[grid[car] - 1])
+                ))
+                driver_standings.append((
+                    race_id, int(driver), float(points[car]), int(standings[car]), 0
+                ))
+            for constructor in range(1, CONSTRUCTORS + 1):
+                constructor_standings.append((race_id, constructor, 0.0, constructor, 0))
+
+    insert_rows(database, "INSERT INTO races (raceId, year, round, circuitId, name, date, url, "
+                          "raceTrained, qualifyingTrained) "
+                          "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)", races)
+    insert_rows(database, "INSERT INTO results (raceId, driverId, constructorId, grid, position, "
+                          "positionText, positionOrder, points) "
+                          "VALUES (%s, %s, %s, %s, %s, %s, %s, %s)", results)
+    insert_rows(database, "INSERT INTO qualifying (raceId, driverId, constructorId, position, "
+                          "q1Seconds, bestSeconds, deltaToPole) "
+                          "VALUES (%s, %s, %s, %s, %s, %s, %s)", qualifying)
+    insert_rows(database, "INSERT INTO driverStandings (raceId, driverId, points, position, wins) "
+                          "VALUES (%s, %s, %s, %s, %s)", driver_standings)
+    insert_rows(database, "INSERT INTO constructorStandings (raceId, constructorId, points, "
+                          "position, wins) VALUES (%s, %s, %s, %s, %s)", constructor_standings)
+    analyze(database)
+    logging.info("Generated %i races with %i results", len(races), len(results))
+    return race_id
+
+def analyze(database):
+    """ Updates the index statistics of the tables, as after a bulk load. """
+    cursor = database.query(
+        "ANALYZE TABLE races, results, qualifying, driverStandings, constructorStandings;"
+    )
+    cursor.fetchall()
+    cursor.close()
+
+def time_query(function, repeat):
+    """ Returns the fastest of the given number of runs of the query, in seconds. """
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        function()
+        times.append(time.time() - start)
+    return min(times)
+
+def time_queries(queries, repeat):
+    """ Returns the time of each of the named queries. """
+    return {name: time_query(function, repeat) for name, function in queries}
+
+def log_comparison(title, before, after, names):
+    """ Logs the times of the queries before and after a change. """
+    logging.info("%s", title)
+    logging.info("%-40s %12s %12s %8s", 'Query', 'Before (ms)', 'After (ms)', 'Speedup')
+    for name in names:
+        logging.info(
+            "%-40s %12.2f %12.2f %7.1fx",
+            name, before[name] * 1000, after[name] * 1000,
+            before[name] / after[name] if after[name] > 0 else float('inf')
+        )
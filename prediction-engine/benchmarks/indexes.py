@@ -0,0 +1,67 @@
+""" Benchmark of the training and serving queries without and with the
+    composite indexes, on a synthetic multi-season dataset. """
+
+import logging
+from ..common.migrations import migrate, COMPOSITE_INDEXES_VERSION
+from .dataset import benchmark_database, populate, analyze, time_queries, log_comparison
+
+SERVING_REPEAT = 5
+TRAINING_REPEAT = 1
+
+def serving_queries(database, race):
+    """ Returns the queries made when serving a prediction or information
+        about the race following the given one. """
+    next_race = race + 1
+    return [
+        ('get_race_averages', lambda: database.get_race_averages(next_race)),
+        ('get_race_averages_team', lambda: database.get_race_averages_team(next_race)),
+        ('get_circuit_averages', lambda: database.get_circuit_averages(next_race)),
+        ('get_position_changes', lambda: database.get_position_changes(next_race)),
+        ('get_championship_positions', lambda: database.get_championship_positions(next_race)),
+        ('get_qualifying_form_with_drivers',
+         lambda: database.get_qualifying_form_with_drivers(next_race)),
+        ('get_qualifying_form_circuit', lambda: database.get_qualifying_form_circuit(next_race)),
+        ('get_qualifying_results_with_driver',
+         lambda: database.get_qualifying_results_with_driver(race)),
+        ('get_race_log', lambda: database.get_race_log(race, False)),
+        ('get_qualifying_log', lambda: database.get_qualifying_log(race)),
+        ('get_race_results', lambda: database.get_race_results(race)),
+        ('get_drivers_standings', lambda: database.get_drivers_standings(race)),
+        ('get_calendar', lambda: database.get_calendar(2019))
+    ]
+
+def training_queries(database):
+    """ Returns the queries building the training sets from the database. """
+    return [
+        ('get_race_dataset_form', database.get_race_dataset_form),
+        ('get_race_dataset_form_team', database.get_race_dataset_form_team),
+        ('get_race_dataset_standings', database.get_race_dataset_standings),
+        ('get_race_dataset_position_changes', database.get_race_dataset_position_changes),
+        ('get_qualifying_dataset_form', database.get_qualifying_dataset_form),
+        ('get_qualifying_dataset_standings', database.get_qualifying_dataset_standings)
+    ]
+
+def run_queries(database, race):
+    """ Returns the time of each serving and training query. """
+    times = time_queries(serving_queries(database, race), SERVING_REPEAT)
+    times.update(time_queries(training_queries(database), TRAINING_REPEAT))
+    return times
+
+if __name__ == '__main__':
+    logging.basicConfig()
+    logging.root.setLevel(logging.INFO)
+    with benchmark_database() as database:
+        last_race = populate(database)
+        names = [name for name, _ in serving_queries(database, last_race)
+                 + training_queries(database)]
+
+        # Revert to the tables without the indexes
+        migrate(database, COMPOSITE_INDEXES_VERSION - 1)
+        analyze(database)
+        before = run_queries(database, last_race)
+
+        migrate(database)
+        analyze(database)
+        after = run_queries(database, last_race)
+
+        log_comparison('Composite indexes', before, after, names)
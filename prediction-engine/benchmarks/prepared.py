@@ -0,0 +1,41 @@
+""" Benchmark of the serving queries sent as text and run as statements
+    prepared on each connection, on a synthetic multi-season dataset. The
+    difference is the time MySQL spends parsing and planning each query. """
+
+import logging
+from unittest import mock
+from ..common import db as db_module
+from .dataset import benchmark_database, populate, time_queries, log_comparison
+from .indexes import serving_queries
+
+REPEAT = 20
+
+def prepare_count(database):
+    """ Returns the number of statements the server has prepared. """
+    cursor = database.query("SHOW GLOBAL STATUS LIKE 'Com_stmt_prepare';")
+    result = int(cursor.fetchall()[0][1])
+    cursor.close()
+    return result
+
+def run_queries(database, queries, prepared):
+    """ Returns the time of each serving query, with the total for a request
+        making each of them once, and the number of statements prepared. """
+    before = prepare_count(database)
+    with mock.patch.object(db_module, 'PREPARED_STATEMENTS', prepared):
+        times = time_queries(queries, REPEAT)
+    times['total'] = sum(times.values())
+    return times, prepare_count(database) - before
+
+if __name__ == '__main__':
+    logging.basicConfig()
+    logging.root.setLevel(logging.INFO)
+    with benchmark_database() as database:
+        last_race = populate(database)
+        queries = serving_queries(database, last_race)
+        names = [name for name, _ in queries] + ['total']
+
+        text, _ = run_queries(database, queries, False)
+        prepared, count = run_queries(database, queries, True)
+
+        log_comparison('Text to prepared statements', text, prepared, names)
+        logging.info("Prepared %i statements for %i queries", count, len(queries) * REPEAT)
@@ -0,0 +1,29 @@
+""" Microbenchmark of the race ranking modes for different grid sizes. """
+
+import timeit
+import logging
+import numpy as np
+from ..common.ranking import results_to_ranking, RANKING_MODES
+
+GRID_SIZES = [20, 22, 26]
+NUMBER = 1000
+
+def generate_predictions(number_of_drivers, random):
+    """ Generates random class probabilities for each driver. """
+    return [
+        {'probabilities': probabilities}
+        for probabilities in random.dirichlet(np.ones(20), number_of_drivers).astype(np.float32)
+    ]
+
+if __name__ == '__main__':
+    logging.basicConfig()
+    logging.root.setLevel(logging.INFO)
+    random = np.random.RandomState(0)
+    for grid_size in GRID_SIZES:
+        predictions = generate_predictions(grid_size, random)
+        for mode in RANKING_MODES:
+            seconds = min(timeit.repeat(
+                lambda: results_to_ranking(predictions, grid_size, mode),
+                number=NUMBER, repeat=5
+            )) / NUMBER
+            logging.info("%i cars, %s: %.1f microseconds", grid_size, mode, seconds * 1e6)
@@ -0,0 +1,98 @@
+""" Benchmark of the MyISAM and the clustered InnoDB tables, timing the driver
+    history queries alone and the latency of reads and writes made while
+    training reads the whole history, on a synthetic multi-season dataset. """
+
+import time
+import logging
+import threading
+import numpy as np
+from ..common.migrations import migrate, INNODB_VERSION
+from .dataset import benchmark_database, populate, analyze, time_queries, log_comparison
+from .indexes import serving_queries, training_queries, SERVING_REPEAT, TRAINING_REPEAT
+
+LOAD_SECONDS = 10
+
+def history_queries(database, race):
+    """ Returns the queries reading driver and team history. """
+    return [
+        (name, function) for name, function in serving_queries(database, race)
+        if name in ('get_race_averages', 'get_race_averages_team', 'get_position_changes',
+                    'get_qualifying_form_with_drivers', 'get_championship_positions')
+    ]
+
+def run_queries(database, race):
+    """ Returns the time of each history and training query. """
+    times = time_queries(history_queries(database, race), SERVING_REPEAT)
+    times.update(time_queries(training_queries(database), TRAINING_REPEAT))
+    return times
+
+def mixed_load(database, race, seconds=LOAD_SECONDS):
+    """ Reads the training tables repeatedly while results are inserted and
+        serving queries made, returning the latencies of the writes and reads. """
+    stop = threading.Event()
+    write_times = []
+
+    def timed(function, times):
+        """ Runs the function until stopped, recording the time of each run. """
+        while not stop.is_set():
+            start = time.time()
+            function()
+            times.append(time.time() - start)
+
+    threads = [
+        threading.Thread(target=timed, args=(database.get_training_tables, [])),
+        threading.Thread(target=timed, args=(
+            lambda: database.insert_result(
+                race + 1, 1, 1, None, 1, 1, '1', 1, 0, 0, None, None, None, 0, None, None, 0
+            ),
+            write_times
+        ))
+    ]
+    for thread in threads:
+        thread.start()
+    read_times = []
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        start = time.time()
+        database.get_race_averages(race + 1)
+        read_times.append(time.time() - start)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return write_times, read_times
+
+def log_latencies(title, times):
+    """ Logs the percentiles of the latencies. """
+    times = np.array(times) * 1000
+    logging.info(
+        "%-40s %8i %10.2f %10.2f %10.2f", title, len(times),
+        np.percentile(times, 50), np.percentile(times, 99), times.max()
+    )
+
+if __name__ == '__main__':
+    logging.basicConfig()
+    logging.root.setLevel(logging.INFO)
+    with benchmark_database() as database:
+        last_race = populate(database)
+        names = [name for name, _ in history_queries(database, last_race)
+                 + training_queries(database)]
+
+        # Revert to the MyISAM tables, which still have the composite indexes
+        migrate(database, INNODB_VERSION - 1)
+        analyze(database)
+        before = run_queries(database, last_race)
+        before_load = mixed_load(database, last_race)
+
+        migrate(database)
+        analyze(database)
+        after = run_queries(database, last_race)
+        after_load = mixed_load(database, last_race)
+
+        log_comparison('MyISAM to clustered InnoDB', before, after, names)
+        logging.info("Latency while reading the training tables")
+        logging.info("%-40s %8s %10s %10s %10s", 'Operation', 'Count', 'p50 (ms)', 'p99 (ms)',
+                     'Max (ms)')
+        log_latencies('MyISAM insert_result', before_load[0])
+        log_latencies('MyISAM get_race_averages', before_load[1])
+        log_latencies('InnoDB insert_result', after_load[0])
+        log_latencies('InnoDB get_race_averages', after_load[1])
@@ -0,0 +1,32 @@
+""" Benchmark of the rolling average queries written as subqueries and with
+    window functions, on a synthetic full-history dataset. """
+
+import logging
+from ..common.db import Database
+from ..common.window_queries import WindowQueries, SERVING_QUERIES, TRAINING_QUERIES
+from .dataset import benchmark_database, populate, time_query, log_comparison
+from .indexes import SERVING_REPEAT, TRAINING_REPEAT
+
+# The full history of the championship, from 1950
+FULL_HISTORY_SEASONS = 70
+
+def time_implementation(implementation, database, race):
+    """ Returns the time of each query of the given implementation. """
+    times = {}
+    for name in SERVING_QUERIES:
+        times[name] = time_query(
+            lambda: getattr(implementation, name)(database, race + 1), SERVING_REPEAT
+        )
+    for name in TRAINING_QUERIES:
+        times[name] = time_query(lambda: getattr(implementation, name)(database), TRAINING_REPEAT)
+    return times
+
+if __name__ == '__main__':
+    logging.basicConfig()
+    logging.root.setLevel(logging.INFO)
+    with benchmark_database() as database:
+        last_race = populate(database, FULL_HISTORY_SEASONS)
+        subqueries = time_implementation(Database, database, last_race)
+        window = time_implementation(WindowQueries, database, last_race)
+        log_comparison('Subqueries to window functions', subqueries, window,
+                       SERVING_QUERIES + TRAINING_QUERIES)
@@ -0,0 +1,43 @@
+""" Runs the servers with gevent's cooperative I/O, in which blocking calls
+    on sockets yield to the other greenlets. The standard library must be
+    patched before anything opens a connection, so patch_io is called
+    before any other module of the application is imported. """
+
+import os
+import logging
+
+COOPERATIVE_IO = os.getenv('COOPERATIVE_IO', 'true') == 'true'
+
+def patch_io():
+    """ Patches the standard library for cooperative I/O, if enabled. """
+    if not COOPERATIVE_IO:
+        return False
+    from gevent import monkey
+
+    monkey.patch_all()
+    return True
+
+def is_cooperative(connection):
+    """ Returns whether the MySQL connection reads from a gevent socket. The
+        C extension of the driver makes its own blocking calls, so only the
+        pure Python connection can yield. """
+    import gevent.socket
+
+    network = getattr(connection, '_socket', None)
+    return isinstance(getattr(network, 'sock', None), gevent.socket.socket)
+
+def check_cooperative(database):
+    """ Checks that queries on the database will yield, warning if not. """
+    if not COOPERATIVE_IO:
+        logging.info("Cooperative I/O is disabled, so requests will block each other")
+        return False
+    connection = database.pool.get()
+    try:
+        cooperative = is_cooperative(connection)
+    finally:
+        database.pool.put(connection)
+    if cooperative:
+        logging.info("Running with cooperative I/O")
+    else:
+        logging.warning("The MySQL driver does not use a gevent socket, so queries will block")
+    return cooperative
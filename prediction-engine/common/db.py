@@ -1,18 +1,195 @@
 """ Contain the MySQL database class """
 import os
+import time
+import queue
 import logging
 import sys
+import threading
+from contextlib import contextmanager
+import numpy as np
 import mysql.connector as mysql
+from mysql.connector.cursor import MySQLCursorPrepared
+from .features import START_YEAR
+from .migrations import migrate
+from .window_queries import WindowQueries
 
 SQL_USER = os.getenv('MYSQL_USER')
 SQL_PASSWORD = os.getenv('MYSQL_PASSWORD')
 SQL_HOST = os.getenv('MYSQL_HOST')
 SQL_DATABASE = os.getenv('MYSQL_DB')
 
+# Either 'subquery' or 'window', which computes the rolling averages with window
+# functions and requires MySQL 8
+ROLLING_QUERIES = os.getenv('ROLLING_QUERIES', 'subquery')
+
+# Connections are opened as needed, up to the pool size
+POOL_SIZE = int(os.getenv('MYSQL_POOL_SIZE', '5'))
+# Seconds to wait for a connection before giving up
+POOL_TIMEOUT = float(os.getenv('MYSQL_POOL_TIMEOUT', '10'))
+# Connections idle for longer than this many seconds are pinged before use
+POOL_HEALTH_CHECK_IDLE = float(os.getenv('MYSQL_POOL_HEALTH_CHECK_IDLE', '5'))
+# Rows read from the server at a time when fetching columns
+FETCH_CHUNK_SIZE = int(os.getenv('MYSQL_FETCH_CHUNK_SIZE', '10000'))
+# Whether the frequent read queries run as statements prepared on each connection
+PREPARED_STATEMENTS = os.getenv('MYSQL_PREPARED_STATEMENTS', 'true') == 'true'
+
+# The query and column types of each table read to build the training sets
+TRAINING_TABLES = {
+    'races': ("""
+        SELECT
+            raceId,
+            year,
+            circuitId,
+            REPLACE(LOWER(name), ' grand prix', ''),
+            raceTrained,
+            qualifyingTrained,
+            evaluationRace
+        FROM races;""", [np.int64, np.int64, np.int64, object, np.int64, np.int64, np.int64]),
+    'results': ("""
+        SELECT resultId, raceId, driverId, constructorId, grid, position
+        FROM results;""", [np.int64] * 6),
+    # The deltas are read as exact integer milliseconds
+    'qualifying': ("""
+        SELECT qualifyId, raceId, driverId, constructorId,
+            CAST(deltaToPole * 1000 AS SIGNED)
+        FROM qualifying;""", [np.int64] * 5),
+    'driverStandings': ("""
+        SELECT driverStandingsId, raceId, driverId, position
+        FROM driverStandings;""", [np.int64] * 4),
+    'drivers': ("SELECT driverId, driverRef FROM drivers;", [np.int64, object]),
+    'constructors': (
+        "SELECT constructorId, constructorRef FROM constructors;", [np.int64, object]
+    )
+}
+
 def create_list_query(items):
     """ Creates a query string for a long list of items. """
     return ','.join(['%s'] * len(items))
 
+def resize_column(array, size):
+    """ Returns a copy of the array with the given length, zero filled. """
+    result = np.zeros(size, dtype=array.dtype)
+    length = min(size, len(array))
+    result[:length] = array[:length]
+    return result
+
+class ConnectionPool:
+    """ Bounded pool of connections, which are opened as needed. At most
+        size connections are checked out at once, and connections which
+        have been idle are checked to be alive before they are reused. """
+
+    def __init__(self, connect, size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        """ Constructor, taking the function opening a new connection. """
+        self.connect = connect
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(size)
+        # The most recently used connection is reused first
+        self.idle = queue.LifoQueue()
+
+    def is_healthy(self, connection):
+        """ Pings the connection, reconnecting it if it has dropped. """
+        try:
+            connection.ping(reconnect=True, attempts=1)
+            return True
+        except mysql.Error as err:
+            logging.debug("Pooled connection is unhealthy: %s", str(err))
+            return False
+
+    def get(self):
+        """ Checks out a connection, waiting up to the timeout for one to be returned. """
+        if not self.slots.acquire(timeout=self.timeout):
+            raise mysql.errors.PoolError(
+                "No connection available after %.1f seconds" % self.timeout
+            )
+        try:
+            try:
+                connection, last_used = self.idle.get_nowait()
+            except queue.Empty:
+                return self.connect()
+            if time.time() - last_used > POOL_HEALTH_CHECK_IDLE and not self.is_healthy(connection):
+                self.discard(connection)
+                return self.connect()
+            return connection
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def put(self, connection):
+        """ Returns a connection to the pool. """
+        self.idle.put((connection, time.time()))
+        self.slots.release()
+
+    def discard(self, connection):
+        """ Closes a connection which is no longer usable. """
+        try:
+            connection.close()
+        except mysql.Error:
+            pass
+
+def prepared_statements(connection):
+    """ Returns the statements prepared on the connection, by their SQL.
+        Statements belong to the server session, so are forgotten once the
+        connection has reconnected, such as when pinged by the pool. """
+    session, statements = getattr(connection, 'prepared_statements', (None, None))
+    if session != connection.connection_id:
+        statements = {}
+        connection.prepared_statements = (connection.connection_id, statements)
+    return statements
+
+class PreparedCursor(MySQLCursorPrepared):
+    """ Cursor executing statements prepared once per connection. Closing the
+        cursor leaves its statement prepared, so later cursors running the same
+        SQL on the connection only send the parameters. """
+
+    def execute(self, operation, params=None, multi=False):
+        """ Executes the statement, preparing it if it is new to the connection. """
+        statements = prepared_statements(self._connection)
+        try:
+            self.execute_statement(statements, operation, params)
+        except mysql.errors.DatabaseError as err:
+            if err.errno != mysql.errorcode.ER_UNKNOWN_STMT_HANDLER:
+                raise
+            # The server has dropped the statement, so prepare it again
+            logging.debug("Preparing statement again as the server no longer has it")
+            statements.pop(operation, None)
+            self.execute_statement(statements, operation, params)
+
+    def execute_statement(self, statements, operation, params):
+        """ Executes the statement, reusing the prepared one if there is one. """
+        # The cursor skips preparing when given the statement it last executed
+        self._prepared = statements.get(operation)
+        self._executed = operation if self._prepared is not None else None
+        super().execute(operation, params)
+        statements[operation] = self._prepared
+
+    def reset(self, free=True):
+        """ Resets the cursor, without closing its statement on the server. """
+        self._prepared = None
+        super().reset(free)
+
+class PooledCursor:
+    """ Wraps a cursor, returning its connection to the pool once closed. """
+
+    def __init__(self, cursor, release):
+        """ Constructor, taking the cursor and the function releasing its connection. """
+        self.cursor = cursor
+        self.release = release
+
+    def close(self):
+        """ Closes the cursor, and releases the connection. """
+        try:
+            self.cursor.close()
+        finally:
+            if self.release is not None:
+                self.release()
+                self.release = None
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
 class Database:
     """ Singleton class for managing DB and queries. """
     # Here will be the instance stored.
@@ -22,51 +199,132 @@ class Database:
     def get_database():
         """ Return existing database method if it exists """
         if Database.__instance is None:
-            Database()
+            if ROLLING_QUERIES == 'window':
+                WindowDatabase()
+            else:
+                Database()
         return Database.__instance
 
     def connect(self):
         """ Attempts to open a connection to the database """
         try:
-            self.database = mysql.connection.MySQLConnection(
+            connection = mysql.connection.MySQLConnection(
                 user=SQL_USER,
                 password=SQL_PASSWORD,
                 host=SQL_HOST,
                 database=SQL_DATABASE
             )
-            self.database.autocommit = True
+            connection.autocommit = True
             logging.debug("Successfully opened MySQL connection")
+            return connection
         except mysql.Error as err:
             logging.error("Could not connect to database: %s", str(err))
             sys.exit()
 
-    def query(self, *args):
-        """ Attempts to query database, reopening the connection
-            if it has dropped for any reason. """
+    @contextmanager
+    def session(self):
+        """ Runs every query in the block on the same connection, for
+            statements such as transactions which apply to a connection. """
+        if getattr(self.local, 'connection', None) is not None:
+            yield
+            return
+        self.local.connection = self.pool.get()
+        try:
+            yield
+        finally:
+            connection, self.local.connection = self.local.connection, None
+            self.pool.put(connection)
+
+    @contextmanager
+    def transaction(self):
+        """ Runs every query in the block as one transaction on the same
+            connection, committed at the end or rolled back on error. """
+        with self.session():
+            cursor = self.query("START TRANSACTION;")
+            cursor.close()
+            try:
+                yield
+            except BaseException:
+                cursor = self.query("ROLLBACK;")
+                cursor.close()
+                raise
+            cursor = self.query("COMMIT;")
+            cursor.close()
+
+    def query(self, *args, prepared=False):
+        """ Attempts to query database on a pooled connection, reopening the
+            connection if it has dropped for any reason. The connection is
+            returned to the pool when the cursor is closed, unless in a session.
+            Prepared queries run as statements prepared once per connection. """
+        cursor_class = PreparedCursor if prepared and PREPARED_STATEMENTS else None
+        session_connection = getattr(self.local, 'connection', None)
+        connection = session_connection or self.pool.get()
+        try:
+            try:
+                cursor = connection.cursor(cursor_class=cursor_class)
+                cursor.execute(*args)
+            except mysql.errors.OperationalError:
+                logging.debug("Reconnecting to MySQL as connection lost")
+                self.pool.discard(connection)
+                connection = self.connect()
+                if session_connection is not None:
+                    self.local.connection = connection
+                cursor = connection.cursor(cursor_class=cursor_class)
+                cursor.execute(*args)
+        except BaseException:
+            if session_connection is None:
+                self.pool.put(connection)
+            raise
+        if session_connection is not None:
+            return PooledCursor(cursor, None)
+        return PooledCursor(cursor, lambda: self.pool.put(connection))
+
+    def query_columns(self, sql, params=(), dtypes=()):
+        """ Runs a query, returning a (values, nulls) pair of NumPy arrays for
+            each column, typed by the given dtypes, where NULL values are zero
+            (or None) and flagged in the mask. The rows are streamed from the
+            cursor in chunks, so only one chunk is held as Python objects. """
+        cursor = self.query(sql, params)
         try:
-            cursor = self.database.cursor()
-            cursor.execute(*args)
-        except mysql.errors.OperationalError:
-            logging.debug("Reconnecting to MySQL as connection lost")
-            self.connect()
-            cursor = self.database.cursor()
-            cursor.execute(*args)
-        return cursor
+            if len(cursor.description) != len(dtypes):
+                cursor.fetchall()
+                raise ValueError('Query returns %i columns, but %i dtypes were given'
+                                 % (len(cursor.description), len(dtypes)))
+            capacity = FETCH_CHUNK_SIZE
+            values = [np.zeros(capacity, dtype=dtype) for dtype in dtypes]
+            nulls = [np.zeros(capacity, dtype=bool) for _ in dtypes]
+            count = 0
+            rows = cursor.fetchmany(FETCH_CHUNK_SIZE)
+            while rows:
+                end = count + len(rows)
+                if end > capacity:
+                    capacity = max(capacity * 2, end)
+                    values = [resize_column(array, capacity) for array in values]
+                    nulls = [resize_column(array, capacity) for array in nulls]
+                for index, cells in enumerate(zip(*rows)):
+                    null = np.fromiter(
+                        (cell is None for cell in cells), dtype=bool, count=len(rows)
+                    )
+                    if null.any():
+                        fill = None if values[index].dtype == object else 0
+                        cells = [fill if cell is None else cell for cell in cells]
+                    values[index][count:end] = cells
+                    nulls[index][count:end] = null
+                count = end
+                rows = cursor.fetchmany(FETCH_CHUNK_SIZE)
+        finally:
+            cursor.close()
+        if count < capacity:
+            values = [resize_column(array, count) for array in values]
+            nulls = [resize_column(array, count) for array in nulls]
+        return list(zip(values, nulls))
 
     def __init__(self):
-        """ Constructor, opening a connection and setting instance. """
+        """ Constructor, creating the pool, migrating the schema and setting instance. """
         if Database.__instance is None:
-            self.connect()
-            self.create_results_table()
-            self.create_qualifying_table()
-            self.create_circuits_table()
-            self.create_constructor_standings_table()
-            self.create_constructors_table()
-            self.create_driver_standings_table()
-            self.create_drivers_table()
-            self.create_qualifying_prediction_table()
-            self.create_race_prediction_table()
-            self.create_races_table()
+            self.local = threading.local()
+            self.pool = ConnectionPool(self.connect)
+            migrate(self)
             Database.__instance = self
 
     def create_results_table(self):
@@ -96,7 +354,6 @@ class Database:
             ) ENGINE=MyISAM DEFAULT CHARSET=utf8
             """
         )
-        self.database.commit()
         cursor.close()
 
     def create_qualifying_table(self):
@@ -120,9 +377,32 @@ class Database:
             ) ENGINE=MyISAM DEFAULT CHARSET=utf8
             """
         )
-        self.database.commit()
         cursor.close()
 
+    def create_qualifying_delta_columns(self):
+        """ Adds the best lap and delta to pole columns to the qualifying
+            table if it doesn't have them, and fills them for existing rows. """
+        cursor = self.query(
+            """
+            SELECT COUNT(*)
+            FROM information_schema.columns
+            WHERE table_schema = DATABASE()
+                AND table_name = 'qualifying'
+                AND column_name = 'deltaToPole';"""
+        )
+        exists = cursor.fetchone()[0] > 0
+        cursor.close()
+        if not exists:
+            cursor = self.query(
+                """
+                ALTER TABLE `qualifying`
+                    ADD COLUMN `bestSeconds` decimal(7,3) DEFAULT NULL AFTER `q3Seconds`,
+                    ADD COLUMN `deltaToPole` decimal(7,3) DEFAULT NULL AFTER `bestSeconds`
+                """
+            )
+            cursor.close()
+            self.update_qualifying_deltas()
+
     def create_circuits_table(self):
         """ Initialises the circuits table if it doesn't exist. """
         cursor = self.query(
@@ -142,7 +422,6 @@ class Database:
             ) ENGINE=MyISAM DEFAULT CHARSET=utf8
             """
         )
-        self.database.commit()
         cursor.close()
 
     def create_constructor_standings_table(self):
@@ -161,7 +440,6 @@ class Database:
             ) ENGINE=MyISAM DEFAULT CHARSET=utf8
             """
         )
-        self.database.commit()
         cursor.close()
 
     def create_constructors_table(self):
@@ -179,7 +457,6 @@ class Database:
             ) ENGINE=MyISAM DEFAULT CHARSET=utf8
             """
         )
-        self.database.commit()
         cursor.close()
 
     def create_driver_standings_table(self):
@@ -198,7 +475,6 @@ class Database:
             ) ENGINE=MyISAM DEFAULT CHARSET=utf8
             """
         )
-        self.database.commit()
         cursor.close()
 
     def create_drivers_table(self):
@@ -220,7 +496,6 @@ class Database:
             ) ENGINE=MyISAM DEFAULT CHARSET=utf8
             """
         )
-        self.database.commit()
         cursor.close()
 
     def create_qualifying_prediction_table(self):
@@ -241,7 +516,6 @@ class Database:
             ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci
             """
         )
-        self.database.commit()
         cursor.close()
 
     def create_race_prediction_table(self):
@@ -261,7 +535,6 @@ class Database:
             ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci
             """
         )
-        self.database.commit()
         cursor.close()
 
     def create_races_table(self):
@@ -285,14 +558,55 @@ class Database:
             ) ENGINE=MyISAM DEFAULT CHARSET=utf8
             """
         )
-        self.database.commit()
+        cursor.close()
+
+    def create_race_features_table(self):
+        """ Initialises the materialized race features table if it doesn't exist.
+            Rows hold the features of each driver for predicting the given race. """
+        cursor = self.query(
+            """
+            CREATE TABLE IF NOT EXISTS `raceFeatures` (
+                `raceId` int(11) NOT NULL,
+                `driverId` int(11) NOT NULL,
+                `averageForm` decimal(14,4) DEFAULT NULL,
+                `circuitAverageForm` decimal(14,4) DEFAULT NULL,
+                `championshipStanding` int(11) DEFAULT NULL,
+                `positionChanges` decimal(14,4) DEFAULT NULL,
+                `averageFormTeam` decimal(14,4) DEFAULT NULL,
+                `circuitAverageFormTeam` decimal(14,4) DEFAULT NULL,
+                `positionChangesTeam` decimal(14,4) DEFAULT NULL,
+                PRIMARY KEY (`raceId`, `driverId`)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8
+            """
+        )
+        cursor.close()
+
+    def create_qualifying_features_table(self):
+        """ Initialises the materialized qualifying features table if it doesn't exist.
+            Rows hold the features of each driver for predicting the given race. """
+        cursor = self.query(
+            """
+            CREATE TABLE IF NOT EXISTS `qualifyingFeatures` (
+                `raceId` int(11) NOT NULL,
+                `driverId` int(11) NOT NULL,
+                `constructorId` int(11) NOT NULL,
+                `averageForm` decimal(16,7) DEFAULT NULL,
+                `circuitAverageForm` decimal(16,7) DEFAULT NULL,
+                `championshipStanding` int(11) DEFAULT NULL,
+                `averageFormTeam` decimal(16,7) DEFAULT NULL,
+                `circuitAverageFormTeam` decimal(16,7) DEFAULT NULL,
+                PRIMARY KEY (`raceId`, `driverId`)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8
+            """
+        )
         cursor.close()
 
     def get_race_by_id(self, race_id):
         """ Gets the name of a race using the ID. """
         cursor = self.query(
             "SELECT REPLACE(LOWER(name), ' grand prix', ''), year FROM races WHERE raceId = %s;",
-            (race_id,)
+            (race_id,),
+            prepared=True
         )
         result = cursor.fetchone()
         cursor.close()
@@ -306,19 +620,13 @@ class Database:
                     drivers.*,
                     constructors.constructorRef,
                     qualifying.position,
-                    NULLIF((LEAST(IFNULL(qualifying.q1Seconds, ~0),
-                        IFNULL(qualifying.q2Seconds, ~0),
-                        IFNULL(qualifying.q3Seconds, ~0))), ~0)
-                        -((SELECT MIN(LEAST(IFNULL(qualifying1.q1Seconds, ~0),
-                            IFNULL(qualifying1.q2Seconds, ~0),
-                            IFNULL(qualifying1.q3Seconds, ~0)))
-                            FROM qualifying qualifying1
-                            WHERE qualifying1.raceId = qualifying.raceId))
+                    qualifying.deltaToPole
                 FROM qualifying
                 INNER JOIN drivers ON qualifying.driverId=drivers.driverId
                 INNER JOIN constructors ON qualifying.constructorId=constructors.constructorId
                 WHERE raceId=%s;""",
-            (race_id,)
+            (race_id,),
+            prepared=True
         )
         result = cursor.fetchall()
         cursor.close()
@@ -337,7 +645,8 @@ class Database:
                 FROM results
                 INNER JOIN races ON results.raceId<races.raceId
                 ORDER by results.raceId DESC
-                LIMIT 1;"""
+                LIMIT 1;""",
+            prepared=True
         )
         result = cursor.fetchone()
         cursor.close()
@@ -356,7 +665,8 @@ class Database:
                 FROM qualifying
                 INNER JOIN races ON qualifying.raceId<races.raceId
                 ORDER BY qualifying.raceId DESC
-                LIMIT 1;"""
+                LIMIT 1;""",
+            prepared=True
         )
         result = cursor.fetchone()
         cursor.close()
@@ -385,7 +695,6 @@ class Database:
                     VALUES (%s, %s, %s, %s, %s, %s, %s, %s)""",
             (driver_ref, number, code, forename, surname, dob, nationality, url)
         )
-        self.database.commit()
         result = cursor.lastrowid
         cursor.close()
         return result
@@ -399,7 +708,6 @@ class Database:
                 VALUES (%s, %s, %s, %s)""",
             (constructor_ref, name, nationality, url)
         )
-        self.database.commit()
         result = cursor.lastrowid
         cursor.close()
         return result
@@ -429,7 +737,6 @@ class Database:
                 fastest_lap_speed, status_id
             )
         )
-        self.database.commit()
         result = cursor.rowcount
         cursor.close()
         return result
@@ -451,7 +758,37 @@ class Database:
                 q1, q2, q3, q1_seconds, q2_seconds, q3_seconds
             )
         )
-        self.database.commit()
+        result = cursor.rowcount
+        cursor.close()
+        return result
+
+    def update_qualifying_deltas(self, race_id=None):
+        """ Stores the best lap of each qualifying result and its delta to the
+            pole lap, for the given race or for every race if none is given. """
+        race_filter = "WHERE raceId = %s" if race_id is not None else ""
+        params = (race_id,) if race_id is not None else ()
+        cursor = self.query(
+            """
+                UPDATE qualifying
+                SET bestSeconds = NULLIF((LEAST(IFNULL(q1Seconds, ~0),
+                    IFNULL(q2Seconds, ~0),
+                    IFNULL(q3Seconds, ~0))), ~0)
+                """ + race_filter + ";",
+            params
+        )
+        cursor.close()
+        cursor = self.query(
+            """
+                UPDATE qualifying
+                INNER JOIN
+                    (SELECT raceId, MIN(bestSeconds) AS poleSeconds
+                        FROM qualifying
+                        """ + race_filter + """
+                        GROUP BY raceId) poles
+                ON poles.raceId = qualifying.raceId
+                SET qualifying.deltaToPole = qualifying.bestSeconds - poles.poleSeconds;""",
+            params
+        )
         result = cursor.rowcount
         cursor.close()
         return result
@@ -479,7 +816,6 @@ class Database:
                 VALUES (%s, %s, %s, %s, %s, %s, %s)""",
             (circuit_ref, circuit_name, locality, country, lat, lng, url)
         )
-        self.database.commit()
         result = cursor.lastrowid
         cursor.close()
         return result
@@ -493,7 +829,6 @@ class Database:
                 VALUES (%s, %s, %s, %s, %s, %s, %s)""",
             (year, round_num, circuit_id, name, date, time, url)
         )
-        self.database.commit()
         result = cursor.rowcount
         cursor.close()
         return result
@@ -533,6 +868,63 @@ class Database:
         cursor.close()
         return result
 
+    def get_training_tables(self):
+        """ Reads the columns used to build both training datasets from a
+            consistent snapshot, so that every table is read at the same point
+            in time without blocking new results from being written. Each table
+            is returned as the (values, nulls) pairs from query_columns. """
+        # Transactions belong to a connection, so the reads share one
+        with self.session():
+            cursor = self.query("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ;")
+            cursor.close()
+            cursor = self.query("START TRANSACTION WITH CONSISTENT SNAPSHOT, READ ONLY;")
+            cursor.close()
+            try:
+                result = {}
+                for table, (query, dtypes) in TRAINING_TABLES.items():
+                    result[table] = self.query_columns(query, dtypes=dtypes)
+            finally:
+                cursor = self.query("COMMIT;")
+                cursor.close()
+        return result
+
+    def get_dataset_watermark(self):
+        """ Gets the highest IDs and row counts of the tables the training
+            sets are built from, along with the races waiting for training.
+            Qualifying deltas are updated in place by update_qualifying_deltas,
+            leaving the IDs and counts alone, so are covered by a checksum. """
+        cursor = self.query(
+            """
+            SELECT
+                (SELECT MAX(raceId) FROM races) AS races,
+                (SELECT COUNT(*) FROM races) AS raceCount,
+                (SELECT MAX(resultId) FROM results) AS results,
+                (SELECT COUNT(*) FROM results) AS resultCount,
+                (SELECT MAX(qualifyId) FROM qualifying) AS qualifying,
+                (SELECT COUNT(*) FROM qualifying) AS qualifyingCount,
+                (SELECT MAX(driverStandingsId) FROM driverStandings) AS standings,
+                (SELECT COUNT(*) FROM driverStandings) AS standingCount,
+                (SELECT COUNT(*) FROM drivers) AS driverCount,
+                (SELECT COUNT(*) FROM constructors) AS constructorCount,
+                (SELECT COUNT(*) FROM races WHERE raceTrained IS FALSE) AS raceUntrainedCount,
+                (SELECT BIT_XOR(raceId) FROM races WHERE raceTrained IS FALSE) AS raceUntrained,
+                (SELECT COUNT(*) FROM races WHERE qualifyingTrained IS FALSE)
+                    AS qualifyingUntrainedCount,
+                (SELECT BIT_XOR(raceId) FROM races WHERE qualifyingTrained IS FALSE)
+                    AS qualifyingUntrained,
+                (SELECT BIT_XOR(raceId) FROM races WHERE evaluationRace IS TRUE)
+                    AS evaluation,
+                (SELECT BIT_XOR(CRC32(CONCAT_WS(',', qualifyId, deltaToPole))) FROM qualifying)
+                    AS qualifyingDeltas;"""
+        )
+        row = cursor.fetchone()
+        result = {
+            column[0]: (int(value) if value is not None else None)
+            for column, value in zip(cursor.description, row)
+        }
+        cursor.close()
+        return result
+
     def get_race_dataset(self):
         """ Gets the race dataset for training. """
         cursor = self.query(
@@ -540,14 +932,7 @@ class Database:
             SELECT
                 REPLACE(LOWER(races.name), ' grand prix', ''),
                 results.grid,
-                NULLIF((LEAST(IFNULL(qualifying.q1Seconds, ~0),
-                    IFNULL(qualifying.q2Seconds, ~0),
-                    IFNULL(qualifying.q3Seconds, ~0))), ~0)
-                    -((SELECT MIN(LEAST(IFNULL(qualifying1.q1Seconds, ~0),
-                        IFNULL(qualifying1.q2Seconds, ~0),
-                        IFNULL(qualifying1.q3Seconds, ~0)))
-                            FROM qualifying qualifying1
-                            WHERE qualifying1.raceId = qualifying.raceId)),
+                qualifying.deltaToPole,
                 results.position,
                 (SELECT
                     driverRef
@@ -565,12 +950,11 @@ class Database:
             AND qualifying.driverId=results.driverId
             WHERE raceTrained is FALSE AND evaluationRace is not TRUE
                 AND results.position IS NOT NULL AND results.position <= 20
-                AND races.year >= 2000
+                AND races.year >= %s
                 AND results.grid <= 20
-                AND (qualifying.q1Seconds IS NOT NULL
-                    OR qualifying.q2Seconds IS NOT NULL
-                    OR qualifying.q3Seconds IS NOT NULL)
-            ORDER BY results.resultId ASC;"""
+                AND qualifying.bestSeconds IS NOT NULL
+            ORDER BY results.resultId ASC;""",
+            (START_YEAR,)
         )
         result = cursor.fetchall()
         cursor.close()
@@ -582,14 +966,7 @@ class Database:
             """
             SELECT
                 REPLACE(LOWER(races.name), ' grand prix', ''),
-                NULLIF((LEAST(IFNULL(qualifying.q1Seconds, ~0),
-                    IFNULL(qualifying.q2Seconds, ~0),
-                    IFNULL(qualifying.q3Seconds, ~0))), ~0)
-                    -((SELECT MIN(LEAST(IFNULL(qualifying1.q1Seconds, ~0),
-                        IFNULL(qualifying1.q2Seconds, ~0),
-                        IFNULL(qualifying1.q3Seconds, ~0)))
-                            FROM qualifying qualifying1
-                            WHERE qualifying1.raceId = qualifying.raceId)),
+                qualifying.deltaToPole,
                 (SELECT
                     driverRef
                     FROM drivers
@@ -603,10 +980,10 @@ class Database:
             FROM races
             INNER JOIN qualifying ON qualifying.raceId=races.raceId
             WHERE qualifyingTrained is FALSE AND evaluationRace is not TRUE
-            AND races.year >= 2000
-            AND (qualifying.q1Seconds IS NOT NULL OR qualifying.q2Seconds IS NOT NULL
-                OR qualifying.q3Seconds IS NOT NULL)
-            ORDER BY qualifying.qualifyId ASC;"""
+            AND races.year >= %s
+            AND qualifying.bestSeconds IS NOT NULL
+            ORDER BY qualifying.qualifyId ASC;""",
+            (START_YEAR,)
         )
         result = cursor.fetchall()
         cursor.close()
@@ -634,12 +1011,11 @@ class Database:
             AND qualifying.driverId=results.driverId
             WHERE raceTrained is FALSE AND evaluationRace is not TRUE
                 AND results.position IS NOT NULL AND results.position <= 20
-                AND races.year >= 2000
+                AND races.year >= %s
                 AND results.grid <= 20
-                AND (qualifying.q1Seconds IS NOT NULL
-                    OR qualifying.q2Seconds IS NOT NULL
-                    OR qualifying.q3Seconds IS NOT NULL)
-            ORDER BY results.resultId ASC;"""
+                AND qualifying.bestSeconds IS NOT NULL
+            ORDER BY results.resultId ASC;""",
+            (START_YEAR,)
         )
         result = cursor.fetchall()
         cursor.close()
@@ -653,21 +1029,11 @@ class Database:
                 (SELECT AVG(delta)
                     FROM
                         (SELECT
-                            (NULLIF((LEAST(IFNULL(qualifying1.q1Seconds, ~0),
-                            IFNULL(qualifying1.q2Seconds, ~0),
-                            IFNULL(qualifying1.q3Seconds, ~0))), ~0)
-                            -((SELECT MIN(LEAST(IFNULL(qualifying2.q1Seconds, ~0),
-                                IFNULL(qualifying2.q2Seconds, ~0),
-                                IFNULL(qualifying2.q3Seconds, ~0)))
-                                    FROM qualifying qualifying2
-                                    WHERE qualifying2.raceId = qualifying1.raceId)))
-                                as delta
+                            qualifying1.deltaToPole as delta
                             FROM qualifying qualifying1
                             WHERE qualifying1.raceId < qualifying.raceId
                             AND qualifying.driverId = qualifying1.driverId
-                            AND (qualifying1.q1Seconds IS NOT NULL
-                                OR qualifying1.q2Seconds IS NOT NULL
-                                OR qualifying1.q3Seconds IS NOT NULL)
+                            AND qualifying1.bestSeconds IS NOT NULL
                             ORDER BY qualifyId DESC
                             LIMIT 3)
                             results2)
@@ -675,10 +1041,10 @@ class Database:
             FROM races
             INNER JOIN qualifying ON qualifying.raceId=races.raceId
             WHERE qualifyingTrained is FALSE AND evaluationRace is not TRUE
-            AND races.year >= 2000
-            AND (qualifying.q1Seconds IS NOT NULL OR qualifying.q2Seconds IS NOT NULL
-                OR qualifying.q3Seconds IS NOT NULL)
-            ORDER BY qualifying.qualifyId ASC;"""
+            AND races.year >= %s
+            AND qualifying.bestSeconds IS NOT NULL
+            ORDER BY qualifying.qualifyId ASC;""",
+            (START_YEAR,)
         )
         result = cursor.fetchall()
         cursor.close()
@@ -709,12 +1075,11 @@ class Database:
             AND qualifying.driverId=results.driverId
             WHERE raceTrained is FALSE AND evaluationRace is not TRUE
                 AND results.position IS NOT NULL AND results.position <= 20
-                AND races.year >= 2000
+                AND races.year >= %s
                 AND results.grid <= 20
-                AND (qualifying.q1Seconds IS NOT NULL
-                    OR qualifying.q2Seconds IS NOT NULL
-                    OR qualifying.q3Seconds IS NOT NULL)
-            ORDER BY results.resultId ASC;"""
+                AND qualifying.bestSeconds IS NOT NULL
+            ORDER BY results.resultId ASC;""",
+            (START_YEAR,)
         )
         result = cursor.fetchall()
         cursor.close()
@@ -728,22 +1093,12 @@ class Database:
                 (SELECT AVG(delta)
                     FROM
                         (SELECT
-                            (NULLIF((LEAST(IFNULL(qualifying1.q1Seconds, ~0),
-                            IFNULL(qualifying1.q2Seconds, ~0),
-                            IFNULL(qualifying1.q3Seconds, ~0))), ~0)
-                            -((SELECT MIN(LEAST(IFNULL(qualifying2.q1Seconds, ~0),
-                                IFNULL(qualifying2.q2Seconds, ~0),
-                                IFNULL(qualifying2.q3Seconds, ~0)))
-                                    FROM qualifying qualifying2
-                                    WHERE qualifying2.raceId = qualifying1.raceId)))
-                                as delta
+                            qualifying1.deltaToPole as delta
                             FROM qualifying qualifying1
                             INNER JOIN races races1 ON qualifying1.raceId = races1.raceId
                             WHERE qualifying1.raceId < qualifying.raceId
                             AND qualifying.driverId = qualifying1.driverId
-                            AND (qualifying1.q1Seconds IS NOT NULL
-                                OR qualifying1.q2Seconds IS NOT NULL
-                                OR qualifying1.q3Seconds IS NOT NULL)
+                            AND qualifying1.bestSeconds IS NOT NULL
                             AND races.circuitId=races1.circuitId
                             ORDER BY qualifyId DESC
                             LIMIT 3)
@@ -752,10 +1107,10 @@ class Database:
             FROM races
             INNER JOIN qualifying ON qualifying.raceId=races.raceId
             WHERE qualifyingTrained is FALSE AND evaluationRace is not TRUE
-            AND races.year >= 2000
-            AND (qualifying.q1Seconds IS NOT NULL OR qualifying.q2Seconds IS NOT NULL
-                OR qualifying.q3Seconds IS NOT NULL)
-            ORDER BY qualifying.qualifyId ASC;"""
+            AND races.year >= %s
+            AND qualifying.bestSeconds IS NOT NULL
+            ORDER BY qualifying.qualifyId ASC;""",
+            (START_YEAR,)
         )
         result = cursor.fetchall()
         cursor.close()
@@ -779,12 +1134,11 @@ class Database:
             AND qualifying.driverId=results.driverId
             WHERE raceTrained is FALSE AND evaluationRace is not TRUE
                 AND results.position IS NOT NULL AND results.position <= 20
-                AND races.year >= 2000
+                AND races.year >= %s
                 AND results.grid <= 20
-                AND (qualifying.q1Seconds IS NOT NULL
-                    OR qualifying.q2Seconds IS NOT NULL
-                    OR qualifying.q3Seconds IS NOT NULL)
-            ORDER BY results.resultId ASC;"""
+                AND qualifying.bestSeconds IS NOT NULL
+            ORDER BY results.resultId ASC;""",
+            (START_YEAR,)
         )
         result = cursor.fetchall()
         cursor.close()
@@ -805,10 +1159,10 @@ class Database:
             FROM races
                 INNER JOIN qualifying ON qualifying.raceId=races.raceId
                 WHERE qualifyingTrained is FALSE AND evaluationRace is not TRUE
-                AND races.year >= 2000
-                AND (qualifying.q1Seconds IS NOT NULL OR qualifying.q2Seconds IS NOT NULL
-                    OR qualifying.q3Seconds IS NOT NULL)
-                ORDER BY qualifying.qualifyId ASC;"""
+                AND races.year >= %s
+                AND qualifying.bestSeconds IS NOT NULL
+                ORDER BY qualifying.qualifyId ASC;""",
+            (START_YEAR,)
         )
         result = cursor.fetchall()
         cursor.close()
@@ -838,12 +1192,11 @@ class Database:
             AND qualifying.driverId=results.driverId
             WHERE raceTrained is FALSE AND evaluationRace is not TRUE
                 AND results.position IS NOT NULL AND results.position <= 20
-                AND races.year >= 2000
+                AND races.year >= %s
                 AND results.grid <= 20
-                AND (qualifying.q1Seconds IS NOT NULL
-                    OR qualifying.q2Seconds IS NOT NULL
-                    OR qualifying.q3Seconds IS NOT NULL)
-            ORDER BY results.resultId ASC;"""
+                AND qualifying.bestSeconds IS NOT NULL
+            ORDER BY results.resultId ASC;""",
+            (START_YEAR,)
         )
         result = cursor.fetchall()
         cursor.close()
@@ -871,12 +1224,11 @@ class Database:
             AND qualifying.driverId=results.driverId
             WHERE raceTrained is FALSE AND evaluationRace is not TRUE
                 AND results.position IS NOT NULL AND results.position <= 20
-                AND races.year >= 2000
+                AND races.year >= %s
                 AND results.grid <= 20
-                AND (qualifying.q1Seconds IS NOT NULL
-                    OR qualifying.q2Seconds IS NOT NULL
-                    OR qualifying.q3Seconds IS NOT NULL)
-            ORDER BY results.resultId ASC;"""
+                AND qualifying.bestSeconds IS NOT NULL
+            ORDER BY results.resultId ASC;""",
+            (START_YEAR,)
         )
         result = cursor.fetchall()
         cursor.close()
@@ -904,12 +1256,11 @@ class Database:
             AND qualifying.driverId=results.driverId
             WHERE raceTrained is FALSE AND evaluationRace is not TRUE
                 AND results.position IS NOT NULL AND results.position <= 20
-                AND races.year >= 2000
+                AND races.year >= %s
                 AND results.grid <= 20
-                AND (qualifying.q1Seconds IS NOT NULL
-                    OR qualifying.q2Seconds IS NOT NULL
-                    OR qualifying.q3Seconds IS NOT NULL)
-            ORDER BY results.resultId ASC;"""
+                AND qualifying.bestSeconds IS NOT NULL
+            ORDER BY results.resultId ASC;""",
+            (START_YEAR,)
         )
         result = cursor.fetchall()
         cursor.close()
@@ -940,12 +1291,11 @@ class Database:
             AND qualifying.driverId=results.driverId
             WHERE raceTrained is FALSE AND evaluationRace is not TRUE
                 AND results.position IS NOT NULL AND results.position <= 20
-                AND races.year >= 2000
+                AND races.year >= %s
                 AND results.grid <= 20
-                AND (qualifying.q1Seconds IS NOT NULL
-                    OR qualifying.q2Seconds IS NOT NULL
-                    OR qualifying.q3Seconds IS NOT NULL)
-            ORDER BY results.resultId ASC;"""
+                AND qualifying.bestSeconds IS NOT NULL
+            ORDER BY results.resultId ASC;""",
+            (START_YEAR,)
         )
         result = cursor.fetchall()
         cursor.close()
@@ -959,21 +1309,11 @@ class Database:
                 (SELECT AVG(delta)
                     FROM
                         (SELECT
-                            (NULLIF((LEAST(IFNULL(qualifying1.q1Seconds, ~0),
-                            IFNULL(qualifying1.q2Seconds, ~0),
-                            IFNULL(qualifying1.q3Seconds, ~0))), ~0)
-                            -((SELECT MIN(LEAST(IFNULL(qualifying2.q1Seconds, ~0),
-                                IFNULL(qualifying2.q2Seconds, ~0),
-                                IFNULL(qualifying2.q3Seconds, ~0)))
-                                    FROM qualifying qualifying2
-                                    WHERE qualifying2.raceId = qualifying1.raceId)))
-                                as delta
+                            qualifying1.deltaToPole as delta
                             FROM qualifying qualifying1
                             WHERE qualifying1.raceId < qualifying.raceId
                             AND qualifying.constructorId = qualifying1.constructorId
-                            AND (qualifying1.q1Seconds IS NOT NULL
-                                OR qualifying1.q2Seconds IS NOT NULL
-                                OR qualifying1.q3Seconds IS NOT NULL)
+                            AND qualifying1.bestSeconds IS NOT NULL
                             ORDER BY qualifyId DESC
                             LIMIT 6)
                             results2)
@@ -981,10 +1321,10 @@ class Database:
             FROM races
             INNER JOIN qualifying ON qualifying.raceId=races.raceId
             WHERE qualifyingTrained is FALSE AND evaluationRace is not TRUE
-            AND races.year >= 2000
-            AND (qualifying.q1Seconds IS NOT NULL OR qualifying.q2Seconds IS NOT NULL
-                OR qualifying.q3Seconds IS NOT NULL)
-            ORDER BY qualifying.qualifyId ASC;"""
+            AND races.year >= %s
+            AND qualifying.bestSeconds IS NOT NULL
+            ORDER BY qualifying.qualifyId ASC;""",
+            (START_YEAR,)
         )
         result = cursor.fetchall()
         cursor.close()
@@ -998,22 +1338,12 @@ class Database:
                 (SELECT AVG(delta)
                     FROM
                         (SELECT
-                            (NULLIF((LEAST(IFNULL(qualifying1.q1Seconds, ~0),
-                            IFNULL(qualifying1.q2Seconds, ~0),
-                            IFNULL(qualifying1.q3Seconds, ~0))), ~0)
-                            -((SELECT MIN(LEAST(IFNULL(qualifying2.q1Seconds, ~0),
-                                IFNULL(qualifying2.q2Seconds, ~0),
-                                IFNULL(qualifying2.q3Seconds, ~0)))
-                                    FROM qualifying qualifying2
-                                    WHERE qualifying2.raceId = qualifying1.raceId)))
-                                as delta
+                            qualifying1.deltaToPole as delta
                             FROM qualifying qualifying1
                             INNER JOIN races races1 ON qualifying1.raceId = races1.raceId
                             WHERE qualifying1.raceId < qualifying.raceId
                             AND qualifying.constructorId = qualifying1.constructorId
-                            AND (qualifying1.q1Seconds IS NOT NULL
-                                OR qualifying1.q2Seconds IS NOT NULL
-                                OR qualifying1.q3Seconds IS NOT NULL)
+                            AND qualifying1.bestSeconds IS NOT NULL
                             AND races.circuitId=races1.circuitId
                             ORDER BY qualifyId DESC
                             LIMIT 6)
@@ -1022,10 +1352,10 @@ class Database:
             FROM races
             INNER JOIN qualifying ON qualifying.raceId=races.raceId
             WHERE qualifyingTrained is FALSE AND evaluationRace is not TRUE
-            AND races.year >= 2000
-            AND (qualifying.q1Seconds IS NOT NULL OR qualifying.q2Seconds IS NOT NULL
-                OR qualifying.q3Seconds IS NOT NULL)
-            ORDER BY qualifying.qualifyId ASC;"""
+            AND races.year >= %s
+            AND qualifying.bestSeconds IS NOT NULL
+            ORDER BY qualifying.qualifyId ASC;""",
+            (START_YEAR,)
         )
         result = cursor.fetchall()
         cursor.close()
@@ -1074,7 +1404,8 @@ class Database:
                 INNER JOIN circuits ON circuits.circuitId = races.circuitId
                 WHERE year = %s
                 ORDER BY races.round ASC;""",
-            (year,)
+            (year,),
+            prepared=True
         )
         result = cursor.fetchall()
         cursor.close()
@@ -1082,7 +1413,7 @@ class Database:
 
     def get_last_race_id(self):
         """ Gets the last race with a result. """
-        cursor = self.query("SELECT MAX(raceId) FROM results;")
+        cursor = self.query("SELECT MAX(raceId) FROM results;", prepared=True)
         result = cursor.fetchone()[0]
         cursor.close()
         return result
@@ -1096,7 +1427,8 @@ class Database:
                 FROM results
                 INNER JOIN races ON races.raceId=results.raceId
                 WHERE races.year = %s;""",
-            (year,)
+            (year,),
+            prepared=True
         )
         result = cursor.fetchone()[0]
         cursor.close()
@@ -1115,7 +1447,8 @@ class Database:
                 INNER JOIN drivers ON drivers.driverId=driverStandings.driverId
                 WHERE raceId = %s
                 ORDER BY position ASC;""",
-            (race,)
+            (race,),
+            prepared=True
         )
         result = cursor.fetchall()
         cursor.close()
@@ -1139,7 +1472,8 @@ class Database:
                     ON constructors.constructorId=constructorStandings.constructorId
                 WHERE raceId = %s
                 ORDER BY position ASC;""",
-            (race,)
+            (race,),
+            prepared=True
         )
         result = cursor.fetchall()
         cursor.close()
@@ -1168,7 +1502,8 @@ class Database:
                 INNER JOIN drivers ON drivers.driverId=results.driverId
                 WHERE raceId = %s
                 ORDER BY -position DESC;""",
-            (race,)
+            (race,),
+            prepared=True
         )
         result = cursor.fetchall()
         cursor.close()
@@ -1176,7 +1511,7 @@ class Database:
 
     def get_last_qualifying_race_id(self):
         """ Gets the raceId of the last qualifying session. """
-        cursor = self.query("SELECT MAX(raceId) FROM qualifying;")
+        cursor = self.query("SELECT MAX(raceId) FROM qualifying;", prepared=True)
         result = cursor.fetchone()[0]
         cursor.close()
         return result
@@ -1204,7 +1539,8 @@ class Database:
                 INNER JOIN drivers ON drivers.driverId=qualifying.driverId
                 WHERE raceId = %s
                 ORDER BY -position DESC;""",
-            (race,)
+            (race,),
+            prepared=True
         )
         result = cursor.fetchall()
         cursor.close()
@@ -1226,7 +1562,6 @@ class Database:
                 time, feature_string, qualifying_predicted
             )
         )
-        self.database.commit()
         result = cursor.rowcount
         cursor.close()
         return result
@@ -1241,7 +1576,9 @@ class Database:
                 WHERE raceId = %s AND time >= (NOW() - INTERVAL 2 WEEK)
                 AND qualifyingPredicted = %s
                 ORDER BY position ASC;""",
-            (race_id, qualifying_predicted,))
+            (race_id, qualifying_predicted,),
+            prepared=True
+        )
         result = cursor.fetchall()
         cursor.close()
         return result
@@ -1261,7 +1598,6 @@ class Database:
                 feature_hash, time, delta, feature_string
             )
         )
-        self.database.commit()
         result = cursor.rowcount
         cursor.close()
         return result
@@ -1281,7 +1617,8 @@ class Database:
                 constructors.constructorId=qualifyingPredictionLog.constructorId
                 WHERE raceId = %s AND time >= (NOW() - INTERVAL 2 WEEK)
                 ORDER BY position ASC;""",
-            (race_id,)
+            (race_id,),
+            prepared=True
         )
         result = cursor.fetchall()
         cursor.close()
@@ -1314,7 +1651,6 @@ class Database:
                     VALUES (%s, %s, %s, %s, %s, %s);""",
             (race_id, driver_id, points, position, position_text, wins)
         )
-        self.database.commit()
         result = cursor.rowcount
         cursor.close()
         return result
@@ -1351,7 +1687,6 @@ class Database:
                 position_text, wins
             )
         )
-        self.database.commit()
         result = cursor.rowcount
         cursor.close()
         return result
@@ -1405,7 +1740,8 @@ class Database:
                     FROM races races1
                     WHERE races1.raceId < %s);
             """,
-            (race,)
+            (race,),
+            prepared=True
         )
         result = cursor.fetchall()
         cursor.close()
@@ -1433,7 +1769,8 @@ class Database:
                     FROM races races1
                     WHERE races1.raceId < %s);
             """,
-            (race,)
+            (race,),
+            prepared=True
         )
         result = cursor.fetchall()
         cursor.close()
@@ -1465,7 +1802,8 @@ class Database:
                     FROM races races1
                     WHERE races1.raceId < %s);
             """,
-            (race, race)
+            (race, race),
+            prepared=True
         )
         result = cursor.fetchall()
         cursor.close()
@@ -1497,7 +1835,8 @@ class Database:
                     FROM races races1
                     WHERE races1.raceId < %s);
             """,
-            (race, race)
+            (race, race),
+            prepared=True
         )
         result = cursor.fetchall()
         cursor.close()
@@ -1519,7 +1858,8 @@ class Database:
                         FROM races
                         WHERE raceId < %s);
             """,
-            (race,)
+            (race,),
+            prepared=True
         )
         result = cursor.fetchall()
         cursor.close()
@@ -1548,7 +1888,8 @@ class Database:
                     FROM races races1
                     WHERE races1.raceId < %s);
             """,
-            (race,)
+            (race,),
+            prepared=True
         )
         result = cursor.fetchall()
         cursor.close()
@@ -1576,7 +1917,8 @@ class Database:
                     FROM races races1
                     WHERE races1.raceId < %s);
             """,
-            (race,)
+            (race,),
+            prepared=True
         )
         result = cursor.fetchall()
         cursor.close()
@@ -1593,21 +1935,11 @@ class Database:
                 (SELECT AVG(delta)
                     FROM
                         (SELECT
-                            (NULLIF((LEAST(IFNULL(qualifying1.q1Seconds, ~0),
-                            IFNULL(qualifying1.q2Seconds, ~0),
-                            IFNULL(qualifying1.q3Seconds, ~0))), ~0)
-                            -((SELECT MIN(LEAST(IFNULL(qualifying2.q1Seconds, ~0),
-                                IFNULL(qualifying2.q2Seconds, ~0),
-                                IFNULL(qualifying2.q3Seconds, ~0)))
-                                    FROM qualifying qualifying2
-                                    WHERE qualifying2.raceId = qualifying1.raceId)))
-                                as delta
+                            qualifying1.deltaToPole as delta
                             FROM qualifying qualifying1
                             WHERE qualifying1.raceId <= qualifying.raceId
                             AND qualifying.driverId = qualifying1.driverId
-                            AND (qualifying1.q1Seconds IS NOT NULL
-                                OR qualifying1.q2Seconds IS NOT NULL
-                                OR qualifying1.q3Seconds IS NOT NULL)
+                            AND qualifying1.bestSeconds IS NOT NULL
                             ORDER BY qualifyId DESC
                             LIMIT 3)
                             results2)
@@ -1619,7 +1951,8 @@ class Database:
                 SELECT MAX(raceId)
                 FROM qualifying
                 WHERE raceId < %s);""",
-            (race_id,)
+            (race_id,),
+            prepared=True
         )
         result = cursor.fetchall()
         cursor.close()
@@ -1634,22 +1967,12 @@ class Database:
                 (SELECT AVG(delta)
                     FROM
                         (SELECT
-                            (NULLIF((LEAST(IFNULL(qualifying1.q1Seconds, ~0),
-                            IFNULL(qualifying1.q2Seconds, ~0),
-                            IFNULL(qualifying1.q3Seconds, ~0))), ~0)
-                            -((SELECT MIN(LEAST(IFNULL(qualifying2.q1Seconds, ~0),
-                                IFNULL(qualifying2.q2Seconds, ~0),
-                                IFNULL(qualifying2.q3Seconds, ~0)))
-                                    FROM qualifying qualifying2
-                                    WHERE qualifying2.raceId = qualifying1.raceId)))
-                                as delta
+                            qualifying1.deltaToPole as delta
                             FROM qualifying qualifying1
                             INNER JOIN races ON qualifying1.raceId=races.raceId
                             WHERE qualifying1.raceId <= qualifying.raceId
                             AND qualifying.driverId = qualifying1.driverId
-                            AND (qualifying1.q1Seconds IS NOT NULL
-                                OR qualifying1.q2Seconds IS NOT NULL
-                                OR qualifying1.q3Seconds IS NOT NULL)
+                            AND qualifying1.bestSeconds IS NOT NULL
                             AND races.circuitId = (SELECT circuitId
                                 FROM races WHERE raceId = %s)
                             ORDER BY qualifyId DESC
@@ -1661,7 +1984,8 @@ class Database:
                 SELECT MAX(raceId)
                 FROM qualifying
                 WHERE raceId < %s);""",
-            (race_id, race_id,)
+            (race_id, race_id,),
+            prepared=True
         )
         result = cursor.fetchall()
         cursor.close()
@@ -1683,7 +2007,8 @@ class Database:
                         FROM races
                         WHERE raceId < %s);
             """,
-            (race,)
+            (race,),
+            prepared=True
         )
         result = cursor.fetchall()
         cursor.close()
@@ -1698,21 +2023,11 @@ class Database:
                 (SELECT AVG(delta)
                     FROM
                         (SELECT
-                            (NULLIF((LEAST(IFNULL(qualifying1.q1Seconds, ~0),
-                            IFNULL(qualifying1.q2Seconds, ~0),
-                            IFNULL(qualifying1.q3Seconds, ~0))), ~0)
-                            -((SELECT MIN(LEAST(IFNULL(qualifying2.q1Seconds, ~0),
-                                IFNULL(qualifying2.q2Seconds, ~0),
-                                IFNULL(qualifying2.q3Seconds, ~0)))
-                                    FROM qualifying qualifying2
-                                    WHERE qualifying2.raceId = qualifying1.raceId)))
-                                as delta
+                            qualifying1.deltaToPole as delta
                             FROM qualifying qualifying1
                             WHERE qualifying1.raceId <= qualifying.raceId
                             AND qualifying.constructorId = qualifying1.constructorId
-                            AND (qualifying1.q1Seconds IS NOT NULL
-                                OR qualifying1.q2Seconds IS NOT NULL
-                                OR qualifying1.q3Seconds IS NOT NULL)
+                            AND qualifying1.bestSeconds IS NOT NULL
                             ORDER BY qualifyId DESC
                             LIMIT 6)
                             results2)
@@ -1722,7 +2037,8 @@ class Database:
                 SELECT MAX(raceId)
                 FROM qualifying
                 WHERE raceId < %s);""",
-            (race_id,)
+            (race_id,),
+            prepared=True
         )
         result = cursor.fetchall()
         cursor.close()
@@ -1737,22 +2053,12 @@ class Database:
                 (SELECT AVG(delta)
                     FROM
                         (SELECT
-                            (NULLIF((LEAST(IFNULL(qualifying1.q1Seconds, ~0),
-                            IFNULL(qualifying1.q2Seconds, ~0),
-                            IFNULL(qualifying1.q3Seconds, ~0))), ~0)
-                            -((SELECT MIN(LEAST(IFNULL(qualifying2.q1Seconds, ~0),
-                                IFNULL(qualifying2.q2Seconds, ~0),
-                                IFNULL(qualifying2.q3Seconds, ~0)))
-                                    FROM qualifying qualifying2
-                                    WHERE qualifying2.raceId = qualifying1.raceId)))
-                                as delta
+                            qualifying1.deltaToPole as delta
                             FROM qualifying qualifying1
                             INNER JOIN races ON qualifying1.raceId=races.raceId
                             WHERE qualifying1.raceId <= qualifying.raceId
                             AND qualifying.constructorId = qualifying1.constructorId
-                            AND (qualifying1.q1Seconds IS NOT NULL
-                                OR qualifying1.q2Seconds IS NOT NULL
-                                OR qualifying1.q3Seconds IS NOT NULL)
+                            AND qualifying1.bestSeconds IS NOT NULL
                             AND races.circuitId = (SELECT circuitId
                                 FROM races WHERE raceId = %s)
                             ORDER BY qualifyId DESC
@@ -1764,8 +2070,215 @@ class Database:
                 SELECT MAX(raceId)
                 FROM qualifying
                 WHERE raceId < %s);""",
-            (race_id, race_id,)
+            (race_id, race_id,),
+            prepared=True
         )
         result = cursor.fetchall()
         cursor.close()
         return result
+
+    def get_race_ids_after(self, race_id):
+        """ Gets the IDs of all races following the given race. """
+        cursor = self.query(
+            "SELECT raceId FROM races WHERE raceId > %s ORDER BY raceId ASC;",
+            (race_id,)
+        )
+        result = [row[0] for row in cursor.fetchall()]
+        cursor.close()
+        return result
+
+    def get_next_race_id(self, race_id):
+        """ Gets the ID of the race following the given race, if any. """
+        cursor = self.query("SELECT MIN(raceId) FROM races WHERE raceId > %s;", (race_id,))
+        result = cursor.fetchone()[0]
+        cursor.close()
+        return result
+
+    def delete_features_after(self, race_id):
+        """ Deletes the materialized features of every race following the given race. """
+        cursor = self.query("DELETE FROM raceFeatures WHERE raceId > %s;", (race_id,))
+        result = cursor.rowcount
+        cursor.close()
+        cursor = self.query("DELETE FROM qualifyingFeatures WHERE raceId > %s;", (race_id,))
+        result += cursor.rowcount
+        cursor.close()
+        return result
+
+    def replace_race_features(self, race_id, features):
+        """ Replaces the materialized race features for the given race. The rows
+            are replaced in one transaction, so readers never see the race
+            without features, and a failed insert keeps the old rows. """
+        with self.transaction():
+            cursor = self.query("DELETE FROM raceFeatures WHERE raceId = %s;", (race_id,))
+            cursor.close()
+            if len(features) == 0:
+                return 0
+            cursor = self.query(
+                """
+                    INSERT INTO raceFeatures
+                        (raceId, driverId, averageForm, circuitAverageForm, championshipStanding,
+                        positionChanges, averageFormTeam, circuitAverageFormTeam,
+                        positionChangesTeam)
+                        VALUES """
+                + ','.join(['(%s, %s, %s, %s, %s, %s, %s, %s, %s)'] * len(features)),
+                tuple(value for row in features for value in (race_id,) + tuple(row))
+            )
+            result = cursor.rowcount
+            cursor.close()
+        return result
+
+    def get_race_features(self, race_id):
+        """ Fetches the materialized features of each driver for the given race. """
+        cursor = self.query(
+            """
+                SELECT
+                    driverId,
+                    averageForm,
+                    circuitAverageForm,
+                    championshipStanding,
+                    positionChanges,
+                    averageFormTeam,
+                    circuitAverageFormTeam,
+                    positionChangesTeam
+                FROM raceFeatures
+                WHERE raceId = %s;""",
+            (race_id,),
+            prepared=True
+        )
+        result = cursor.fetchall()
+        cursor.close()
+        return result
+
+    def replace_qualifying_features(self, race_id, features):
+        """ Replaces the materialized qualifying features for the given race. The rows
+            are replaced in one transaction, so readers never see the race
+            without features, and a failed insert keeps the old rows. """
+        with self.transaction():
+            cursor = self.query("DELETE FROM qualifyingFeatures WHERE raceId = %s;", (race_id,))
+            cursor.close()
+            if len(features) == 0:
+                return 0
+            cursor = self.query(
+                """
+                    INSERT INTO qualifyingFeatures
+                        (raceId, driverId, constructorId, averageForm, circuitAverageForm,
+                        championshipStanding, averageFormTeam, circuitAverageFormTeam)
+                        VALUES """ + ','.join(['(%s, %s, %s, %s, %s, %s, %s, %s)'] * len(features)),
+                tuple(value for row in features for value in (race_id,) + tuple(row))
+            )
+            result = cursor.rowcount
+            cursor.close()
+        return result
+
+    def get_qualifying_features(self, race_id):
+        """ Fetches driver info along with the materialized qualifying
+            features of each driver for the given race. """
+        cursor = self.query(
+            """
+                SELECT
+                    drivers.*,
+                    constructors.constructorRef,
+                    constructors.constructorId,
+                    qualifyingFeatures.averageForm,
+                    qualifyingFeatures.circuitAverageForm,
+                    qualifyingFeatures.championshipStanding,
+                    qualifyingFeatures.averageFormTeam,
+                    qualifyingFeatures.circuitAverageFormTeam
+                FROM qualifyingFeatures
+                INNER JOIN drivers ON drivers.driverId = qualifyingFeatures.driverId
+                INNER JOIN constructors
+                    ON constructors.constructorId = qualifyingFeatures.constructorId
+                WHERE qualifyingFeatures.raceId = %s;""",
+            (race_id,),
+            prepared=True
+        )
+        result = cursor.fetchall()
+        cursor.close()
+        return result
+
+    def get_races_by_ids(self, race_ids):
+        """ Gets the names and years of the given races. """
+        cursor = self.query(
+            """
+                SELECT raceId, REPLACE(LOWER(name), ' grand prix', ''), year
+                FROM races
+                WHERE raceId IN (""" + create_list_query(race_ids) + """);""",
+            tuple(race_ids)
+        )
+        result = cursor.fetchall()
+        cursor.close()
+        return result
+
+    def get_qualifying_results_with_driver_for_races(self, race_ids):
+        """ Gets driver info as well as qualifying delta result for the given races,
+            with the race ID in the first column. """
+        cursor = self.query(
+            """
+                SELECT
+                    qualifying.raceId,
+                    drivers.*,
+                    constructors.constructorRef,
+                    qualifying.position,
+                    qualifying.deltaToPole
+                FROM qualifying
+                INNER JOIN drivers ON qualifying.driverId=drivers.driverId
+                INNER JOIN constructors ON qualifying.constructorId=constructors.constructorId
+                WHERE raceId IN (""" + create_list_query(race_ids) + """)
+                ORDER BY qualifying.qualifyId ASC;""",
+            tuple(race_ids)
+        )
+        result = cursor.fetchall()
+        cursor.close()
+        return result
+
+    def get_race_features_for_races(self, race_ids):
+        """ Fetches the materialized features of each driver for the given
+            races, with the race ID in the first column. """
+        cursor = self.query(
+            """
+                SELECT
+                    raceId,
+                    driverId,
+                    averageForm,
+                    circuitAverageForm,
+                    championshipStanding,
+                    positionChanges,
+                    averageFormTeam,
+                    circuitAverageFormTeam,
+                    positionChangesTeam
+                FROM raceFeatures
+                WHERE raceId IN (""" + create_list_query(race_ids) + """);""",
+            tuple(race_ids)
+        )
+        result = cursor.fetchall()
+        cursor.close()
+        return result
+
+    def get_qualifying_features_for_races(self, race_ids):
+        """ Fetches driver info along with the materialized qualifying features
+            of each driver for the given races, with the race ID in the first column. """
+        cursor = self.query(
+            """
+                SELECT
+                    qualifyingFeatures.raceId,
+                    drivers.*,
+                    constructors.constructorRef,
+                    constructors.constructorId,
+                    qualifyingFeatures.averageForm,
+                    qualifyingFeatures.circuitAverageForm,
+                    qualifyingFeatures.championshipStanding,
+                    qualifyingFeatures.averageFormTeam,
+                    qualifyingFeatures.circuitAverageFormTeam
+                FROM qualifyingFeatures
+                INNER JOIN drivers ON drivers.driverId = qualifyingFeatures.driverId
+                INNER JOIN constructors
+                    ON constructors.constructorId = qualifyingFeatures.constructorId
+                WHERE qualifyingFeatures.raceId IN (""" + create_list_query(race_ids) + """);""",
+            tuple(race_ids)
+        )
+        result = cursor.fetchall()
+        cursor.close()
+        return result
+
+class WindowDatabase(WindowQueries, Database):
+    """ Database computing the rolling averages with window functions. """
@@ -0,0 +1,277 @@
+""" Pure NumPy inference engine for the exported models, which allows
+    predictions to be served without importing TensorFlow. """
+
+import numpy as np
+
+WEIGHTS_FILE = 'weights.npz'
+
+RACE_NUMERIC_FEATURES = [
+    'qualifying',
+    'average_form',
+    'average_form_team',
+    'circuit_average_form',
+    'circuit_average_form_team',
+    'position_changes',
+    'position_changes_team',
+    'grid',
+    'championship_standing'
+]
+
+QUALIFYING_NUMERIC_FEATURES = [
+    'average_form',
+    'average_form_team',
+    'circuit_average_form',
+    'circuit_average_form_team',
+    'championship_standing'
+]
+
+CATEGORICAL_FEATURES = ['race', 'driver', 'constructor']
+
+HASH_BUCKET_SIZES = {
+    'race': 60,
+    'driver': 1000,
+    'constructor': 300
+}
+
+MASK = 0xffffffffffffffff
+K0 = 0xc3a5c85c97cb3127
+K1 = 0xb492b66fbe98f273
+K2 = 0x9ae16a3b2f90404f
+
+def fetch64(data, index):
+    """ Reads a little endian 64 bit integer. """
+    return int.from_bytes(data[index:index + 8], 'little')
+
+def fetch32(data, index):
+    """ Reads a little endian 32 bit integer. """
+    return int.from_bytes(data[index:index + 4], 'little')
+
+def rotate(value, shift):
+    """ Rotates a 64 bit integer right by the given shift. """
+    return ((value >> shift) | (value << (64 - shift))) & MASK
+
+def shift_mix(value):
+    """ Mixes the high bits of the value into the low bits. """
+    return value ^ (value >> 47)
+
+def hash_len_16(first, second, mul):
+    """ Hashes two 64 bit integers into one. """
+    a = ((first ^ second) * mul) & MASK
+    a ^= a >> 47
+    b = ((second ^ a) * mul) & MASK
+    b ^= b >> 47
+    return (b * mul) & MASK
+
+def hash_len_0_to_16(data):
+    """ Hashes strings of up to 16 bytes. """
+    length = len(data)
+    if length >= 8:
+        mul = K2 + length * 2
+        a = (fetch64(data, 0) + K2) & MASK
+        b = fetch64(data, length - 8)
+        c = (rotate(b, 37) * mul + a) & MASK
+        d = ((rotate(a, 25) + b) * mul) & MASK
+        return hash_len_16(c, d, mul)
+    if length >= 4:
+        mul = K2 + length * 2
+        a = fetch32(data, 0)
+        return hash_len_16(length + (a << 3), fetch32(data, length - 4), mul)
+    if length > 0:
+        y = data[0] + (data[length >> 1] << 8)
+        z = length + (data[length - 1] << 2)
+        return (shift_mix(((y * K2) ^ (z * K0)) & MASK) * K2) & MASK
+    return K2
+
+def hash_len_17_to_32(data):
+    """ Hashes strings of 17 to 32 bytes. """
+    length = len(data)
+    mul = K2 + length * 2
+    a = (fetch64(data, 0) * K1) & MASK
+    b = fetch64(data, 8)
+    c = (fetch64(data, length - 8) * mul) & MASK
+    d = (fetch64(data, length - 16) * K2) & MASK
+    return hash_len_16(
+        (rotate((a + b) & MASK, 43) + rotate(c, 30) + d) & MASK,
+        (a + rotate((b + K2) & MASK, 18) + c) & MASK,
+        mul
+    )
+
+def hash_len_33_to_64(data):
+    """ Hashes strings of 33 to 64 bytes. """
+    length = len(data)
+    mul = K2 + length * 2
+    a = (fetch64(data, 0) * K2) & MASK
+    b = fetch64(data, 8)
+    c = (fetch64(data, length - 8) * mul) & MASK
+    d = (fetch64(data, length - 16) * K2) & MASK
+    y = (rotate((a + b) & MASK, 43) + rotate(c, 30) + d) & MASK
+    z = hash_len_16(y, (a + rotate((b + K2) & MASK, 18) + c) & MASK, mul)
+    e = (fetch64(data, 16) * mul) & MASK
+    f = fetch64(data, 24)
+    g = ((y + fetch64(data, length - 32)) * mul) & MASK
+    h = ((z + fetch64(data, length - 24)) * mul) & MASK
+    return hash_len_16(
+        (rotate((e + f) & MASK, 43) + rotate(g, 30) + h) & MASK,
+        (e + rotate((f + a) & MASK, 18) + g) & MASK,
+        mul
+    )
+
+def weak_hash_len_32_with_seeds(data, index, a, b):
+    """ Hashes 32 bytes from the given index with two seeds. """
+    w = fetch64(data, index)
+    x = fetch64(data, index + 8)
+    y = fetch64(data, index + 16)
+    z = fetch64(data, index + 24)
+    a = (a + w) & MASK
+    b = rotate((b + a + z) & MASK, 21)
+    c = a
+    a = (a + x + y) & MASK
+    b = (b + rotate(a, 44)) & MASK
+    return (a + z) & MASK, (b + c) & MASK
+
+def fingerprint64(data):
+    """ Computes the FarmHash Fingerprint64 of the given bytes, as used by
+        TensorFlow to assign strings to hash buckets. """
+    length = len(data)
+    if length <= 16:
+        return hash_len_0_to_16(data)
+    if length <= 32:
+        return hash_len_17_to_32(data)
+    if length <= 64:
+        return hash_len_33_to_64(data)
+
+    seed = 81
+    x = seed
+    y = (seed * K1 + 113) & MASK
+    z = (shift_mix((y * K2 + 113) & MASK) * K2) & MASK
+    v = (0, 0)
+    w = (0, 0)
+    x = (x * K2 + fetch64(data, 0)) & MASK
+
+    index = 0
+    end = ((length - 1) // 64) * 64
+    last64 = end + ((length - 1) & 63) - 63
+    while True:
+        x = (rotate((x + y + v[0] + fetch64(data, index + 8)) & MASK, 37) * K1) & MASK
+        y = (rotate((y + v[1] + fetch64(data, index + 48)) & MASK, 42) * K1) & MASK
+        x ^= w[1]
+        y = (y + v[0] + fetch64(data, index + 40)) & MASK
+        z = (rotate((z + w[0]) & MASK, 33) * K1) & MASK
+        v = weak_hash_len_32_with_seeds(data, index, (v[1] * K1) & MASK, (x + w[0]) & MASK)
+        w = weak_hash_len_32_with_seeds(
+            data, index + 32, (z + w[1]) & MASK, (y + fetch64(data, index + 16)) & MASK
+        )
+        z, x = x, z
+        index += 64
+        if index == end:
+            break
+
+    mul = K1 + ((z & 0xff) << 1)
+    index = last64
+    w = ((w[0] + ((length - 1) & 63)) & MASK, w[1])
+    v = ((v[0] + w[0]) & MASK, v[1])
+    w = ((w[0] + v[0]) & MASK, w[1])
+    x = (rotate((x + y + v[0] + fetch64(data, index + 8)) & MASK, 37) * mul) & MASK
+    y = (rotate((y + v[1] + fetch64(data, index + 48)) & MASK, 42) * mul) & MASK
+    x ^= (w[1] * 9) & MASK
+    y = (y + v[0] * 9 + fetch64(data, index + 40)) & MASK
+    z = (rotate((z + w[0]) & MASK, 33) * mul) & MASK
+    v = weak_hash_len_32_with_seeds(data, index, (v[1] * mul) & MASK, (x + w[0]) & MASK)
+    w = weak_hash_len_32_with_seeds(
+        data, index + 32, (z + w[1]) & MASK, (y + fetch64(data, index + 16)) & MASK
+    )
+    z, x = x, z
+    return hash_len_16(
+        (hash_len_16(v[0], w[0], mul) + shift_mix(y) * K0 + z) & MASK,
+        (hash_len_16(v[1], w[1], mul) + x) & MASK,
+        mul
+    )
+
+def hash_bucket(value, hash_bucket_size):
+    """ Returns the bucket TensorFlow's categorical_column_with_hash_bucket
+        would assign the value to. """
+    if isinstance(value, bytes):
+        data = value
+    else:
+        data = str(value).encode('utf-8')
+    return fingerprint64(data) % hash_bucket_size
+
+def input_layout(numeric_features):
+    """ Returns the (column name, feature, width, hashed) layout of the input
+        layer. TensorFlow concatenates the columns sorted by column name. """
+    columns = [(key, key, 1, False) for key in numeric_features]
+    columns.extend([
+        (key + '_indicator', key, HASH_BUCKET_SIZES[key], True)
+        for key in CATEGORICAL_FEATURES
+    ])
+    return sorted(columns, key=lambda column: column[0])
+
+class NumpyModel:
+    """ Forward pass of an exported DNNClassifier or DNNRegressor, returning
+        the same outputs as the TensorFlow predictor. """
+
+    def __init__(self, path):
+        """ Constructor, loading the exported weights from the given path. """
+        with np.load(path) as weights:
+            self.head = str(weights['head'])
+            self.version = str(weights['version'])
+            self.input_features = [str(key) for key in weights['input_features']]
+            self.input_sizes = [int(size) for size in weights['input_sizes']]
+            self.input_hashed = [bool(hashed) for hashed in weights['input_hashed']]
+            self.kernels = [
+                weights['hidden_kernel_%i' % index]
+                for index in range(int(weights['hidden_layers']))
+            ] + [weights['logits_kernel']]
+            self.biases = [
+                weights['hidden_bias_%i' % index]
+                for index in range(int(weights['hidden_layers']))
+            ] + [weights['logits_bias']]
+        self.offsets = np.cumsum([0] + self.input_sizes[:-1]).tolist()
+        self.buckets = {}
+
+    def bucket(self, value, hash_bucket_size):
+        """ Returns the hash bucket of the value, caching the result. """
+        key = (value, hash_bucket_size)
+        if key not in self.buckets:
+            self.buckets[key] = hash_bucket(value, hash_bucket_size)
+        return self.buckets[key]
+
+    def first_layer(self, features):
+        """ Computes the first hidden layer, gathering kernel rows for the
+            indicator columns instead of multiplying by one-hot vectors. """
+        kernel = self.kernels[0]
+        number_of_rows = len(features[self.input_features[0]])
+        result = np.tile(self.biases[0], (number_of_rows, 1))
+        for feature, offset, size, hashed in zip(
+                self.input_features, self.offsets, self.input_sizes, self.input_hashed):
+            values = features[feature]
+            if hashed:
+                # Empty strings are dropped by TensorFlow, giving an all zero indicator
+                rows = [
+                    (index, offset + self.bucket(str(value), size))
+                    for index, value in enumerate(values)
+                    if str(value) != ''
+                ]
+                for index, row in rows:
+                    result[index] += kernel[row]
+            else:
+                result += np.outer(np.asarray(values, dtype=np.float32), kernel[offset])
+        return result
+
+    def __call__(self, features):
+        """ Runs the forward pass, returning a dictionary of batched outputs. """
+        layer = np.maximum(self.first_layer(features), 0)
+        for kernel, bias in zip(self.kernels[1:-1], self.biases[1:-1]):
+            layer = np.maximum(np.matmul(layer, kernel) + bias, 0)
+        logits = np.matmul(layer, self.kernels[-1]) + self.biases[-1]
+
+        if self.head == 'regressor':
+            return {'predictions': logits, 'logits': logits}
+
+        exponentials = np.exp(logits - np.max(logits, axis=1, keepdims=True))
+        probabilities = exponentials / np.sum(exponentials, axis=1, keepdims=True)
+        return {
+            'probabilities': probabilities,
+            'logits': logits,
+            'class_ids': np.argmax(logits, axis=1).reshape(-1, 1)
+        }
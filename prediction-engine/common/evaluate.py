@@ -1,37 +1,51 @@
 """ Module containing function for evaluating the network accuracy """
 
+import math
+import logging
+import multiprocessing
 from scipy.stats import spearmanr
 from .db import Database
-from .race import predict as race_predict
-from .qualifying import predict as qualifying_predict
+from .race import predict_many as race_predict_many
+from .qualifying import predict_many as qualifying_predict_many
 from .utils import tuples_to_dictionary
 
 db = Database.get_database()
 
-def evaluate(race=True, races=None, override_predictions=None):
-    """ Computes the evaluation figures for the network. These
-        are % winners correct, % podiums correct, % podiums correct
-        (any order), % positions correct, Spearman's Correlation Rank
-        Coefficient. """
-    winners_correct = 0
-    podium_correct = 0
-    podium_any_order_correct = 0
-    num_races = 0
-    total_correct_positions = 0
-    total_positions = 0
-    all_coef = []
-
-    # If not passed a list of races, use races marked as evaluationRaces.
-    if races:
-        evaluation_races = races
-    else:
-        evaluation_races = [
-            evaluation_race[0]
-            for evaluation_race in db.get_evaluation_races()
-        ]
+def race_metrics(actual_ranking):
+    """ Computes the metrics of a single race from the actual positions of the
+        drivers in predicted order. These are the Spearman's Correlation Rank
+        Coefficient, whether the winner, podium and podium (any order) are
+        correct, the number of correct positions and the number of positions. """
+    system_ranking = list(range(1, len(actual_ranking) + 1))
+
+    coef, _ = spearmanr(actual_ranking, system_ranking)
+
+    correct_positions = 0
+    for position in system_ranking:
+        if actual_ranking[position - 1] == position:
+            correct_positions += 1
+
+    return (
+        coef,
+        actual_ranking[0] == system_ranking[0],
+        actual_ranking[0:3] == system_ranking[0:3],
+        sorted(actual_ranking[0:3]) == sorted(system_ranking[0:3]),
+        correct_positions,
+        len(system_ranking)
+    )
+
+def evaluate_races(race, evaluation_races, override_predictions=None):
+    """ Returns the metrics of each of the given races, in the same order. """
+    # Predict every race in a single batch, unless using the override
+    if not override_predictions:
+        if race:
+            predicted_results = race_predict_many(evaluation_races, load_model=False)
+        else:
+            predicted_results = qualifying_predict_many(evaluation_races, load_model=False)
 
-    # Iterate through races, calling prediction function (or using override)
+    # Iterate through races, using the predictions (or override)
     # and comparing with the actual result in the database.
+    metrics = []
     for race_id in evaluation_races:
         if race:
             actual_result = tuples_to_dictionary(db.get_race_results(race_id))
@@ -53,10 +67,7 @@ def evaluate(race=True, races=None, override_predictions=None):
                     and actual_result[driver][0][position_index] is not None)
             ]
         else:
-            if race:
-                predicted_result = race_predict(race_id, disable_cache=True, load_model=False)[0]
-            else:
-                predicted_result = qualifying_predict(race_id, disable_cache=True, load_model=False)[0]
+            predicted_result = predicted_results[race_id][0]
 
             actual_ranking = [
                 actual_result[driver[0]][0][position_index] for driver in predicted_result
@@ -64,30 +75,62 @@ def evaluate(race=True, races=None, override_predictions=None):
                     and actual_result[driver[0]][0][position_index] is not None)
             ]
 
-        # Update counts for metrics
-        system_ranking = list(range(1, len(actual_ranking) + 1))
-
-        coef, _ = spearmanr(actual_ranking, system_ranking)
-
-        all_coef.append(coef)
-
-        if actual_ranking[0] == system_ranking[0]:
-            winners_correct += 1
-
-        if actual_ranking[0:3] == system_ranking[0:3]:
-            podium_correct += 1
-
-        if sorted(actual_ranking[0:3]) == sorted(system_ranking[0:3]):
-            podium_any_order_correct += 1
+        metrics.append(race_metrics(actual_ranking))
+    return metrics
+
+def evaluate_chunk(arguments):
+    """ Evaluates a chunk of races in a worker process. """
+    race, evaluation_races = arguments
+    return evaluate_races(race, evaluation_races)
+
+def evaluate_parallel(race, evaluation_races, workers):
+    """ Splits the races into one contiguous chunk per worker, and evaluates
+        the chunks in a pool of processes. The metrics are returned in the
+        original race order, so the result matches a serial evaluation. """
+    chunk_size = int(math.ceil(len(evaluation_races) / workers))
+    chunks = [
+        (race, evaluation_races[start:start + chunk_size])
+        for start in range(0, len(evaluation_races), chunk_size)
+    ]
+    logging.info("Evaluating %i races across %i workers", len(evaluation_races), len(chunks))
+
+    # Spawn fresh processes rather than forking, so each worker opens its own
+    # database connection on import and loads its own copy of the model
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(len(chunks)) as pool:
+        results = pool.map(evaluate_chunk, chunks)
+    return [metrics for chunk in results for metrics in chunk]
+
+def evaluate(race=True, races=None, override_predictions=None, workers=1):
+    """ Computes the evaluation figures for the network. These
+        are % winners correct, % podiums correct, % podiums correct
+        (any order), % positions correct, Spearman's Correlation Rank
+        Coefficient. Races are predicted across a pool of processes if
+        more than one worker is given. """
 
-        for position in system_ranking:
-            if actual_ranking[position - 1] == position:
-                total_correct_positions += 1
+    # If not passed a list of races, use races marked as evaluationRaces.
+    if races:
+        evaluation_races = list(races)
+    else:
+        evaluation_races = [
+            evaluation_race[0]
+            for evaluation_race in db.get_evaluation_races()
+        ]
 
-        total_positions += len(system_ranking)
-        num_races += 1
+    if workers > 1 and not override_predictions and len(evaluation_races) > 1:
+        metrics = evaluate_parallel(race, evaluation_races, workers)
+    else:
+        metrics = evaluate_races(race, evaluation_races, override_predictions)
 
     # Calculate final metrics
+    num_races = len(metrics)
+    all_coef = [race_metric[0] for race_metric in metrics]
+    winners_correct = sum(1 for race_metric in metrics if race_metric[1])
+    podium_correct = sum(1 for race_metric in metrics if race_metric[2])
+    podium_any_order_correct = sum(1 for race_metric in metrics if race_metric[3])
+    total_correct_positions = sum(race_metric[4] for race_metric in metrics)
+    total_positions = sum(race_metric[5] for race_metric in metrics)
+
     percentage_winners_correct = round((winners_correct / num_races), 3) * 100
     percentage_podium_correct = round((podium_correct / num_races), 3) * 100
     percentage_podium_any_order_correct = round((podium_any_order_correct / num_races), 3) * 100
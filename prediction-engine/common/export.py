@@ -0,0 +1,59 @@
+""" Exports the trained checkpoints into the compact format read by the
+    NumPy inference engine. """
+
+import os
+import logging
+import numpy as np
+import tensorflow as tf
+from .engine import (WEIGHTS_FILE, RACE_NUMERIC_FEATURES,
+                     QUALIFYING_NUMERIC_FEATURES, input_layout)
+
+def export_model(model_dir, numeric_features, head):
+    """ Writes the dense weights and input layout of the latest
+        checkpoint in the model directory to an npz file. """
+    checkpoint = tf.train.latest_checkpoint(model_dir)
+    if checkpoint is None:
+        raise ValueError('No checkpoint found in ' + model_dir)
+    reader = tf.train.load_checkpoint(checkpoint)
+    layout = input_layout(numeric_features)
+
+    weights = {
+        'head': np.array(head),
+        'version': np.array(os.path.basename(checkpoint)),
+        'input_features': np.array([column[1] for column in layout]),
+        'input_sizes': np.array([column[2] for column in layout]),
+        'input_hashed': np.array([column[3] for column in layout]),
+        'logits_kernel': reader.get_tensor('dnn/logits/kernel'),
+        'logits_bias': reader.get_tensor('dnn/logits/bias')
+    }
+
+    hidden_layers = 0
+    while reader.has_tensor('dnn/hiddenlayer_%i/kernel' % hidden_layers):
+        weights['hidden_kernel_%i' % hidden_layers] = reader.get_tensor(
+            'dnn/hiddenlayer_%i/kernel' % hidden_layers
+        )
+        weights['hidden_bias_%i' % hidden_layers] = reader.get_tensor(
+            'dnn/hiddenlayer_%i/bias' % hidden_layers
+        )
+        hidden_layers += 1
+    weights['hidden_layers'] = np.array(hidden_layers)
+
+    input_width = sum(column[2] for column in layout)
+    if weights['hidden_kernel_0'].shape[0] != input_width:
+        raise ValueError('Checkpoint input layer does not match the feature columns')
+
+    # Write to a temporary file first, so readers never see a partial export
+    path = os.path.join(model_dir, WEIGHTS_FILE)
+    with open(path + '.tmp', 'wb') as weights_file:
+        np.savez_compressed(weights_file, **weights)
+    os.replace(path + '.tmp', path)
+    logging.info('Exported %s to %s', os.path.basename(checkpoint), path)
+    return path
+
+def export_race_model(model_dir):
+    """ Exports the race classifier. """
+    return export_model(model_dir, RACE_NUMERIC_FEATURES, 'classifier')
+
+def export_qualifying_model(model_dir):
+    """ Exports the qualifying regressor. """
+    return export_model(model_dir, QUALIFYING_NUMERIC_FEATURES, 'regressor')
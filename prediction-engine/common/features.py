@@ -0,0 +1,327 @@
+""" Builds the training datasets in memory from a single read of the raw
+    tables. The rolling form features are computed with grouped, vectorized
+    NumPy windows, reproducing the values of the dataset queries in db.py. """
+
+import os
+import numpy as np
+
+# Races before this year are left out of the training sets
+START_YEAR = int(os.getenv('TRAINING_START_YEAR', '2000'))
+MISSING = -1
+
+# MySQL returns AVG() with four more decimal places than its input
+AVERAGE_PRECISION = 4
+
+def column(values, nulls, missing=MISSING):
+    """ Returns a column of integers, replacing NULL with the missing value. """
+    return np.where(nulls, missing, values).astype(np.int64)
+
+def fill_missing(values, defaults):
+    """ Replaces the NaN values with the corresponding defaults. """
+    return np.where(np.isnan(values), defaults, values)
+
+def lookup(keys, values, targets, missing=MISSING):
+    """ Looks up the value for each target in the given keys, which must be unique. """
+    if len(keys) == 0:
+        return np.full(len(targets), missing), np.zeros(len(targets), dtype=bool)
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    positions = np.searchsorted(sorted_keys, targets)
+    positions[positions >= len(sorted_keys)] = 0
+    found = sorted_keys[positions] == targets
+    return np.where(found, values[order][positions], missing), found
+
+def join(left_keys, right_keys):
+    """ Inner joins two key columns, returning the matching index pairs. """
+    order = np.argsort(right_keys, kind='stable')
+    sorted_keys = right_keys[order]
+    lower = np.searchsorted(sorted_keys, left_keys, side='left')
+    upper = np.searchsorted(sorted_keys, left_keys, side='right')
+    counts = upper - lower
+    left_index = np.repeat(np.arange(len(left_keys)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    right_index = order[np.repeat(lower, counts) + offsets]
+    return left_index, right_index
+
+def pair_keys(first, second):
+    """ Combines two integer columns into a single key column. """
+    return first * (int(max(second.max(initial=0), 0)) + 2) + second + 1
+
+def group_keys(*columns):
+    """ Maps each distinct combination of the given columns to a dense integer. """
+    keys = columns[0]
+    for other in columns[1:]:
+        keys = pair_keys(keys, other)
+    return np.unique(keys, return_inverse=True)[1].reshape(-1)
+
+def mysql_average(sums, counts, scale):
+    """ Divides integer sums (at the given decimal scale) by the counts, rounding
+        half away from zero to the precision MySQL returns for AVG(). """
+    increment = 10 ** AVERAGE_PRECISION
+    safe_counts = np.maximum(counts, 1)
+    quotient = (np.abs(sums) * increment * 2 + safe_counts) // (safe_counts * 2)
+    result = np.sign(sums) * quotient / float(10 ** (scale + AVERAGE_PRECISION))
+    return np.where(counts > 0, result, np.nan)
+
+def window_bounds(history_keys, history_races, history_ids, target_keys, target_races, window):
+    """ Finds the last window history rows with the same key as each target from
+        races before the target race, in race then ID order. Returns the sort
+        order of the history along with the start and end of each window.
+        The queries order by ID, which increases with race as rows are inserted
+        race by race by update_database. """
+    order = np.lexsort((history_ids, history_races, history_keys))
+    races = history_races[order]
+    keys = history_keys[order]
+    scale = int(max(races.max(initial=0), target_races.max(initial=0))) + 2
+    composite = keys * scale + races + 1
+    ends = np.searchsorted(composite, target_keys * scale + target_races + 1, side='left')
+    starts = np.searchsorted(composite, target_keys * scale, side='left')
+    counts = np.minimum(ends - starts, window)
+    return order, ends - counts, ends
+
+def rolling_average(history, target_keys, target_races, window, scale=0):
+    """ Averages the last window history values before each target race.
+        The history is a tuple of (keys, races, ids, integer values). """
+    history_keys, history_races, history_ids, history_values = history
+    order, starts, ends = window_bounds(
+        history_keys, history_races, history_ids, target_keys, target_races, window
+    )
+    cumulative = np.concatenate(([0], np.cumsum(history_values[order])))
+    return mysql_average(cumulative[ends] - cumulative[starts], ends - starts, scale)
+
+def last_value(history, target_keys, target_races):
+    """ Returns the last history value before each target race, or NaN. """
+    history_keys, history_races, history_ids, history_values = history
+    order, starts, ends = window_bounds(
+        history_keys, history_races, history_ids, target_keys, target_races, 1
+    )
+    values = history_values[order]
+    result = np.full(len(target_keys), np.nan)
+    found = ends > starts
+    last = values[ends[found] - 1]
+    result[found] = np.where(last != MISSING, last, np.nan)
+    return result
+
+class FeatureEngine:
+    """ Holds the raw tables as columns, and computes the training datasets. """
+
+    def __init__(self, tables):
+        """ Constructor, taking the columns returned by get_training_tables. """
+        (race_ids, race_years, race_circuits, race_names,
+         race_trained, race_qualifying_trained, race_evaluation) = tables['races']
+        self.race_ids = column(*race_ids)
+        self.race_years = column(*race_years)
+        self.race_circuits = column(*race_circuits)
+        self.race_names = race_names[0]
+        self.race_trained = column(*race_trained)
+        self.race_qualifying_trained = column(*race_qualifying_trained)
+        self.race_evaluation = column(*race_evaluation)
+
+        (result_ids, result_races, result_drivers,
+         result_constructors, result_grids, result_positions) = tables['results']
+        self.result_ids = column(*result_ids)
+        self.result_races = column(*result_races)
+        self.result_drivers = column(*result_drivers)
+        self.result_constructors = column(*result_constructors)
+        self.result_grids = column(*result_grids)
+        self.result_positions = column(*result_positions)
+
+        (qualifying_ids, qualifying_races, qualifying_drivers,
+         qualifying_constructors, qualifying_deltas) = tables['qualifying']
+        self.qualifying_ids = column(*qualifying_ids)
+        self.qualifying_races = column(*qualifying_races)
+        self.qualifying_drivers = column(*qualifying_drivers)
+        self.qualifying_constructors = column(*qualifying_constructors)
+        # Deltas are in integer milliseconds
+        self.qualifying_deltas = column(*qualifying_deltas)
+
+        standing_ids, standing_races, standing_drivers, standing_positions = (
+            tables['driverStandings']
+        )
+        self.standing_ids = column(*standing_ids)
+        self.standing_races = column(*standing_races)
+        self.standing_drivers = column(*standing_drivers)
+        self.standing_positions = column(*standing_positions)
+
+        driver_ids, driver_refs = tables['drivers']
+        self.drivers = dict(zip(driver_ids[0].tolist(), driver_refs[0]))
+        constructor_ids, constructor_refs = tables['constructors']
+        self.constructors = dict(zip(constructor_ids[0].tolist(), constructor_refs[0]))
+
+    @staticmethod
+    def load(db):
+        """ Creates the engine from one consistent read of the database. """
+        return FeatureEngine(db.get_training_tables())
+
+    def race_attributes(self, race_ids):
+        """ Looks up the race table index for the given race IDs. """
+        return lookup(self.race_ids, np.arange(len(self.race_ids)), race_ids)
+
+    def result_history(self, keys, window_filter=None):
+        """ Returns results with a position as history rows with the given keys. """
+        mask = self.result_positions != MISSING
+        if window_filter is not None:
+            mask &= window_filter
+        return (keys[mask], self.result_races[mask], self.result_ids[mask], mask)
+
+    def race_dataset(self):
+        """ Returns the columns of the race training set, equivalent to
+            get_race_dataset and the get_race_dataset_* queries. """
+        result_index, qualifying_index = join(
+            pair_keys(self.result_races, self.result_drivers),
+            pair_keys(self.qualifying_races, self.qualifying_drivers)
+        )
+        race_index, race_found = self.race_attributes(self.result_races[result_index])
+
+        mask = (
+            race_found
+            & (self.race_trained[race_index] == 0)
+            & (self.race_evaluation[race_index] <= 0)
+            & (self.result_positions[result_index] != MISSING)
+            & (self.result_positions[result_index] <= 20)
+            & (self.race_years[race_index] >= START_YEAR)
+            & (self.result_grids[result_index] <= 20)
+            & (self.qualifying_deltas[qualifying_index] != MISSING)
+        )
+        order = np.argsort(self.result_ids[result_index[mask]], kind='stable')
+        rows = result_index[mask][order]
+        qualifying_rows = qualifying_index[mask][order]
+        races = race_index[mask][order]
+
+        target_races = self.result_races[rows]
+        target_drivers = self.result_drivers[rows]
+        target_constructors = self.result_constructors[rows]
+        target_circuits = self.race_circuits[races]
+
+        # Results from races missing from the races table are dropped by the circuit joins
+        history_race_index, history_race_found = self.race_attributes(self.result_races)
+        history_circuits = self.race_circuits[history_race_index]
+        position_changes = self.result_grids - self.result_positions
+
+        def history(keys, values, window_filter=None):
+            """ Builds a history tuple of results with a position. """
+            history_keys, history_races, history_ids, mask = self.result_history(
+                keys, window_filter
+            )
+            return history_keys, history_races, history_ids, values[mask]
+
+        driver_circuit_keys = group_keys(
+            np.concatenate((self.result_drivers, target_drivers)),
+            np.concatenate((history_circuits, target_circuits))
+        )
+        constructor_circuit_keys = group_keys(
+            np.concatenate((self.result_constructors, target_constructors)),
+            np.concatenate((history_circuits, target_circuits))
+        )
+        history_count = len(self.result_ids)
+
+        return {
+            'race': self.race_names[races],
+            'grid': self.result_grids[rows],
+            'qualifying': self.qualifying_deltas[qualifying_rows] / 1000.0,
+            'result': self.result_positions[rows],
+            'driver': np.array([
+                self.drivers.get(driver) for driver in self.qualifying_drivers[qualifying_rows]
+            ], dtype=object),
+            'constructor': np.array([
+                self.constructors.get(constructor)
+                for constructor in self.qualifying_constructors[qualifying_rows]
+            ], dtype=object),
+            'average_form': rolling_average(
+                history(self.result_drivers, self.result_positions),
+                target_drivers, target_races, 3
+            ),
+            'circuit_average_form': rolling_average(
+                history(
+                    driver_circuit_keys[:history_count], self.result_positions,
+                    history_race_found
+                ),
+                driver_circuit_keys[history_count:], target_races, 3
+            ),
+            'championship_standing': last_value(
+                (self.standing_drivers, self.standing_races,
+                 self.standing_ids, self.standing_positions),
+                target_drivers, target_races
+            ),
+            'position_changes': rolling_average(
+                history(self.result_drivers, position_changes),
+                target_drivers, target_races, 3
+            ),
+            'average_form_team': rolling_average(
+                history(self.result_constructors, self.result_positions),
+                target_constructors, target_races, 6
+            ),
+            'circuit_average_form_team': rolling_average(
+                history(
+                    constructor_circuit_keys[:history_count], self.result_positions,
+                    history_race_found
+                ),
+                constructor_circuit_keys[history_count:], target_races, 6
+            ),
+            'position_changes_team': rolling_average(
+                history(self.result_constructors, position_changes),
+                target_constructors, target_races, 6
+            )
+        }
+
+    def qualifying_dataset(self):
+        """ Returns the columns of the qualifying training set, equivalent to
+            get_qualifying_dataset and the get_qualifying_dataset_* queries. """
+        race_index, race_found = self.race_attributes(self.qualifying_races)
+        has_time = self.qualifying_deltas != MISSING
+
+        mask = (
+            race_found
+            & (self.race_qualifying_trained[race_index] == 0)
+            & (self.race_evaluation[race_index] <= 0)
+            & (self.race_years[race_index] >= START_YEAR)
+            & has_time
+        )
+        rows = np.nonzero(mask)[0]
+        rows = rows[np.argsort(self.qualifying_ids[rows], kind='stable')]
+
+        target_races = self.qualifying_races[rows]
+        target_drivers = self.qualifying_drivers[rows]
+        target_constructors = self.qualifying_constructors[rows]
+        history_circuits = self.race_circuits[race_index]
+        target_circuits = history_circuits[rows]
+
+        def history(keys, window_filter=None):
+            """ Builds a history tuple of qualifying rows which set a time. """
+            history_mask = has_time if window_filter is None else has_time & window_filter
+            return (keys[history_mask], self.qualifying_races[history_mask],
+                    self.qualifying_ids[history_mask], self.qualifying_deltas[history_mask])
+
+        driver_circuit_keys = group_keys(self.qualifying_drivers, history_circuits)
+        constructor_circuit_keys = group_keys(self.qualifying_constructors, history_circuits)
+
+        return {
+            'race': self.race_names[race_index[rows]],
+            'result': self.qualifying_deltas[rows] / 1000.0,
+            'driver': np.array([
+                self.drivers.get(driver) for driver in target_drivers
+            ], dtype=object),
+            'constructor': np.array([
+                self.constructors.get(constructor) for constructor in target_constructors
+            ], dtype=object),
+            'average_form': rolling_average(
+                history(self.qualifying_drivers), target_drivers, target_races, 3, scale=3
+            ),
+            'circuit_average_form': rolling_average(
+                history(driver_circuit_keys, race_found),
+                driver_circuit_keys[rows], target_races, 3, scale=3
+            ),
+            'championship_standing': last_value(
+                (self.standing_drivers, self.standing_races,
+                 self.standing_ids, self.standing_positions),
+                target_drivers, target_races
+            ),
+            'average_form_team': rolling_average(
+                history(self.qualifying_constructors), target_constructors,
+                target_races, 6, scale=3
+            ),
+            'circuit_average_form_team': rolling_average(
+                history(constructor_circuit_keys, race_found),
+                constructor_circuit_keys[rows], target_races, 6, scale=3
+            )
+        }
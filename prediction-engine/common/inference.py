@@ -0,0 +1,76 @@
+""" Runs inference and ranking on a bounded pool of native threads, so that
+    the greenlet serving a prediction waits on the result while the event
+    loop carries on serving other requests. """
+
+import os
+import time
+import itertools
+
+# Number of native threads running inference, or 0 to run in the caller
+INFERENCE_THREADS = int(os.getenv('INFERENCE_THREADS', '2'))
+
+class InferencePool:
+    """ Bounded pool of native threads for CPU bound work. Tasks queue once
+        every thread is busy, and the queue depth and the time tasks wait
+        for a thread are recorded. The counters are only updated by the
+        callers, while the workers just record when each task started. """
+
+    def __init__(self, size=INFERENCE_THREADS):
+        """ Constructor, taking the number of threads. The threads are started
+            when first needed, so that importing does not start any. """
+        self.size = size
+        self.pool = None
+        self.tokens = itertools.count()
+        self.submitted = {}
+        self.started = {}
+        self.completed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_run = 0.0
+
+    def get_pool(self):
+        """ Returns the thread pool, creating it on first use. """
+        if self.pool is None:
+            from gevent.threadpool import ThreadPool
+
+            self.pool = ThreadPool(self.size)
+        return self.pool
+
+    def run(self, function, *args):
+        """ Runs the function in the pool, waiting for its result. """
+        if self.size <= 0:
+            return function(*args)
+        token = next(self.tokens)
+        self.submitted[token] = time.time()
+
+        def task():
+            """ Records the start of the task before running it. """
+            self.started[token] = time.time()
+            return function(*args)
+
+        try:
+            return self.get_pool().apply(task)
+        finally:
+            finished = time.time()
+            submitted = self.submitted.pop(token)
+            started = self.started.pop(token, finished)
+            self.completed += 1
+            self.total_wait += started - submitted
+            self.max_wait = max(self.max_wait, started - submitted)
+            self.total_run += finished - started
+
+    def metrics(self):
+        """ Returns the queue depth and wait times of the pool. """
+        in_flight = len(self.submitted)
+        running = len(self.started)
+        return {
+            'threads': self.size,
+            'queue_depth': in_flight - running,
+            'running': running,
+            'completed': self.completed,
+            'average_wait': self.total_wait / self.completed if self.completed else 0.0,
+            'max_wait': self.max_wait,
+            'average_run': self.total_run / self.completed if self.completed else 0.0
+        }
+
+inference_pool = InferencePool()
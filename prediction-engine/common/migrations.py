@@ -0,0 +1,255 @@
+""" Versioned migrations of the database schema. Each migration is applied
+    once and recorded in the schema_version table, so starting a process
+    only checks the version rather than running the DDL again. """
+
+import os
+import logging
+
+# Seconds to wait for another process applying the migrations
+MIGRATION_LOCK_TIMEOUT = int(os.getenv('MIGRATION_LOCK_TIMEOUT', '300'))
+MIGRATION_LOCK = 'schema_migrations'
+
+# Indexes for the lookups of a race's rows and a driver's or team's history
+# before a race, which nearly every query joins or filters on
+COMPOSITE_INDEXES = [
+    ('results', 'results_race_driver', ['raceId', 'driverId']),
+    ('results', 'results_driver_race', ['driverId', 'raceId']),
+    ('results', 'results_constructor_race', ['constructorId', 'raceId']),
+    ('qualifying', 'qualifying_race_driver', ['raceId', 'driverId']),
+    ('qualifying', 'qualifying_driver_race', ['driverId', 'raceId']),
+    ('qualifying', 'qualifying_constructor_race', ['constructorId', 'raceId']),
+    ('driverStandings', 'driver_standings_race_driver', ['raceId', 'driverId']),
+    ('driverStandings', 'driver_standings_driver_race', ['driverId', 'raceId']),
+    ('constructorStandings', 'constructor_standings_race', ['raceId', 'constructorId']),
+    ('races', 'races_year_round', ['year', 'round']),
+    ('races', 'races_circuit_race', ['circuitId', 'raceId']),
+    ('racePredictionLog', 'race_log_race', ['raceId', 'qualifyingPredicted', 'time']),
+    ('qualifyingPredictionLog', 'qualifying_log_race', ['raceId', 'time'])
+]
+
+# Primary keys clustering the rows of each table by driver or team and then race,
+# so that the history of a driver before a race is read from contiguous pages.
+# The surrogate ID keeps its own unique key, which auto increment requires
+CLUSTERED_KEYS = [
+    ('results', 'resultId', ['driverId', 'raceId', 'resultId']),
+    ('qualifying', 'qualifyId', ['driverId', 'raceId', 'qualifyId']),
+    ('driverStandings', 'driverStandingsId', ['driverId', 'raceId', 'driverStandingsId']),
+    ('constructorStandings', 'constructorStandingsId',
+     ['constructorId', 'raceId', 'constructorStandingsId'])
+]
+# Tables created as MyISAM, which only locks whole tables
+MYISAM_TABLES = [
+    'results', 'qualifying', 'driverStandings', 'constructorStandings',
+    'races', 'circuits', 'drivers', 'constructors'
+]
+# Composite indexes made redundant by the clustered keys
+REDUNDANT_INDEXES = [
+    index for index in COMPOSITE_INDEXES
+    if index[1] in ('results_driver_race', 'qualifying_driver_race', 'driver_standings_driver_race')
+]
+
+def execute(database, statement, params=()):
+    """ Runs a statement, returning any rows. """
+    cursor = database.query(statement, params)
+    result = cursor.fetchall() if cursor.with_rows else None
+    cursor.close()
+    return result
+
+def index_exists(database, table, name):
+    """ Returns whether the table has an index with the given name. """
+    return execute(
+        database,
+        """
+        SELECT COUNT(*)
+        FROM information_schema.statistics
+        WHERE table_schema = DATABASE()
+            AND table_name = %s
+            AND index_name = %s;""",
+        (table, name)
+    )[0][0] > 0
+
+def add_indexes(database, indexes):
+    """ Adds the indexes missing from their tables. Each table is altered
+        once, so that it is only rebuilt once. """
+    by_table = {}
+    for table, name, columns in indexes:
+        if not index_exists(database, table, name):
+            by_table.setdefault(table, []).append(
+                'ADD INDEX `%s` (%s)' % (name, ', '.join('`%s`' % column for column in columns))
+            )
+    for table, clauses in by_table.items():
+        logging.info("Adding %i indexes to %s", len(clauses), table)
+        execute(database, 'ALTER TABLE `%s` %s;' % (table, ', '.join(clauses)))
+
+def drop_indexes(database, indexes):
+    """ Drops the indexes which exist. """
+    by_table = {}
+    for table, name, _ in indexes:
+        if index_exists(database, table, name):
+            by_table.setdefault(table, []).append('DROP INDEX `%s`' % name)
+    for table, clauses in by_table.items():
+        execute(database, 'ALTER TABLE `%s` %s;' % (table, ', '.join(clauses)))
+
+def table_engine(database, table):
+    """ Returns the storage engine of the table. """
+    return execute(
+        database,
+        """
+        SELECT engine
+        FROM information_schema.tables
+        WHERE table_schema = DATABASE()
+            AND table_name = %s;""",
+        (table,)
+    )[0][0]
+
+def convert_to_innodb(database):
+    """ Converts the MyISAM tables to InnoDB, clustering the history tables by
+        driver or team. Tables already converted are skipped. """
+    clustered = {table: (id_column, key) for table, id_column, key in CLUSTERED_KEYS}
+    for table in MYISAM_TABLES:
+        if table_engine(database, table) == 'InnoDB':
+            continue
+        logging.info("Converting %s to InnoDB", table)
+        clauses = []
+        if table in clustered:
+            id_column, key = clustered[table]
+            clauses = [
+                'DROP PRIMARY KEY',
+                'ADD UNIQUE KEY `%s` (`%s`)' % (id_column, id_column),
+                'ADD PRIMARY KEY (%s)' % ', '.join('`%s`' % column for column in key)
+            ]
+        execute(database, 'ALTER TABLE `%s` %s;' % (table, ', '.join(clauses + ['ENGINE=InnoDB'])))
+    drop_indexes(database, REDUNDANT_INDEXES)
+
+def convert_to_myisam(database):
+    """ Converts the tables back to MyISAM with their surrogate primary keys. """
+    clustered = {table: id_column for table, id_column, _ in CLUSTERED_KEYS}
+    for table in MYISAM_TABLES:
+        if table_engine(database, table) == 'MyISAM':
+            continue
+        clauses = []
+        if table in clustered:
+            clauses = [
+                'DROP PRIMARY KEY',
+                'DROP INDEX `%s`' % clustered[table],
+                'ADD PRIMARY KEY (`%s`)' % clustered[table]
+            ]
+        execute(database, 'ALTER TABLE `%s` %s;' % (table, ', '.join(clauses + ['ENGINE=MyISAM'])))
+    add_indexes(database, REDUNDANT_INDEXES)
+
+def create_tables(database):
+    """ Creates the tables as they were before versioned migrations, which
+        leaves the tables of an existing database unchanged. """
+    database.create_results_table()
+    database.create_qualifying_table()
+    database.create_circuits_table()
+    database.create_constructor_standings_table()
+    database.create_constructors_table()
+    database.create_driver_standings_table()
+    database.create_drivers_table()
+    database.create_qualifying_prediction_table()
+    database.create_race_prediction_table()
+    database.create_races_table()
+
+def create_feature_tables(database):
+    """ Creates the tables of the materialized prediction features. """
+    database.create_race_features_table()
+    database.create_qualifying_features_table()
+
+def drop_feature_tables(database):
+    """ Drops the tables of the materialized prediction features. """
+    execute(database, "DROP TABLE IF EXISTS `raceFeatures`, `qualifyingFeatures`;")
+
+def drop_qualifying_delta_columns(database):
+    """ Drops the best lap and delta to pole columns of the qualifying table. """
+    execute(
+        database, "ALTER TABLE `qualifying` DROP COLUMN `bestSeconds`, DROP COLUMN `deltaToPole`;"
+    )
+
+# Versions of the migrations reverted by the benchmarks
+COMPOSITE_INDEXES_VERSION = 4
+INNODB_VERSION = 5
+
+# The (version, description, apply, revert) of each migration in order, where
+# revert is None for a migration which cannot be reverted
+MIGRATIONS = [
+    (1, 'Create the tables', create_tables, None),
+    (2, 'Create the materialized feature tables', create_feature_tables, drop_feature_tables),
+    (3, 'Add the qualifying best lap and delta to pole columns',
+     lambda database: database.create_qualifying_delta_columns(),
+     drop_qualifying_delta_columns),
+    (COMPOSITE_INDEXES_VERSION, 'Add composite indexes for race and driver history lookups',
+     lambda database: add_indexes(database, COMPOSITE_INDEXES),
+     lambda database: drop_indexes(database, COMPOSITE_INDEXES)),
+    (INNODB_VERSION, 'Convert the tables to InnoDB, clustered by driver history',
+     convert_to_innodb, convert_to_myisam)
+]
+
+def create_version_table(database):
+    """ Initialises the schema version table if it doesn't exist. """
+    execute(
+        database,
+        """
+        CREATE TABLE IF NOT EXISTS `schema_version` (
+            `version` int(11) NOT NULL,
+            `description` varchar(255) NOT NULL,
+            `appliedAt` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (`version`)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8
+        """
+    )
+
+def get_schema_version(database):
+    """ Returns the version of the last migration applied, or 0 if none. """
+    return execute(database, "SELECT COALESCE(MAX(version), 0) FROM schema_version;")[0][0]
+
+def migrate(database, target=None, migrations=MIGRATIONS):
+    """ Applies the migrations after the current version up to the target, or
+        reverts those after the target if it is lower, returning the version
+        reached. A lock is held throughout, so that processes starting at the
+        same time do not both apply the migrations. """
+    if target is None:
+        target = migrations[-1][0] if migrations else 0
+    with database.session():
+        create_version_table(database)
+        if get_schema_version(database) == target:
+            return target
+        if not execute(database, "SELECT GET_LOCK(%s, %s);",
+                       (MIGRATION_LOCK, MIGRATION_LOCK_TIMEOUT))[0][0]:
+            raise RuntimeError('Timed out waiting for the schema migration lock')
+        try:
+            # Read again, as another process may have migrated while waiting
+            version = get_schema_version(database)
+            for number, description, apply, _ in migrations:
+                if version < number <= target:
+                    logging.info("Applying migration %i: %s", number, description)
+                    apply(database)
+                    execute(
+                        database,
+                        "INSERT INTO schema_version (version, description) VALUES (%s, %s);",
+                        (number, description)
+                    )
+                    version = number
+            for number, description, _, revert in reversed(migrations):
+                if target < number <= version:
+                    if revert is None:
+                        raise ValueError('Migration %i cannot be reverted' % number)
+                    logging.info("Reverting migration %i: %s", number, description)
+                    revert(database)
+                    execute(database, "DELETE FROM schema_version WHERE version = %s;", (number,))
+                    version = get_schema_version(database)
+            return version
+        finally:
+            execute(database, "SELECT RELEASE_LOCK(%s);", (MIGRATION_LOCK,))
+
+if __name__ == '__main__':
+    import sys
+    from .db import Database
+
+    logging.basicConfig()
+    logging.root.setLevel(logging.INFO)
+    # Connecting applies any pending migrations, after which a lower version may be given
+    database = Database.get_database()
+    if len(sys.argv) > 1:
+        migrate(database, int(sys.argv[1]))
+    logging.info("Schema is at version %i", get_schema_version(database))
@@ -1,45 +1,55 @@
-""" Contains functions for reconstructing the models. """
+""" Contains functions for reconstructing the models. TensorFlow is only
+    imported when a TensorFlow model is needed, so that serving with the
+    NumPy engine never loads it. """
 
-import tensorflow as tf
-from .s3 import fetch_race_model, fetch_qualifying_model
-from .db import Database
+import os
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+from .s3 import (fetch_race_model, fetch_qualifying_model, fetch_race_serving_model,
+                 fetch_qualifying_serving_model, fetch_race_serving_model_version,
+                 fetch_qualifying_serving_model_version, model_reference,
+                 read_checkpoint_version, artifact_version, remove_model_version)
+from .engine import (WEIGHTS_FILE, RACE_NUMERIC_FEATURES, QUALIFYING_NUMERIC_FEATURES,
+                     CATEGORICAL_FEATURES, HASH_BUCKET_SIZES, NumpyModel)
 
-def retrieve_race_model(load_model=True):
-    """ Returns the Tensorflow race model. """
-    race_feature = tf.feature_column.categorical_column_with_hash_bucket(
-        'race',
-        hash_bucket_size=60
-    )
+INFERENCE_ENGINE = os.getenv('INFERENCE_ENGINE', 'numpy')
 
-    driver_feature = tf.feature_column.categorical_column_with_hash_bucket(
-        'driver',
-        hash_bucket_size=1000
-    )
+# Training input is streamed through tf.data unless set to 'numpy'
+TRAINING_INPUT = os.getenv('TRAINING_INPUT', 'dataset')
+INPUT_CHUNK_SIZE = int(os.getenv('INPUT_CHUNK_SIZE', '1024'))
+SHUFFLE_BUFFER_SIZE = int(os.getenv('SHUFFLE_BUFFER_SIZE', '10000'))
+# Caching keeps the whole parsed training set in memory, so is off unless set to 'true'
+CACHE_TRAINING_INPUT = os.getenv('CACHE_TRAINING_INPUT', 'false') == 'true'
 
-    constructor_feature = tf.feature_column.categorical_column_with_hash_bucket(
-        'constructor',
-        hash_bucket_size=300
-    )
+# Memory allowed for the versions of each model held alongside the current one
+MODEL_MEMORY_BUDGET = int(os.getenv('MODEL_MEMORY_BUDGET_MB', '256')) * 1024 * 1024
 
-    feature_columns = [
-        tf.feature_column.numeric_column(key='qualifying'),
-        tf.feature_column.numeric_column(key='average_form'),
-        tf.feature_column.numeric_column(key='average_form_team'),
-        tf.feature_column.numeric_column(key='circuit_average_form'),
-        tf.feature_column.numeric_column(key='circuit_average_form_team'),
-        tf.feature_column.numeric_column(key='position_changes'),
-        tf.feature_column.numeric_column(key='position_changes_team'),
-        tf.feature_column.numeric_column(key='grid'),
-        tf.feature_column.numeric_column(key='championship_standing'),
-        tf.feature_column.indicator_column(race_feature),
-        tf.feature_column.indicator_column(driver_feature),
-        tf.feature_column.indicator_column(constructor_feature)
+def build_feature_columns(numeric_features):
+    """ Returns the feature columns shared by both models. """
+    import tensorflow as tf
+
+    return [tf.feature_column.numeric_column(key=key) for key in numeric_features] + [
+        tf.feature_column.indicator_column(
+            tf.feature_column.categorical_column_with_hash_bucket(
+                key,
+                hash_bucket_size=HASH_BUCKET_SIZES[key]
+            )
+        )
+        for key in CATEGORICAL_FEATURES
     ]
 
+def retrieve_race_model(load_model=True, model_dir=None):
+    """ Returns the Tensorflow race model, from the given directory if set. """
+    import tensorflow as tf
+
     model = tf.estimator.DNNClassifier(
-        model_dir=fetch_race_model(load_model),
+        model_dir=model_dir or fetch_race_model(load_model),
         hidden_units=[50, 50],
-        feature_columns=feature_columns,
+        feature_columns=build_feature_columns(RACE_NUMERIC_FEATURES),
         n_classes=20,
         label_vocabulary=[str(i) for i in range(1, 21)],
         optimizer=tf.train.ProximalAdagradOptimizer(
@@ -49,41 +59,296 @@ def retrieve_race_model(load_model=True):
 
     return model
 
-def retrieve_qualifying_model(load_model=True):
-    """ Returns the Tensorflow qualifying model. """
-    race_feature = tf.feature_column.categorical_column_with_hash_bucket(
-        'race',
-        hash_bucket_size=60
-    )
-
-    driver_feature = tf.feature_column.categorical_column_with_hash_bucket(
-        'driver',
-        hash_bucket_size=1000
-    )
-
-    constructor_feature = tf.feature_column.categorical_column_with_hash_bucket(
-        'constructor',
-        hash_bucket_size=300
-    )
-
-    feature_columns = [
-        tf.feature_column.numeric_column(key='average_form'),
-        tf.feature_column.numeric_column(key='average_form_team'),
-        tf.feature_column.numeric_column(key='circuit_average_form'),
-        tf.feature_column.numeric_column(key='circuit_average_form_team'),
-        tf.feature_column.numeric_column(key='championship_standing'),
-        tf.feature_column.indicator_column(race_feature),
-        tf.feature_column.indicator_column(driver_feature),
-        tf.feature_column.indicator_column(constructor_feature)
-    ]
+def retrieve_qualifying_model(load_model=True, model_dir=None):
+    """ Returns the Tensorflow qualifying model, from the given directory if set. """
+    import tensorflow as tf
 
     model = tf.estimator.DNNRegressor(
-        model_dir=fetch_qualifying_model(load_model),
+        model_dir=model_dir or fetch_qualifying_model(load_model),
         hidden_units=[20, 20],
-        feature_columns=feature_columns,
+        feature_columns=build_feature_columns(QUALIFYING_NUMERIC_FEATURES),
         optimizer=tf.train.ProximalAdagradOptimizer(
             learning_rate=0.1,
             l1_regularization_strength=0.001
         ))
 
     return model
+
+def is_string(values):
+    """ Returns whether the array holds strings. """
+    return np.asarray(values[:1]).dtype.kind in 'OSU'
+
+def read_chunk(values, start, end):
+    """ Reads rows of a column, encoding strings so TensorFlow receives bytes. """
+    chunk = np.asarray(values[start:end])
+    if is_string(chunk):
+        return np.array([str(value).encode('utf-8') for value in chunk], dtype=object)
+    return chunk
+
+def dataset_input_fn(features, labels, num_epochs, batch_size):
+    """ Returns an input function which streams the columns through tf.data in
+        chunks, so that the arrays (which may be memory mapped) are never
+        copied into the graph or held in memory as a whole. """
+    import tensorflow as tf
+
+    keys = sorted(features)
+    columns = [features[key] for key in keys] + [labels]
+    number_of_rows = len(labels)
+
+    def generator():
+        """ Yields the columns a chunk of rows at a time. """
+        for start in range(0, number_of_rows, INPUT_CHUNK_SIZE):
+            end = start + INPUT_CHUNK_SIZE
+            yield tuple(read_chunk(values, start, end) for values in columns)
+
+    def parse(*chunk):
+        """ Converts a chunk into feature and label tensors. """
+        parsed = {
+            key: (values if values.dtype == tf.string else tf.cast(values, tf.float32))
+            for key, values in zip(keys, chunk[:-1])
+        }
+        label = chunk[-1] if chunk[-1].dtype == tf.string else tf.cast(chunk[-1], tf.float32)
+        return parsed, label
+
+    def input_fn():
+        """ Builds the input pipeline. """
+        dataset = tf.data.Dataset.from_generator(
+            generator,
+            tuple(
+                tf.string if is_string(values) else tf.as_dtype(np.asarray(values[:1]).dtype)
+                for values in columns
+            ),
+            tuple(tf.TensorShape([None]) for _ in columns)
+        )
+        dataset = dataset.map(parse, num_parallel_calls=tf.data.experimental.AUTOTUNE)
+        if CACHE_TRAINING_INPUT:
+            dataset = dataset.cache()
+        dataset = dataset.apply(tf.data.experimental.unbatch())
+        dataset = dataset.shuffle(SHUFFLE_BUFFER_SIZE).repeat(num_epochs).batch(batch_size)
+        return dataset.prefetch(tf.data.experimental.AUTOTUNE)
+
+    return input_fn
+
+def train_model(model, features, labels, num_epochs, batch_size):
+    """ Trains the model on the given feature and label arrays. """
+    import tensorflow as tf
+
+    if TRAINING_INPUT == 'numpy':
+        train_input_fn = tf.estimator.inputs.numpy_input_fn(
+            x=features,
+            y=labels,
+            batch_size=batch_size,
+            num_epochs=num_epochs,
+            shuffle=True
+        )
+    else:
+        train_input_fn = dataset_input_fn(features, labels, num_epochs, batch_size)
+
+    model.train(input_fn=train_input_fn)
+
+class ModelVersionNotFound(LookupError):
+    """ Raised when a requested version of a model cannot be fetched. """
+
+def directory_size(model_dir):
+    """ Returns the size of the files in the model directory, used as an
+        estimate of the memory taken by the loaded model. """
+    return sum(
+        os.path.getsize(os.path.join(directory, name))
+        for directory, _, names in os.walk(model_dir)
+        for name in names
+    )
+
+class ResidentModel:
+    """ Keeps a model loaded in memory for the life of the process, so that
+        it is fetched, built and restored only once. Requests use the loaded
+        model, and new versions are loaded by refresh, which the prediction
+        APIs run in the background. Other versions can be requested
+        by content hash, and are held within a memory budget, evicting
+        the least recently used along with their directories. """
+
+    def __init__(self, fetch_model, retrieve_model, numeric_features, fetch_version=None):
+        """ Constructor, taking the model fetch and build functions and its numeric
+            features, and optionally a function fetching a version by content hash,
+            as a context holding the directory of the version. """
+        self.fetch_model = fetch_model
+        self.retrieve_model = retrieve_model
+        self.numeric_features = numeric_features
+        self.fetch_version = fetch_version
+        self.predictor = None
+        self.version = None
+        self.artifact = None
+        self.size = 0
+        self.loaded_at = None
+        self.reloading = False
+        self.versions = OrderedDict()
+        self.lock = threading.Lock()
+
+    def serving_input_receiver_fn(self):
+        """ Creates a placeholder for each of the features of the model. """
+        import tensorflow as tf
+
+        features = {
+            key: tf.placeholder(tf.float32, shape=[None], name=key)
+            for key in self.numeric_features
+        }
+        for key in CATEGORICAL_FEATURES:
+            features[key] = tf.placeholder(tf.string, shape=[None], name=key)
+        return tf.estimator.export.ServingInputReceiver(features, features)
+
+    def load_predictor(self, model_dir, checkpoint):
+        """ Loads the NumPy engine if an up to date export exists and it
+            is enabled, falling back to a TensorFlow predictor otherwise. """
+        weights_path = os.path.join(model_dir, WEIGHTS_FILE)
+        if INFERENCE_ENGINE == 'numpy' and os.path.exists(weights_path):
+            predictor = NumpyModel(weights_path)
+            if predictor.version == checkpoint:
+                return predictor
+            logging.warning("Exported weights are out of date, so using TensorFlow")
+
+        import tensorflow as tf
+
+        return tf.contrib.predictor.from_estimator(
+            self.retrieve_model(False, model_dir),
+            self.serving_input_receiver_fn,
+            output_key='predict'
+        )
+
+    def refresh(self, load_model=True):
+        """ Fetches the model, loading it if the checkpoint or artifact has
+            changed. The new predictor is loaded without holding the lock, so
+            requests for other versions are not blocked, and is swapped in
+            only once loaded. """
+        model_dir = self.fetch_model(load_model)
+        with model_reference(model_dir):
+            version = read_checkpoint_version(model_dir)
+            artifact = artifact_version(model_dir)
+            with self.lock:
+                predictor, loaded = self.predictor, (self.version, self.artifact)
+            if predictor is not None and loaded == (version, artifact):
+                return predictor
+            logging.info("Loading model from checkpoint %s", str(version))
+            predictor = self.load_predictor(model_dir, version)
+            size = directory_size(model_dir)
+
+        with self.lock:
+            if self.artifact is not None:
+                # Keep the replaced version, so switching back to it is free. Its
+                # directory was published, so is left to be collected with the others
+                self.add_version(self.artifact, self.predictor, self.size)
+            self.versions.pop(artifact, None)
+            self.predictor, self.version, self.artifact, self.size, self.loaded_at = (
+                predictor, version, artifact, size, time.time()
+            )
+            evicted = self.evict_versions()
+            predictor = self.predictor
+        self.remove_versions(evicted)
+        return predictor
+
+    def load(self, load_model=True):
+        """ Returns the loaded predictor, fetching and loading the model if
+            there is none. A local model, used when not loading from the store,
+            is refreshed on each call, which only reads its checkpoint state. """
+        predictor = self.predictor
+        if predictor is not None and load_model:
+            return predictor
+        return self.refresh(load_model)
+
+    def add_version(self, artifact, predictor, size, model_dir=None):
+        """ Adds a loaded version as the most recently used, along with the
+            directory it was fetched into, if it is to be removed on eviction. """
+        self.versions[artifact] = (predictor, size, model_dir)
+        self.versions.move_to_end(artifact)
+
+    def evict_versions(self):
+        """ Evicts the least recently used versions until within the memory
+            budget, always keeping the current and most recent versions.
+            Returns the directories of the evicted versions. """
+        total = self.size + sum(size for _, size, _ in self.versions.values())
+        evicted = []
+        while total > MODEL_MEMORY_BUDGET and len(self.versions) > 1:
+            artifact, (_, size, model_dir) = self.versions.popitem(last=False)
+            total -= size
+            if model_dir is not None:
+                evicted.append(model_dir)
+            logging.info("Evicted version %s of the model", artifact)
+        return evicted
+
+    def remove_versions(self, model_dirs):
+        """ Removes the directories of evicted versions, which is done
+            without holding the lock. """
+        for model_dir in model_dirs:
+            remove_model_version(model_dir)
+
+    def load_version(self, artifact):
+        """ Returns the predictor of the version with the given content hash,
+            loading it if it is not held. Raises ModelVersionNotFound if the
+            version cannot be fetched. """
+        if re.fullmatch('[0-9a-f]{64}', artifact) is None:
+            raise ModelVersionNotFound('Model versions are content hashes, not ' + artifact)
+        with self.lock:
+            if artifact == self.artifact and self.predictor is not None:
+                return self.predictor
+            if artifact in self.versions:
+                self.versions.move_to_end(artifact)
+                return self.versions[artifact][0]
+
+        if self.fetch_version is None:
+            raise ModelVersionNotFound('Versions of this model cannot be fetched')
+        model_dir = None
+        try:
+            # The directory is removed by the fetch if the version fails to load
+            with self.fetch_version(artifact) as model_dir:
+                logging.info("Loading version %s of the model", artifact)
+                predictor = self.load_predictor(model_dir, read_checkpoint_version(model_dir))
+                size = directory_size(model_dir)
+        except Exception as err:
+            if model_dir is not None:
+                raise
+            raise ModelVersionNotFound(
+                'Model version %s could not be fetched: %s' % (artifact, str(err))
+            )
+
+        with self.lock:
+            self.add_version(artifact, predictor, size, model_dir)
+            evicted = self.evict_versions()
+        self.remove_versions(evicted)
+        return predictor
+
+    def model_version(self):
+        """ Returns the version of the loaded model, being the content hash of
+            its artifact if fetched, or otherwise its checkpoint. """
+        return self.artifact or self.version
+
+    def status(self):
+        """ Returns the status of the loaded model. """
+        return {
+            'version': self.model_version(),
+            'checkpoint': self.version,
+            'artifact': self.artifact,
+            'loaded_at': self.loaded_at,
+            'reloading': self.reloading,
+            'versions': list(self.versions)
+        }
+
+    def predict(self, features, load_model=True, model_version=None):
+        """ Runs the features through the model, or the given version of it,
+            returning a dictionary of outputs per row as Estimator.predict would. """
+        if model_version is None:
+            predictor = self.load(load_model)
+        else:
+            predictor = self.load_version(model_version)
+        outputs = predictor(features)
+        number_of_rows = len(next(iter(features.values())))
+        return [
+            {key: value[index] for key, value in outputs.items()}
+            for index in range(number_of_rows)
+        ]
+
+race_model = ResidentModel(
+    fetch_race_serving_model, retrieve_race_model, RACE_NUMERIC_FEATURES,
+    fetch_race_serving_model_version
+)
+qualifying_model = ResidentModel(
+    fetch_qualifying_serving_model, retrieve_qualifying_model, QUALIFYING_NUMERIC_FEATURES,
+    fetch_qualifying_serving_model_version
+)
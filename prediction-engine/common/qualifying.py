@@ -3,11 +3,13 @@
 import time
 from datetime import datetime
 import logging
-import tensorflow as tf
 import numpy as np
-from .models import retrieve_qualifying_model
+from .models import retrieve_qualifying_model, train_model, qualifying_model
 from .s3 import upload_qualifying_model
 from .db import Database
+from .features import FeatureEngine, fill_missing
+from .snapshot import load_training_set
+from .inference import inference_pool
 from .utils import tuples_to_dictionary, generate_feature_hash
 
 db = Database.get_database()
@@ -22,22 +24,38 @@ def results_to_ranking(predictions):
     sorted_predictions = sorted(predictions_list_tuples, key=lambda item: item[1])
     return sorted_predictions
 
-def predict(race_id, disable_cache=False, load_model=True):
-    """ Obtain a prediction for the given (or next) race in qualifying. """
-    race = race_id
-    if race is None:
-        race = db.get_next_race_year_round_qualifying()[2]
-
-    race_name, race_year = db.get_race_by_id(race)
-    cached_result = db.get_qualifying_log(race)
-    if len(cached_result) > 0 and not disable_cache:
-        logging.info("Result is cached in prediction log, so returning that")
-        return cached_result, race_name, race_year, race
+def feature_dictionaries(stored_features):
+    """ Splits materialized feature rows into the drivers to predict for with
+        their average form, and a dictionary by driver for each other feature. """
+    return [[row[:-4] for row in stored_features]] + [
+        tuples_to_dictionary([(row[0], row[column]) for row in stored_features])
+        for column in range(-4, 0)
+    ]
 
-    logging.info('Making prediction for race with ID %s and name %s', str(race), race_name)
+def calculate_features(race):
+    """ Calculates the features of the given race from the results. """
+    logging.info("Features not materialized for race with ID %s, so calculating", str(race))
+    return [
+        db.get_qualifying_form_with_drivers(race),
+        tuples_to_dictionary(db.get_qualifying_form_circuit(race)),
+        tuples_to_dictionary(db.get_qualifying_championship_positions(race)),
+        tuples_to_dictionary(db.get_qualifying_form_average_team(race)),
+        tuples_to_dictionary(db.get_qualifying_form_circuit_team(race))
+    ]
 
-    # Gets the drivers to predict for, alongside average form features.
-    averages_with_driver = db.get_qualifying_form_with_drivers(race)
+def get_features(race):
+    """ Returns the drivers to predict for with their average form, and a dictionary by
+        driver for each other feature. These are read from the materialized features
+        table, or calculated from the results if they are not stored. """
+    stored_features = db.get_qualifying_features(race)
+    if len(stored_features) > 0:
+        return feature_dictionaries(stored_features)
+    return calculate_features(race)
+
+def build_features(race_name, averages_with_driver, circuit_averages, championship_standing,
+                   average_form_team, circuit_averages_team):
+    """ Builds the model inputs for the drivers of a race, returning
+        the drivers alongside the features. """
     drivers_to_predict = [list(result)[:len(result) - 1] for result in averages_with_driver]
     average_form = [float(list(result)[len(result) - 1]) for result in averages_with_driver]
     drivers = [result[1] for result in averages_with_driver]
@@ -45,12 +63,6 @@ def predict(race_id, disable_cache=False, load_model=True):
 
     driver_ids = [result[0] for result in averages_with_driver]
 
-    # Calculate rest of the features
-    circuit_averages = tuples_to_dictionary(db.get_qualifying_form_circuit(race))
-    championship_standing = tuples_to_dictionary(db.get_qualifying_championship_positions(race))
-    average_form_team = tuples_to_dictionary(db.get_qualifying_form_average_team(race))
-    circuit_averages_team = tuples_to_dictionary(db.get_qualifying_form_circuit_team(race))
-
     # Ensure all features are valid types
     circuit_averages_array = ([
         (float(circuit_averages[driver][0][0]) if circuit_averages[driver][0][0] is not None
@@ -82,28 +94,66 @@ def predict(race_id, disable_cache=False, load_model=True):
         'average_form_team': np.array(average_form_team_array),
         'circuit_average_form_team': np.array(circuit_averages_team_array)
     }
+    return drivers_to_predict, features
 
-    fe_hash, fe_string = generate_feature_hash(features)
-
-    # Fetch model from S3
-    model = retrieve_qualifying_model(load_model)
-
-    input_fn = tf.estimator.inputs.numpy_input_fn(
-        x=features,
-        num_epochs=1,
-        shuffle=False
-    )
-
-    # Run prediction, and sort into final result
-    predictions = model.predict(input_fn=input_fn)
+def rank_drivers(drivers_to_predict, predictions):
+    """ Sorts the drivers into the final result, adding the predicted gap to pole. """
     ranking = results_to_ranking(predictions)
     fastest_lap = min([item[1] for item in ranking])
-    driver_ranking = [
+    return [
         (list(drivers_to_predict[position[0]]) +
          [round(position[1]-fastest_lap, 3)])
         for position in ranking
     ]
 
+def rank_prediction(drivers_to_predict, features, load_model=True, model_version=None):
+    """ Runs the features through the resident model, and sorts into the final result. """
+    predictions = qualifying_model.predict(features, load_model, model_version)
+    return rank_drivers(drivers_to_predict, predictions)
+
+def rank_batch(batch, load_model=True):
+    """ Runs every race of the batch through the model together, then splits
+        the predictions by race and sorts each into its final result. """
+    predictions = qualifying_model.predict({
+        key: np.concatenate([item[4][key] for item in batch]) for key in batch[0][4]
+    }, load_model)
+
+    rankings = []
+    offset = 0
+    for _, _, _, drivers_to_predict, _ in batch:
+        race_predictions = predictions[offset:offset + len(drivers_to_predict)]
+        offset += len(drivers_to_predict)
+        rankings.append(rank_drivers(drivers_to_predict, race_predictions))
+    return rankings
+
+def predict(race_id, disable_cache=False, load_model=True, model_version=None):
+    """ Obtain a prediction for the given (or next) race in qualifying.
+        A version of the model may be given by content hash, in which case the
+        prediction log is not used. """
+    if model_version is not None:
+        disable_cache = True
+    race = race_id
+    if race is None:
+        race = db.get_next_race_year_round_qualifying()[2]
+
+    race_name, race_year = db.get_race_by_id(race)
+    cached_result = db.get_qualifying_log(race)
+    if len(cached_result) > 0 and not disable_cache:
+        logging.info("Result is cached in prediction log, so returning that")
+        return cached_result, race_name, race_year, race
+
+    logging.info('Making prediction for race with ID %s and name %s', str(race), race_name)
+
+    # Gets the drivers to predict for, alongside the features
+    drivers_to_predict, features = build_features(race_name, *get_features(race))
+
+    fe_hash, fe_string = generate_feature_hash(features)
+
+    # Run prediction on the resident model away from the event loop, and sort into final result
+    driver_ranking = inference_pool.run(
+        rank_prediction, drivers_to_predict, features, load_model, model_version
+    )
+
     # Add to the log table
     if not disable_cache:
         timestamp = datetime.utcfromtimestamp(time.time()).strftime('%Y-%m-%d %H:%M:%S')
@@ -115,65 +165,80 @@ def predict(race_id, disable_cache=False, load_model=True):
 
     return driver_ranking, race_name, race_year, race
 
-def train(num_epochs=200, batch_size=30, load_model=True):
+def predict_many(race_ids, load_model=True):
+    """ Obtain predictions for several races at once. The features of every race are
+        gathered together and run through the model as a single batch. The prediction
+        log is not used, and a dictionary of the prediction for each race is returned. """
+    race_ids = list(race_ids)
+    if len(race_ids) == 0:
+        return {}
+
+    races = tuples_to_dictionary(db.get_races_by_ids(race_ids))
+    stored_features = tuples_to_dictionary(db.get_qualifying_features_for_races(race_ids))
+
+    batch = []
+    for race in race_ids:
+        race_name, race_year = races[race][0]
+        race_features = (feature_dictionaries(stored_features[race]) if race in stored_features
+                         else calculate_features(race))
+        drivers_to_predict, features = build_features(race_name, *race_features)
+        batch.append((race, race_name, race_year, drivers_to_predict, features))
+
+    rankings = inference_pool.run(rank_batch, batch, load_model)
+    return {
+        race: (ranking, race_name, race_year, race)
+        for (race, race_name, race_year, _, _), ranking in zip(batch, rankings)
+    }
+
+def build_training_set(database):
+    """ Builds the qualifying features and labels for training. """
+    dataset = FeatureEngine.load(database).qualifying_dataset()
+
+    results = dataset['result']
+
+    # Replace the missing features
+    average_form = fill_missing(dataset['average_form'], results)
+    circuit_average_form = fill_missing(dataset['circuit_average_form'], average_form)
+    championship_standing = fill_missing(dataset['championship_standing'], 20).astype(int)
+    average_form_team = fill_missing(dataset['average_form_team'], results)
+    circuit_average_form_team = fill_missing(
+        dataset['circuit_average_form_team'], average_form_team
+    )
+
+    features = {
+        'race': dataset['race'].astype(str),
+        'average_form': average_form,
+        'circuit_average_form': circuit_average_form,
+        'championship_standing': championship_standing,
+        'driver': dataset['driver'].astype(str),
+        'constructor': dataset['constructor'].astype(str),
+        'average_form_team': average_form_team,
+        'circuit_average_form_team': circuit_average_form_team
+    }
+    return features, results
+
+def train(num_epochs=200, batch_size=30, load_model=True, use_snapshot=True):
     """ Train qualifying model. """
 
     # Mark as in progress, get the training data
     last_race_id = db.get_last_race_id()
     db.mark_qualifying_as_in_progress(last_race_id)
-    training_data = db.get_qualifying_dataset()
+    if use_snapshot:
+        features, labels = load_training_set('qualifying', db, build_training_set)
+    else:
+        features, labels = build_training_set(db)
     model = retrieve_qualifying_model(load_model)
 
-    races = [item[0] for item in training_data]
-    results = [float(item[1]) for item in training_data]
-    driver = [item[2] for item in training_data]
-    constructor = [item[3] for item in training_data]
-
     # If new data is available, run training
-    if len(races) > 0:
-
-        # Get the rest of the training data, replacing missing values
-        average_form = [
-            (float(item[0]) if item[0] is not None else results[index])
-            for index, item in enumerate(db.get_qualifying_dataset_form())]
-        circuit_average_form = [
-            (float(item[0]) if item[0] is not None else average_form[index])
-            for index, item in enumerate(db.get_qualifying_dataset_form_circuit())]
-        championship_standing = [
-            (int(item[0]) if item[0] is not None else 20)
-            for item in db.get_qualifying_dataset_standings()
-        ]
-        average_form_team = [
-            (float(item[0]) if item[0] is not None else results[index])
-            for index, item in enumerate(db.get_qualifying_dataset_form_team())
-        ]
-        circuit_average_form_team = [
-            (float(item[0]) if item[0] is not None else average_form_team[index])
-            for index, item in enumerate(db.get_qualifying_dataset_form_team_circuit())]
-
-        logging.info("Data received from SQL, now training qualifying")
-
-        features = {
-            'race': np.array(races),
-            'average_form': np.array(average_form),
-            'circuit_average_form': np.array(circuit_average_form),
-            'championship_standing': np.array(championship_standing),
-            'driver': np.array(driver),
-            'constructor':  np.array(constructor),
-            'average_form_team': np.array(average_form_team),
-            'circuit_average_form_team': np.array(circuit_average_form_team)
-        }
-
-        train_input_fn = tf.estimator.inputs.numpy_input_fn(
-            x=features,
-            y=np.array(results),
-            batch_size=batch_size,
-            num_epochs=num_epochs,
-            shuffle=True
-        )
+    if len(labels) > 0:
+        logging.info("Features computed, now training qualifying")
 
         # Train model
-        model.train(input_fn=train_input_fn)
+        train_model(model, features, labels, num_epochs, batch_size)
+
+        # Export the weights for the NumPy engine, imported here as it requires TensorFlow
+        from .export import export_qualifying_model
+        export_qualifying_model(model.model_dir)
 
         db.mark_qualifying_as_complete()
 
@@ -3,51 +3,19 @@
 import time
 import datetime
 import logging
-import tensorflow as tf
 import numpy as np
-from .models import retrieve_race_model
+from .models import retrieve_race_model, train_model, race_model
 from .s3 import upload_race_model
 from .db import Database
+from .features import FeatureEngine, fill_missing
+from .snapshot import load_training_set
+from .inference import inference_pool
+from .ranking import results_to_ranking
 from .utils import tuples_to_dictionary, generate_feature_hash
-from .qualifying import predict as qualifying_predict
+from .qualifying import predict as qualifying_predict, predict_many as qualifying_predict_many
 
 db = Database.get_database()
 
-def get_result_as_tuples(predictions, number_of_drivers):
-    """ Converts TensorFlow result into a list of tuples that can be sorted,
-        also normalising probability by position. """
-    by_position = {}
-    for pred_dict in predictions:
-        for position in range(0, number_of_drivers):
-            if position not in by_position:
-                by_position[position] = []
-            by_position[position].append(pred_dict['probabilities'][position].item())
-
-    result = []
-    for position, values in by_position.items():
-        total = sum(values)
-        if total > 0:
-            result.extend([(position, index, (value / total)) for index, value in enumerate(values)])
-        else:
-            result.extend([(position, index, 0) for index, value in enumerate(values)])
-    return result
-
-def results_to_ranking(predictions, number_of_drivers):
-    """ Converts the tuples into a final ranking, by repeatedly
-        picking highest class probability. """
-    ranked_drivers = []
-    ranked_positions = []
-    ranking = []
-    tuples = get_result_as_tuples(predictions, number_of_drivers)
-    while len(ranking) < number_of_drivers:
-        max_tuple = max(tuples, key=lambda item: item[2])
-        ranked_positions.append(max_tuple[0])
-        ranked_drivers.append(max_tuple[1])
-        ranking.append(max_tuple)
-        tuples = [item for item in tuples if item[0] not in ranked_positions and item[1] not in ranked_drivers]
-    sorted_ranking = sorted(ranking, key=lambda item: item[0])
-    return sorted_ranking
-
 def replace_none_with_average(data, rounding=3):
     """ Replaces none values in an array with the average of the other values. """
     data_none_removed = [float(item) for item in data if item is not None]
@@ -56,49 +24,51 @@ def replace_none_with_average(data, rounding=3):
         average = round(sum(data_none_removed) / len(data_none_removed), rounding)
     return [float(item) if item is not None else average for item in data]
 
-def predict(race_id, disable_cache=False, load_model=True):
-    """ Obtain a prediction for the given (or next) race. """
-    race = race_id
-    if race is None:
-        race = db.get_next_race_year_round()[2]
+def feature_dictionaries(stored_features):
+    """ Converts materialized feature rows into a dictionary by driver for each feature. """
+    return [
+        tuples_to_dictionary([(row[0], row[column]) for row in stored_features])
+        for column in range(1, 8)
+    ]
 
-    logging.info("Making prediction for race with ID %s", str(race))
+def calculate_features(race):
+    """ Calculates the features of the given race from the results. """
+    logging.info("Features not materialized for race with ID %s, so calculating", str(race))
+    return [
+        tuples_to_dictionary(db.get_race_averages(race)),
+        tuples_to_dictionary(db.get_circuit_averages(race)),
+        tuples_to_dictionary(db.get_championship_positions(race)),
+        tuples_to_dictionary(db.get_position_changes(race)),
+        tuples_to_dictionary(db.get_race_averages_team(race)),
+        tuples_to_dictionary(db.get_circuit_averages_team(race)),
+        tuples_to_dictionary(db.get_position_changes_team(race))
+    ]
 
-    # Check if qualifying results exist for this race, and predict if they don't
-    qualifying_results = db.get_qualifying_results_with_driver(race)
-    if len(qualifying_results) > 0:
-        logging.info("Qualifying results exist for race with ID %s", str(race))
-        drivers_to_predict = [list(result)[:len(result) - 3] for result in qualifying_results]
-        qualifying_grid = [int(list(result)[len(result) - 2]) for result in qualifying_results]
-        qualifying_deltas = replace_none_with_average([list(result)[len(result) - 1] for result in qualifying_results])
-        constructors = [list(result)[len(result) - 3] for result in qualifying_results]
-        race_name, race_year = db.get_race_by_id(race)
-        qualifying_predicted = False
-    else:
-        logging.info("Qualifying results not available for race with ID %s, so will make prediction", str(race))
-        qualifying_results, race_name, race_year, _ = qualifying_predict(race)
-        drivers_to_predict = [list(result)[:len(result) - 3] for result in qualifying_results]
+def get_features(race):
+    """ Returns a dictionary by driver for each feature, read from the materialized
+        features table, or calculated from the results if they are not stored. """
+    stored_features = db.get_race_features(race)
+    if len(stored_features) > 0:
+        return feature_dictionaries(stored_features)
+    return calculate_features(race)
+
+def build_features(race_name, qualifying_results, qualifying_predicted, feature_values):
+    """ Builds the model inputs for the drivers of a race from the actual or predicted
+        qualifying results, returning the drivers alongside the features. """
+    drivers_to_predict = [list(result)[:len(result) - 3] for result in qualifying_results]
+    constructors = [list(result)[len(result) - 3] for result in qualifying_results]
+    if qualifying_predicted:
         qualifying_deltas = [list(result)[len(result) - 1] for result in qualifying_results]
         qualifying_grid = [i for i in range(1, len(drivers_to_predict) + 1)]
-        constructors = [list(result)[len(result) - 3] for result in qualifying_results]
-        qualifying_predicted = True
-
-    cached_result = db.get_race_log(race, qualifying_predicted)
-    if len(cached_result) > 0 and not disable_cache:
-        logging.warn("Result is cached in prediction log, so returning that")
-        return cached_result, race_name, race_year, race
+    else:
+        qualifying_grid = [int(list(result)[len(result) - 2]) for result in qualifying_results]
+        qualifying_deltas = replace_none_with_average([list(result)[len(result) - 1] for result in qualifying_results])
 
     driver_ids = [result[0] for result in qualifying_results]
     drivers = [result[1] for result in qualifying_results]
 
-    # Calculate the rest of the features for the retrieved drivers
-    race_averages = tuples_to_dictionary(db.get_race_averages(race))
-    circuit_averages = tuples_to_dictionary(db.get_circuit_averages(race))
-    standings = tuples_to_dictionary(db.get_championship_positions(race))
-    position_changes = tuples_to_dictionary(db.get_position_changes(race))
-    race_averages_team = tuples_to_dictionary(db.get_race_averages_team(race))
-    circuit_averages_team = tuples_to_dictionary(db.get_circuit_averages_team(race))
-    position_changes_team = tuples_to_dictionary(db.get_position_changes_team(race))
+    (race_averages, circuit_averages, standings, position_changes, race_averages_team,
+     circuit_averages_team, position_changes_team) = feature_values
 
     # Ensure all features are valid types
     race_averages_array = [
@@ -162,22 +132,72 @@ def predict(race_id, disable_cache=False, load_model=True):
         'driver': np.array(drivers),
         'constructor': np.array(constructors)
     }
+    return drivers_to_predict, features
 
-    feature_hash, feature_string = generate_feature_hash(features)
+def rank_drivers(drivers_to_predict, predictions):
+    """ Sorts the drivers into the final ranking. """
+    ranking = results_to_ranking(predictions, len(drivers_to_predict))
+    return [list(drivers_to_predict[position[1]]) for position in ranking]
+
+def rank_prediction(drivers_to_predict, features, load_model=True, model_version=None):
+    """ Obtains predictions from the resident model, and sorts into final ranking. """
+    predictions = race_model.predict(features, load_model, model_version)
+    return rank_drivers(drivers_to_predict, predictions)
+
+def rank_batch(batch, load_model=True):
+    """ Runs every race of the batch through the model together, then splits
+        the predictions by race and sorts each into its final ranking. """
+    predictions = race_model.predict({
+        key: np.concatenate([item[4][key] for item in batch]) for key in batch[0][4]
+    }, load_model)
+
+    rankings = []
+    offset = 0
+    for _, _, _, drivers_to_predict, _ in batch:
+        race_predictions = predictions[offset:offset + len(drivers_to_predict)]
+        offset += len(drivers_to_predict)
+        rankings.append(rank_drivers(drivers_to_predict, race_predictions))
+    return rankings
+
+def predict(race_id, disable_cache=False, load_model=True, model_version=None):
+    """ Obtain a prediction for the given (or next) race.
+        A version of the model may be given by content hash, in which case the
+        prediction log is not used. """
+    if model_version is not None:
+        disable_cache = True
+    race = race_id
+    if race is None:
+        race = db.get_next_race_year_round()[2]
 
-    # Retrieve model from S3
-    model = retrieve_race_model(load_model)
+    logging.info("Making prediction for race with ID %s", str(race))
 
-    input_fn = tf.estimator.inputs.numpy_input_fn(
-        x=features,
-        num_epochs=1,
-        shuffle=False
+    # Check if qualifying results exist for this race, and predict if they don't
+    qualifying_results = db.get_qualifying_results_with_driver(race)
+    if len(qualifying_results) > 0:
+        logging.info("Qualifying results exist for race with ID %s", str(race))
+        race_name, race_year = db.get_race_by_id(race)
+        qualifying_predicted = False
+    else:
+        logging.info("Qualifying results not available for race with ID %s, so will make prediction", str(race))
+        qualifying_results, race_name, race_year, _ = qualifying_predict(race)
+        qualifying_predicted = True
+
+    cached_result = db.get_race_log(race, qualifying_predicted)
+    if len(cached_result) > 0 and not disable_cache:
+        logging.warn("Result is cached in prediction log, so returning that")
+        return cached_result, race_name, race_year, race
+
+    # Read the rest of the features for the retrieved drivers
+    drivers_to_predict, features = build_features(
+        race_name, qualifying_results, qualifying_predicted, get_features(race)
     )
 
-    # Obtain predictions, and sort  into final ranking
-    predictions = model.predict(input_fn=input_fn)
-    ranking = results_to_ranking(predictions, len(drivers_to_predict))
-    driver_ranking = [list(drivers_to_predict[position[1]]) for position in ranking]
+    feature_hash, feature_string = generate_feature_hash(features)
+
+    # Obtain predictions away from the event loop, and sort into final ranking
+    driver_ranking = inference_pool.run(
+        rank_prediction, drivers_to_predict, features, load_model, model_version
+    )
 
     # Add to the log table
     if not disable_cache:
@@ -190,79 +210,102 @@ def predict(race_id, disable_cache=False, load_model=True):
 
     return driver_ranking, race_name, race_year, race
 
-def train(num_epochs=200, batch_size=30, load_model=True):
+def predict_many(race_ids, load_model=True):
+    """ Obtain predictions for several races at once. The features of every race are
+        gathered together and run through the model as a single batch, with qualifying
+        predicted in one batch for races without qualifying results. The prediction
+        log is not used, and a dictionary of the prediction for each race is returned. """
+    race_ids = list(race_ids)
+    if len(race_ids) == 0:
+        return {}
+
+    races = tuples_to_dictionary(db.get_races_by_ids(race_ids))
+    qualifying_results = tuples_to_dictionary(
+        db.get_qualifying_results_with_driver_for_races(race_ids)
+    )
+    predicted_qualifying = qualifying_predict_many(
+        [race for race in race_ids if race not in qualifying_results], load_model
+    )
+    stored_features = tuples_to_dictionary(db.get_race_features_for_races(race_ids))
+
+    batch = []
+    for race in race_ids:
+        race_name, race_year = races[race][0]
+        qualifying_predicted = race not in qualifying_results
+        race_features = (feature_dictionaries(stored_features[race]) if race in stored_features
+                         else calculate_features(race))
+        drivers_to_predict, features = build_features(
+            race_name,
+            (predicted_qualifying[race][0] if qualifying_predicted
+             else qualifying_results[race]),
+            qualifying_predicted,
+            race_features
+        )
+        batch.append((race, race_name, race_year, drivers_to_predict, features))
+
+    # Obtain predictions away from the event loop, and sort into final rankings
+    rankings = inference_pool.run(rank_batch, batch, load_model)
+    return {
+        race: (ranking, race_name, race_year, race)
+        for (race, race_name, race_year, _, _), ranking in zip(batch, rankings)
+    }
+
+def build_training_set(database):
+    """ Builds the race features and labels for training. """
+    dataset = FeatureEngine.load(database).race_dataset()
+
+    grid = dataset['grid']
+    results = dataset['result']
+
+    # Replace the missing features
+    average_form = fill_missing(dataset['average_form'], grid)
+    circuit_average_form = fill_missing(dataset['circuit_average_form'], average_form)
+    standings = fill_missing(dataset['championship_standing'], 20).astype(int)
+    position_changes = fill_missing(dataset['position_changes'], grid - results)
+    average_form_team = fill_missing(dataset['average_form_team'], average_form)
+    circuit_average_form_team = fill_missing(
+        dataset['circuit_average_form_team'], average_form_team
+    )
+    position_changes_team = fill_missing(dataset['position_changes_team'], position_changes)
+
+    features = {
+        'race': dataset['race'].astype(str),
+        'qualifying': dataset['qualifying'],
+        'grid': grid,
+        'average_form': average_form,
+        'circuit_average_form': circuit_average_form,
+        'circuit_average_form_team': circuit_average_form_team,
+        'championship_standing': standings,
+        'position_changes': position_changes,
+        'position_changes_team': position_changes_team,
+        'driver': dataset['driver'].astype(str),
+        'constructor': dataset['constructor'].astype(str),
+        'average_form_team': average_form_team
+    }
+    return features, results.astype(str)
+
+def train(num_epochs=200, batch_size=30, load_model=True, use_snapshot=True):
     """ Train race model. """
 
     # Mark as in progress, and receive training data
     last_race_id = db.get_last_race_id()
     db.mark_races_as_in_progress(last_race_id)
-    training_data = db.get_race_dataset()
+    if use_snapshot:
+        features, labels = load_training_set('race', db, build_training_set)
+    else:
+        features, labels = build_training_set(db)
     model = retrieve_race_model(load_model)
 
-    races = [item[0] for item in training_data]
-    grid = [int(item[1]) for item in training_data]
-    qualifying = [float(item[2]) for item in training_data]
-    results = [str(item[3]) for item in training_data]
-    driver = [item[4] for item in training_data]
-    constructor = [item[5] for item in training_data]
-
     # If races exist, proceed with training
-    if len(races) > 0:
-
-        # Get the rest of the features
-        average_form = [
-            (float(item[0]) if item[0] is not None else grid[index])
-            for index, item in enumerate(db.get_race_dataset_form())
-        ]
-        circuit_average_form = [
-            (float(item[0]) if item[0] is not None else average_form[index])
-            for index, item in enumerate(db.get_race_dataset_form_circuit())
-        ]
-        standings = [int(item[0]) if item[0] is not None else 20 for item in db.get_race_dataset_standings()]
-        position_changes = [
-            (float(item[0]) if item[0] is not None else (grid[index] - int(results[index])))
-            for index, item in enumerate(db.get_race_dataset_position_changes())
-        ]
-        average_form_team = [
-            (float(item[0]) if item[0] is not None else average_form[index])
-            for index, item in enumerate(db.get_race_dataset_form_team())
-        ]
-        circuit_average_form_team = [
-            (float(item[0]) if item[0] is not None else average_form_team[index])
-            for index, item in enumerate(db.get_race_dataset_form_team_circuit())
-        ]
-        position_changes_team = [
-            (float(item[0]) if item[0] is not None else position_changes[index])
-            for index, item in enumerate(db.get_race_dataset_position_changes_team())
-        ]
-
-        logging.info("Data received from SQL, now training")
-
-        features = {
-            'race': np.array(races),
-            'qualifying': np.array(qualifying),
-            'grid': np.array(grid),
-            'average_form': np.array(average_form),
-            'circuit_average_form': np.array(circuit_average_form),
-            'circuit_average_form_team': np.array(circuit_average_form_team),
-            'championship_standing': np.array(standings),
-            'position_changes': np.array(position_changes),
-            'position_changes_team': np.array(position_changes_team),
-            'driver': np.array(driver),
-            'constructor':  np.array(constructor),
-            'average_form_team': np.array(average_form_team)
-        }
-
-        train_input_fn = tf.estimator.inputs.numpy_input_fn(
-            x=features,
-            y=np.array(results),
-            batch_size=batch_size,
-            num_epochs=num_epochs,
-            shuffle=True
-        )
+    if len(labels) > 0:
+        logging.info("Features computed, now training")
 
         # Run training
-        model.train(input_fn=train_input_fn)
+        train_model(model, features, labels, num_epochs, batch_size)
+
+        # Export the weights for the NumPy engine, imported here as it requires TensorFlow
+        from .export import export_race_model
+        export_race_model(model.model_dir)
 
         db.mark_races_as_complete()
 
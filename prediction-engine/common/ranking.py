@@ -0,0 +1,59 @@
+""" Converts the position probabilities of the race model into a ranking,
+    working on all of the drivers at once as a matrix. """
+
+import os
+import numpy as np
+
+# Either 'greedy' or 'optimal'
+RANKING_MODE = os.getenv('RANKING_MODE', 'greedy')
+
+def get_probability_matrix(predictions, number_of_drivers):
+    """ Stacks the class probabilities into a matrix indexed by position then
+        driver, normalising the probabilities of each position. Positions
+        beyond the classes of the model are given zero probability. """
+    probabilities = np.zeros((number_of_drivers, max(number_of_drivers, 20)))
+    if number_of_drivers > 0:
+        stacked = np.stack([pred_dict['probabilities'] for pred_dict in predictions])
+        probabilities[:, :stacked.shape[1]] = stacked
+    matrix = probabilities[:, :number_of_drivers].T
+    totals = matrix.sum(axis=1, keepdims=True)
+    return np.divide(matrix, totals, out=np.zeros_like(matrix), where=totals > 0)
+
+def greedy_assignment(matrix):
+    """ Repeatedly picks the highest remaining probability, removing its
+        position and driver. Ties go to the lowest position, then driver. """
+    matrix = matrix.copy()
+    number_of_drivers = matrix.shape[0]
+    positions = []
+    drivers = []
+    for _ in range(number_of_drivers):
+        position, driver = divmod(int(matrix.argmax()), number_of_drivers)
+        matrix[position, :] = -np.inf
+        matrix[:, driver] = -np.inf
+        positions.append(position)
+        drivers.append(driver)
+    return np.array(positions, dtype=int), np.array(drivers, dtype=int)
+
+def optimal_assignment(matrix):
+    """ Assigns drivers to positions maximising the total log probability. """
+    from scipy.optimize import linear_sum_assignment
+
+    costs = -np.log(np.maximum(matrix, np.finfo(float).tiny))
+    return linear_sum_assignment(costs)
+
+RANKING_MODES = {
+    'greedy': greedy_assignment,
+    'optimal': optimal_assignment
+}
+
+def results_to_ranking(predictions, number_of_drivers, mode=RANKING_MODE):
+    """ Converts the predictions into a final ranking of (position, driver,
+        probability) tuples sorted by position, either by repeatedly picking
+        the highest class probability or by an optimal assignment. """
+    matrix = get_probability_matrix(predictions, number_of_drivers)
+    positions, drivers = RANKING_MODES[mode](matrix)
+    order = np.argsort(positions)
+    return [
+        (int(positions[index]), int(drivers[index]), float(matrix[positions[index], drivers[index]]))
+        for index in order
+    ]
@@ -1,38 +1,349 @@
-""" Handles fetching and uploading of the model to the S3 bucket. """
+""" Handles fetching and uploading of the models to the model store. """
 
+import io
+import time
+import hashlib
 import logging
 import tarfile
+import tempfile
+import threading
 import os
 import shutil
-import boto3
+from contextlib import contextmanager
+from .store import get_store, artifact_key
+from .engine import WEIGHTS_FILE
 
 QUALIFYING_MODEL = 'qualifying_model'
 RACE_MODEL = 'race_model'
+# The serving artifacts hold only what is needed to restore the latest checkpoint
+SERVING_SUFFIX = '_serving'
 FILE_DIR = '/tmp/'
-BUCKET = os.getenv('S3_MODEL_BUCKET')
+# Prefix of the version directories holding a model left by training
+LOCAL_VERSION = 'local'
+# Number of extracted versions of each model kept on disk, including the current one
+VERSIONS_KEPT = int(os.getenv('MODEL_VERSIONS_KEPT', '2'))
 
-s3 = boto3.client('s3')
+store = get_store()
+
+def version_path(model):
+    """ Returns the path of the file recording the content hash of the extracted model. """
+    return FILE_DIR+model+'.version'
+
+def read_version(model):
+    """ Returns the content hash of the model last extracted, if any. """
+    try:
+        with open(version_path(model)) as version_file:
+            return version_file.read().strip()
+    except IOError:
+        return None
+
+def write_version(model, version):
+    """ Records the content hash of the model just extracted. """
+    with open(version_path(model), 'w') as version_file:
+        version_file.write(version)
+
+references = {}
+references_lock = threading.Lock()
+# Locks of the versions being fetched or removed, with the number of threads using each
+version_locks = {}
+
+def versions_dir(model):
+    """ Returns the directory holding the extracted versions of the model. """
+    return FILE_DIR+model+'.versions'
+
+def current_model_dir(model):
+    """ Returns the directory the published model resolves to. """
+    return os.path.realpath(FILE_DIR+model)
+
+def artifact_version(model_dir):
+    """ Returns the content hash of the artifact a version was extracted
+        from, or None for a directory which was not fetched. """
+    version = os.path.basename(os.path.dirname(model_dir)).split('.')[0]
+    if (os.path.basename(os.path.dirname(os.path.dirname(model_dir))).endswith('.versions')
+            and version != LOCAL_VERSION):
+        return version
+    return None
+
+def hold_reference(model_dir):
+    """ Adds a reference to the model version. """
+    with references_lock:
+        references[model_dir] = references.get(model_dir, 0) + 1
+
+def release_reference(model_dir):
+    """ Removes a reference to the model version. """
+    with references_lock:
+        references[model_dir] -= 1
+        if references[model_dir] == 0:
+            del references[model_dir]
+
+@contextmanager
+def model_reference(model_dir):
+    """ Holds a reference to the model version, so that it is not
+        removed while a model is being restored from it. """
+    hold_reference(model_dir)
+    try:
+        yield model_dir
+    finally:
+        release_reference(model_dir)
+
+@contextmanager
+def version_lock(model, version):
+    """ Serializes fetching and removing the given version of the model.
+        The lock is dropped once no thread is using it. """
+    key = (model, version)
+    with references_lock:
+        lock, users = version_locks.get(key) or (threading.Lock(), 0)
+        version_locks[key] = (lock, users + 1)
+    try:
+        with lock:
+            yield
+    finally:
+        with references_lock:
+            users = version_locks[key][1] - 1
+            if users == 0:
+                del version_locks[key]
+            else:
+                version_locks[key] = (lock, users)
+
+def collect_versions(model, kept=VERSIONS_KEPT):
+    """ Removes old versions of the model which are not in use. The most
+        recent are kept, so that a reader which resolved the model just
+        before it was replaced can still restore from it. """
+    if not os.path.isdir(versions_dir(model)):
+        return
+    current = current_model_dir(model)
+    versions = sorted(
+        (os.path.join(versions_dir(model), name) for name in os.listdir(versions_dir(model))
+         if os.path.join(versions_dir(model), name, model) != current),
+        key=os.path.getmtime,
+        reverse=True
+    )
+    with references_lock:
+        in_use = set(references)
+    for version in versions[max(kept - 1, 0):]:
+        if os.path.join(version, model) not in in_use:
+            shutil.rmtree(version, ignore_errors=True)
+
+def publish_version(model, model_dir):
+    """ Points the model at the given version by atomically replacing the link. """
+    link = FILE_DIR+model
+    if os.path.isdir(link) and not os.path.islink(link):
+        # Move a directory left by training aside, so it can be replaced by the link. It
+        # is kept in the same layout as the fetched versions, so is collected with them
+        os.makedirs(versions_dir(model), exist_ok=True)
+        version_dir = tempfile.mkdtemp(dir=versions_dir(model), prefix=LOCAL_VERSION+'.')
+        os.rename(link, os.path.join(version_dir, model))
+    temporary_link = '%s.%i.%i.link' % (link, os.getpid(), threading.get_ident())
+    if os.path.lexists(temporary_link):
+        os.remove(temporary_link)
+    os.symlink(model_dir, temporary_link)
+    os.replace(temporary_link, link)
+
+def extract_artifact(model, version):
+    """ Extracts the artifact with the given content hash into a new version
+        directory of the model, which is returned. The directory is only made
+        once the artifact is found, and is removed if extracting it fails.
+        Callers hold the lock of the version. """
+    if store.size(artifact_key(version)) is None:
+        raise IOError('Artifact %s is not in the store' % version)
+    os.makedirs(versions_dir(model), exist_ok=True)
+    version_dir = tempfile.mkdtemp(dir=versions_dir(model), prefix=version+'.')
+    model_dir = os.path.join(version_dir, model)
+    try:
+        with model_reference(model_dir):
+            # Extract the files as the archive is read, rather than saving it first
+            with store.open_read(artifact_key(version)) as reader:
+                with tarfile.open(fileobj=reader, mode='r|gz') as tar_handle:
+                    tar_handle.extractall(model_dir)
+    except Exception:
+        shutil.rmtree(version_dir, ignore_errors=True)
+        raise
+    return model_dir
+
+def find_version(model, version):
+    """ Returns the directory of an extracted copy of the given version of
+        the model, or None if there is none. Callers hold the lock of the version. """
+    if artifact_version(current_model_dir(model)) == version:
+        return current_model_dir(model)
+    if not os.path.isdir(versions_dir(model)):
+        return None
+    for name in sorted(os.listdir(versions_dir(model))):
+        model_dir = os.path.join(versions_dir(model), name, model)
+        if name.split('.')[0] == version and os.path.isdir(model_dir):
+            return model_dir
+    return None
+
+def remove_model_version(model_dir):
+    """ Removes a fetched version of the model, unless it is published or
+        still in use, in which case it is left to be collected. """
+    version = artifact_version(model_dir)
+    if version is None:
+        return
+    model = os.path.basename(model_dir)
+    with version_lock(model, version):
+        with references_lock:
+            in_use = model_dir in references
+        if not in_use and model_dir != current_model_dir(model):
+            shutil.rmtree(os.path.dirname(model_dir), ignore_errors=True)
+            logging.info('Removed version %s of %s', version, model)
+
+@contextmanager
+def fetch_model_version(model, version):
+    """ Fetches the given version of the model without publishing it, for
+        serving alongside the current version. A copy already extracted is
+        reused, and fetches of the same version wait for each other. The
+        directory is referenced while the context is held, and is removed
+        if the context fails, such as when the model cannot be loaded. """
+    with version_lock(model, version):
+        model_dir = find_version(model, version)
+        if model_dir is None:
+            model_dir = extract_artifact(model, version)
+            logging.info('Successfully retrieved version %s of %s from the store', version, model)
+        hold_reference(model_dir)
+    try:
+        yield model_dir
+    except Exception:
+        release_reference(model_dir)
+        remove_model_version(model_dir)
+        raise
+    release_reference(model_dir)
 
 def fetch_model(model):
-    """ Attempts to fetch the file with the given name. """
+    """ Attempts to fetch the model with the given name, skipping the download
+        if the local copy has the content hash in the manifest. Each download
+        is extracted into a new directory, which is published only once
+        complete, and the directory of the version is returned. """
     try:
-        s3.download_file(BUCKET, model+'.tar.gz', FILE_DIR+model+'.tar.gz')
-        tarfile.open(FILE_DIR+model+'.tar.gz', 'r').extractall(FILE_DIR)
-        logging.info('Successfully retrieved %s from S3', model)
-        return FILE_DIR+model
+        version = store.read_manifest()[model]
+        if version == read_version(model) and os.path.exists(FILE_DIR+model):
+            logging.debug('Model %s is unchanged in the store, so using local copy', model)
+            return current_model_dir(model)
+        with version_lock(model, version):
+            model_dir = extract_artifact(model, version)
+        with model_reference(model_dir):
+            publish_version(model, model_dir)
+        write_version(model, version)
+        collect_versions(model)
+        logging.info('Successfully retrieved %s from the store', model)
+        return model_dir
     except Exception as err:
         logging.error('An error occured fetching the model: %s', str(err))
         if os.path.exists(FILE_DIR+model):
             logging.info('An old model exists, so using that')
-            return FILE_DIR+model
+            return current_model_dir(model)
         raise
 
+def read_checkpoint_version(model_dir):
+    """ Returns the name of the latest checkpoint in the model directory,
+        read from the checkpoint state file without TensorFlow. """
+    try:
+        with open(os.path.join(model_dir, 'checkpoint')) as checkpoint_file:
+            for line in checkpoint_file:
+                if line.startswith('model_checkpoint_path:'):
+                    return os.path.basename(line.split(':', 1)[1].strip().strip('"'))
+    except IOError:
+        pass
+    return None
+
+def is_serving_file(name, version):
+    """ Returns whether the file is needed to serve the given checkpoint.
+        The graph is rebuilt from the code, so the meta graph is not. """
+    return name == WEIGHTS_FILE or (name.startswith(version+'.') and not name.endswith('.meta'))
+
+def model_files(model_dir):
+    """ Returns the (name, path) of each file of the full model, relative to
+        the model directory and in a fixed order. """
+    files = []
+    for directory, directories, names in os.walk(model_dir):
+        directories.sort()
+        for name in sorted(names):
+            path = os.path.join(directory, name)
+            files.append((os.path.relpath(path, model_dir), path))
+    return files
+
+def serving_files(model_dir):
+    """ Returns the (name, path or contents) of each file of the serving
+        model, or None if there is no checkpoint to serve. """
+    version = read_checkpoint_version(model_dir)
+    if version is None:
+        return None
+    # The checkpoint state is rewritten to list only the checkpoint included
+    state = ('model_checkpoint_path: "%s"\nall_model_checkpoint_paths: "%s"\n'
+             % (version, version)).encode('utf-8')
+    return [('checkpoint', state)] + [
+        (name, os.path.join(model_dir, name))
+        for name in sorted(os.listdir(model_dir))
+        if is_serving_file(name, version)
+    ]
+
+def hash_files(files):
+    """ Returns the content hash of the files. """
+    content_hash = hashlib.sha256()
+    for name, source in files:
+        content_hash.update(name.encode('utf-8') + b'\0')
+        if isinstance(source, bytes):
+            content_hash.update(source)
+        else:
+            with open(source, 'rb') as source_file:
+                for chunk in iter(lambda: source_file.read(1024 * 1024), b''):
+                    content_hash.update(chunk)
+        content_hash.update(b'\0')
+    return content_hash.hexdigest()
+
+def write_archive(writer, files):
+    """ Streams a gzipped tar archive of the files to the writer. """
+    with tarfile.open(fileobj=writer, mode='w|gz') as tar_handle:
+        for name, source in files:
+            if isinstance(source, bytes):
+                info = tarfile.TarInfo(name)
+                info.size = len(source)
+                info.mtime = time.time()
+                tar_handle.addfile(info, io.BytesIO(source))
+            else:
+                tar_handle.add(source, name, recursive=False)
+
+def upload_artifact(files):
+    """ Uploads an archive of the files under its content hash, unless
+        it is already stored. Returns the hash and size of the archive. """
+    version = hash_files(files)
+    size = store.size(artifact_key(version))
+    if size is not None:
+        logging.info('Artifact %s is already stored, so not uploading', version)
+        return version, size
+    with store.open_write(artifact_key(version)) as writer:
+        write_archive(writer, files)
+    return version, writer.size
+
 def upload_model(model):
-    """ Attempts to upload the model with the given name. """
-    with tarfile.open(FILE_DIR+model+'.tar.gz', "w:gz") as tar_handle:
-        tar_handle.add(FILE_DIR+model, model)
-    s3.upload_file(FILE_DIR+model+'.tar.gz', BUCKET, model+'.tar.gz')
-    logging.info('Successfully uploaded model %s to S3', model)
+    """ Attempts to upload the model with the given name. Both the full
+        model, from which training continues, and the serving model are
+        uploaded, and then published together in the manifest. """
+    model_dir = current_model_dir(model)
+    version, size = upload_artifact(model_files(model_dir))
+    versions = {model: version}
+    files = serving_files(model_dir)
+    serving_size = None
+    if files is None:
+        logging.warning('No checkpoint found in %s, so not uploading a serving model', model_dir)
+    else:
+        versions[model+SERVING_SUFFIX], serving_size = upload_artifact(files)
+    store.update_manifest(versions)
+    # The local copy is what was uploaded, so it need not be fetched again
+    write_version(model, version)
+    logging.info('Successfully uploaded model %s as %s', model, version)
+    if serving_size is not None:
+        logging.info('Model is %i bytes, and %i bytes for serving (%.1f%% smaller)',
+                     size, serving_size, 100 - 100 * serving_size / size)
+    return size, serving_size
+
+def fetch_serving_model(model):
+    """ Fetches the serving artifact of the model, falling back to the
+        full model if none has been uploaded. """
+    try:
+        return fetch_model(model+SERVING_SUFFIX)
+    except Exception:
+        logging.warning('No serving model for %s, so fetching the full model', model)
+        return fetch_model(model)
 
 def fetch_race_model(load_model=True):
     """ Returns the race model. """
@@ -46,6 +357,26 @@ def fetch_qualifying_model(load_model=True):
         return fetch_model(QUALIFYING_MODEL)
     return FILE_DIR+QUALIFYING_MODEL
 
+def fetch_race_serving_model(load_model=True):
+    """ Returns the race model for serving. """
+    if load_model:
+        return fetch_serving_model(RACE_MODEL)
+    return FILE_DIR+RACE_MODEL
+
+def fetch_qualifying_serving_model(load_model=True):
+    """ Returns the qualifying model for serving. """
+    if load_model:
+        return fetch_serving_model(QUALIFYING_MODEL)
+    return FILE_DIR+QUALIFYING_MODEL
+
+def fetch_race_serving_model_version(version):
+    """ Returns the given version of the race model for serving. """
+    return fetch_model_version(RACE_MODEL+SERVING_SUFFIX, version)
+
+def fetch_qualifying_serving_model_version(version):
+    """ Returns the given version of the qualifying model for serving. """
+    return fetch_model_version(QUALIFYING_MODEL+SERVING_SUFFIX, version)
+
 def upload_race_model():
     """ Returns the race model. """
     return upload_model(RACE_MODEL)
@@ -55,15 +386,23 @@ def upload_qualifying_model():
     return upload_model(QUALIFYING_MODEL)
 
 def delete_model(model):
-    """ Delete the given model locally. """
-    if os.path.exists(FILE_DIR+model):
+    """ Delete the given model locally. Versions still being restored from
+        are left to be collected once they are no longer in use. """
+    if os.path.islink(FILE_DIR+model):
+        os.remove(FILE_DIR+model)
+    elif os.path.exists(FILE_DIR+model):
         shutil.rmtree(FILE_DIR+model)
+    if os.path.exists(version_path(model)):
+        os.remove(version_path(model))
+    collect_versions(model, 0)
 
 def delete_race_model():
     """ Delete the race model. """
     delete_model(RACE_MODEL)
+    delete_model(RACE_MODEL+SERVING_SUFFIX)
 
 def delete_qualifying_model():
     """ Delete the qualifying model. """
     delete_model(QUALIFYING_MODEL)
+    delete_model(QUALIFYING_MODEL+SERVING_SUFFIX)
 
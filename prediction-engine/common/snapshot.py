@@ -0,0 +1,110 @@
+""" Saves the assembled training sets as columnar snapshots on disk, keyed by
+    a watermark of the data they were built from. Training runs load the
+    snapshot memory mapped while the watermark is unchanged, and only query
+    the database once it has moved. """
+
+import os
+import json
+import shutil
+import hashlib
+import logging
+import numpy as np
+from .features import START_YEAR
+
+SNAPSHOT_DIR = os.getenv('DATASET_SNAPSHOT_DIR', '/tmp/snapshots/')
+SNAPSHOT_FORMAT = 1
+MANIFEST_FILE = 'manifest.json'
+LABELS = 'labels'
+
+def snapshot_path(kind, watermark):
+    """ Returns the directory of the snapshot of the given kind at the watermark. """
+    key = json.dumps([SNAPSHOT_FORMAT, watermark], sort_keys=True)
+    return os.path.join(SNAPSHOT_DIR, kind + '-' + hashlib.sha256(key.encode()).hexdigest()[:16])
+
+def to_column(values):
+    """ Converts object arrays of strings to fixed width unicode, so that
+        they can be saved without pickling and memory mapped. """
+    values = np.asarray(values)
+    if values.dtype == object:
+        return values.astype(str)
+    return values
+
+def remove_snapshots(kind, keep):
+    """ Removes every snapshot of the given kind except the one to keep. """
+    if not os.path.exists(SNAPSHOT_DIR):
+        return
+    for name in os.listdir(SNAPSHOT_DIR):
+        path = os.path.join(SNAPSHOT_DIR, name)
+        if name.startswith(kind + '-') and path != keep:
+            shutil.rmtree(path, ignore_errors=True)
+
+def save_snapshot(kind, watermark, features, labels):
+    """ Writes each column to its own .npy file alongside a manifest. The
+        snapshot is written to a temporary directory and renamed into place. """
+    path = snapshot_path(kind, watermark)
+    temporary_path = path + '.tmp'
+    shutil.rmtree(temporary_path, ignore_errors=True)
+    os.makedirs(temporary_path)
+
+    columns = dict(features)
+    columns[LABELS] = labels
+    manifest = {
+        'format': SNAPSHOT_FORMAT,
+        'kind': kind,
+        'watermark': watermark,
+        'rows': len(labels),
+        'columns': {}
+    }
+    for name, values in columns.items():
+        values = to_column(values)
+        np.save(os.path.join(temporary_path, name + '.npy'), values, allow_pickle=False)
+        manifest['columns'][name] = values.dtype.str
+    with open(os.path.join(temporary_path, MANIFEST_FILE), 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.rename(temporary_path, path)
+    remove_snapshots(kind, path)
+    logging.info('Saved %s dataset snapshot of %i rows to %s', kind, manifest['rows'], path)
+    return path
+
+def load_snapshot(kind, watermark):
+    """ Loads the snapshot for the watermark memory mapped, returning the
+        features and labels, or None if there is no matching snapshot. """
+    path = snapshot_path(kind, watermark)
+    try:
+        with open(os.path.join(path, MANIFEST_FILE)) as manifest_file:
+            manifest = json.load(manifest_file)
+    except (IOError, ValueError):
+        return None
+    if manifest['format'] != SNAPSHOT_FORMAT or manifest['watermark'] != watermark:
+        return None
+
+    # Empty files cannot be memory mapped
+    mmap_mode = 'r' if manifest['rows'] > 0 else None
+    columns = {
+        name: np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode, allow_pickle=False)
+        for name in manifest['columns']
+    }
+    logging.info('Loaded %s dataset snapshot of %i rows from %s', kind, manifest['rows'], path)
+    labels = columns.pop(LABELS)
+    return columns, labels
+
+def get_watermark(db):
+    """ Returns the watermark of the data the training sets are built from. """
+    watermark = db.get_dataset_watermark()
+    watermark['startYear'] = START_YEAR
+    return watermark
+
+def load_training_set(kind, db, build_training_set):
+    """ Returns the features and labels of the training set, loaded from the
+        snapshot if the data hasn't changed, or built and saved otherwise. """
+    watermark = get_watermark(db)
+    snapshot = load_snapshot(kind, watermark)
+    if snapshot is not None:
+        return snapshot
+
+    logging.info('No %s dataset snapshot for the current data, so building it', kind)
+    features, labels = build_training_set(db)
+    save_snapshot(kind, watermark, features, labels)
+    return features, labels
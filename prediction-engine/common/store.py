@@ -0,0 +1,186 @@
+""" Contains the model stores, which hold the model artifacts by content
+    hash along with a manifest of the current hash of each model. """
+
+import os
+import json
+import logging
+import tempfile
+from abc import ABC, abstractmethod
+from .transfer import RangeReader, MultipartWriter
+
+MODEL_STORE = os.getenv('MODEL_STORE', 's3')
+MODEL_STORE_DIR = os.getenv('MODEL_STORE_DIR', '/tmp/model_store/')
+BUCKET = os.getenv('S3_MODEL_BUCKET')
+MANIFEST = 'manifest.json'
+ARTIFACT_DIR = 'artifacts/'
+
+def artifact_key(version):
+    """ Returns the key of the artifact with the given content hash. """
+    return ARTIFACT_DIR+version+'.tar.gz'
+
+class ModelStore(ABC):
+    """ Base class for the model stores. Subclasses read and write
+        objects by key, and the manifest is kept on top of these. """
+
+    @abstractmethod
+    def size(self, key):
+        """ Returns the size of the object, or None if it does not exist. """
+
+    @abstractmethod
+    def open_read(self, key):
+        """ Returns a file-like object reading the object. """
+
+    @abstractmethod
+    def open_write(self, key):
+        """ Returns a file-like object writing the object, which is only
+            stored once closed without error. The number of bytes written
+            is available as size. """
+
+    @abstractmethod
+    def read_bytes(self, key):
+        """ Returns the contents of a small object, or None if it does not exist. """
+
+    @abstractmethod
+    def write_bytes(self, key, data):
+        """ Replaces the contents of a small object. """
+
+    def read_manifest(self):
+        """ Returns the current content hash of each model. """
+        manifest = self.read_bytes(MANIFEST)
+        if manifest is None:
+            return {}
+        return json.loads(manifest.decode('utf-8'))
+
+    def update_manifest(self, versions):
+        """ Sets the current content hash of the given models. """
+        manifest = self.read_manifest()
+        if all(manifest.get(model) == version for model, version in versions.items()):
+            return
+        manifest.update(versions)
+        self.write_bytes(MANIFEST, json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+        logging.debug('Updated model manifest to %s', str(manifest))
+
+class S3ModelStore(ModelStore):
+    """ Model store holding the objects in an S3 bucket. """
+
+    def __init__(self, bucket):
+        """ Constructor, creating the S3 client. """
+        import boto3
+
+        self.client = boto3.client('s3')
+        self.bucket = bucket
+
+    def is_missing(self, err):
+        """ Returns whether the client error is for an object that does not exist. """
+        return err.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound')
+
+    def size(self, key):
+        """ Returns the size of the object from its metadata, or None if it does not exist. """
+        from botocore.exceptions import ClientError
+
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=key)['ContentLength']
+        except ClientError as err:
+            if self.is_missing(err):
+                return None
+            raise
+
+    def open_read(self, key):
+        """ Returns a reader fetching ranges of the object, pinned to its current version. """
+        head = self.client.head_object(Bucket=self.bucket, Key=key)
+        return RangeReader(self.client, self.bucket, key, head['ETag'], head['ContentLength'])
+
+    def open_write(self, key):
+        """ Returns a writer streaming the object into a multipart upload. """
+        return MultipartWriter(self.client, self.bucket, key)
+
+    def read_bytes(self, key):
+        """ Returns the contents of the object, or None if it does not exist. """
+        from botocore.exceptions import ClientError
+
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=key)['Body'].read()
+        except ClientError as err:
+            if self.is_missing(err):
+                return None
+            raise
+
+    def write_bytes(self, key, data):
+        """ Replaces the object with the data in a single request. """
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=data)
+
+class LocalWriter:
+    """ Writes an object of the local store to a temporary file, which
+        replaces the object only once closed without error. """
+
+    def __init__(self, path):
+        """ Constructor, opening the temporary file beside the object. """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        handle, self.temporary_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        self.file = os.fdopen(handle, 'wb')
+        self.size = 0
+
+    def write(self, data):
+        """ Writes the data to the temporary file. """
+        self.size += len(data)
+        return self.file.write(data)
+
+    def __enter__(self):
+        """ Returns the writer. """
+        return self
+
+    def __exit__(self, exception_type, *args):
+        """ Replaces the object with the temporary file, or removes it on error. """
+        self.file.close()
+        if exception_type is None:
+            os.replace(self.temporary_path, self.path)
+        else:
+            os.remove(self.temporary_path)
+
+class LocalModelStore(ModelStore):
+    """ Model store holding the objects in a local directory, which
+        allows models to be synced without S3. """
+
+    def __init__(self, directory):
+        """ Constructor, taking the directory of the store. """
+        self.directory = directory
+
+    def path(self, key):
+        """ Returns the path of the object. """
+        return os.path.join(self.directory, key)
+
+    def size(self, key):
+        """ Returns the size of the file, or None if it does not exist. """
+        if os.path.exists(self.path(key)):
+            return os.path.getsize(self.path(key))
+        return None
+
+    def open_read(self, key):
+        """ Opens the file for reading. """
+        return open(self.path(key), 'rb')
+
+    def open_write(self, key):
+        """ Returns a writer replacing the file once closed. """
+        return LocalWriter(self.path(key))
+
+    def read_bytes(self, key):
+        """ Returns the contents of the file, or None if it does not exist. """
+        try:
+            with open(self.path(key), 'rb') as object_file:
+                return object_file.read()
+        except IOError:
+            return None
+
+    def write_bytes(self, key, data):
+        """ Replaces the file with the data. """
+        with self.open_write(key) as writer:
+            writer.write(data)
+
+def get_store():
+    """ Returns the model store set by MODEL_STORE. """
+    if MODEL_STORE == 'local':
+        return LocalModelStore(MODEL_STORE_DIR)
+    if MODEL_STORE == 's3':
+        return S3ModelStore(BUCKET)
+    raise ValueError('Unknown model store ' + MODEL_STORE)
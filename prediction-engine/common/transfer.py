@@ -0,0 +1,164 @@
+""" Streams model archives to and from S3, so that they are never written
+    to disk as a whole. Downloads are fetched as byte ranges in parallel and
+    uploads are sent as the parts of a multipart upload. """
+
+import os
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# S3 requires every part but the last of a multipart upload to be at least 5MB
+PART_SIZE = int(os.getenv('TRANSFER_PART_SIZE', str(8 * 1024 * 1024)))
+CONCURRENCY = int(os.getenv('TRANSFER_CONCURRENCY', '8'))
+
+class RangeReader:
+    """ File-like object reading an object from S3 in order, while the
+        following byte ranges are fetched in parallel. At most
+        concurrency ranges are held in memory at once. """
+
+    def __init__(self, client, bucket, key, etag, size):
+        """ Constructor, taking the object and the ETag of the version to read. """
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.etag = etag
+        self.ranges = deque(
+            (start, min(start + PART_SIZE, size) - 1) for start in range(0, size, PART_SIZE)
+        )
+        self.executor = ThreadPoolExecutor(max_workers=CONCURRENCY)
+        self.pending = deque()
+        self.chunk = b''
+        self.offset = 0
+
+    def fetch_range(self, start, end):
+        """ Fetches the given inclusive byte range. """
+        response = self.client.get_object(
+            Bucket=self.bucket,
+            Key=self.key,
+            Range='bytes=%i-%i' % (start, end),
+            IfMatch=self.etag
+        )
+        return response['Body'].read()
+
+    def schedule(self):
+        """ Starts fetching ranges until enough are in flight. """
+        while self.ranges and len(self.pending) < CONCURRENCY:
+            self.pending.append(self.executor.submit(self.fetch_range, *self.ranges.popleft()))
+
+    def read(self, size=-1):
+        """ Reads up to size bytes, or the rest of the object if size is negative. """
+        data = []
+        while size != 0:
+            if self.offset == len(self.chunk):
+                if not (self.pending or self.ranges):
+                    break
+                self.schedule()
+                self.chunk = self.pending.popleft().result()
+                self.offset = 0
+                self.schedule()
+            end = len(self.chunk) if size < 0 else min(len(self.chunk), self.offset + size)
+            data.append(self.chunk[self.offset:end])
+            if size > 0:
+                size -= end - self.offset
+            self.offset = end
+        return b''.join(data)
+
+    def close(self):
+        """ Cancels any ranges still being fetched. """
+        self.ranges.clear()
+        for future in self.pending:
+            future.cancel()
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class MultipartWriter:
+    """ File-like object writing an object to S3 as a multipart upload,
+        sending each part in the background once it is full. At most
+        concurrency parts are held in memory at once. """
+
+    def __init__(self, client, bucket, key):
+        """ Constructor, starting the multipart upload of the given key. """
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.upload_id = client.create_multipart_upload(Bucket=bucket, Key=key)['UploadId']
+        self.executor = ThreadPoolExecutor(max_workers=CONCURRENCY)
+        self.pending = deque()
+        self.parts = []
+        self.buffer = bytearray()
+        self.size = 0
+        self.etag = None
+
+    def upload_part(self, number, data):
+        """ Uploads a single part, returning its number and ETag. """
+        response = self.client.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=number,
+            Body=data
+        )
+        return {'PartNumber': number, 'ETag': response['ETag']}
+
+    def send(self, data):
+        """ Queues a part for upload, waiting if too many are in flight. """
+        while len(self.pending) >= CONCURRENCY:
+            self.parts.append(self.pending.popleft().result())
+        number = len(self.parts) + len(self.pending) + 1
+        self.pending.append(self.executor.submit(self.upload_part, number, data))
+
+    def write(self, data):
+        """ Buffers the data, sending it once a part is full. """
+        self.buffer.extend(data)
+        self.size += len(data)
+        while len(self.buffer) >= PART_SIZE:
+            self.send(bytes(self.buffer[:PART_SIZE]))
+            del self.buffer[:PART_SIZE]
+        return len(data)
+
+    def close(self):
+        """ Sends the remaining data and completes the upload. """
+        try:
+            if self.buffer or not (self.parts or self.pending):
+                self.send(bytes(self.buffer))
+                self.buffer = bytearray()
+            while self.pending:
+                self.parts.append(self.pending.popleft().result())
+            response = self.client.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self.upload_id,
+                MultipartUpload={'Parts': self.parts}
+            )
+            self.etag = response['ETag']
+        finally:
+            self.executor.shutdown(wait=True)
+
+    def abort(self):
+        """ Abandons the upload, so that no parts are left stored. """
+        for future in self.pending:
+            future.cancel()
+        self.pending.clear()
+        self.executor.shutdown(wait=True)
+        self.client.abort_multipart_upload(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id
+        )
+        logging.warning('Aborted upload of %s', self.key)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, *args):
+        if exception_type is not None:
+            self.abort()
+            return
+        try:
+            self.close()
+        except Exception:
+            self.abort()
+            raise
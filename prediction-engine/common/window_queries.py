@@ -0,0 +1,316 @@
+""" Window function versions of the rolling average queries, which require
+    MySQL 8. Rather than a subquery sorting the history of each driver for
+    every row returned, the history is numbered or averaged in one sort per
+    driver or team. The rows of each partition are ordered by race and then
+    ID, which matches the subqueries ordering by ID as long as IDs increase
+    with the race, as they do when results are inserted. """
+
+from .features import START_YEAR
+
+# The queries with window function versions, serving the latest averages
+# before a race, or building the training sets
+SERVING_QUERIES = [
+    'get_race_averages',
+    'get_race_averages_team',
+    'get_circuit_averages',
+    'get_circuit_averages_team',
+    'get_position_changes',
+    'get_position_changes_team',
+    'get_qualifying_form_with_drivers',
+    'get_qualifying_form_circuit',
+    'get_qualifying_form_average_team',
+    'get_qualifying_form_circuit_team'
+]
+
+TRAINING_QUERIES = [
+    'get_race_dataset_form',
+    'get_race_dataset_form_circuit',
+    'get_race_dataset_position_changes',
+    'get_race_dataset_position_changes_team',
+    'get_race_dataset_form_team',
+    'get_race_dataset_form_team_circuit',
+    'get_qualifying_dataset_form',
+    'get_qualifying_dataset_form_circuit',
+    'get_qualifying_dataset_form_team',
+    'get_qualifying_dataset_form_team_circuit'
+]
+
+# Columns of the tables the averages are read from
+RESULTS = {'table': 'results', 'id': 'resultId', 'latest': 'races'}
+QUALIFYING = {'table': 'qualifying', 'id': 'qualifyId', 'latest': 'qualifying'}
+
+RACE_TRAINING_ROWS = """
+            FROM races
+            INNER JOIN results ON results.raceId=races.raceId
+            INNER JOIN qualifying ON qualifying.raceId=results.raceId
+            AND qualifying.driverId=results.driverId
+            LEFT JOIN history ON history.id=results.resultId
+            WHERE raceTrained is FALSE AND evaluationRace is not TRUE
+                AND results.position IS NOT NULL AND results.position <= 20
+                AND races.year >= %s
+                AND results.grid <= 20
+                AND qualifying.bestSeconds IS NOT NULL
+            ORDER BY results.resultId ASC;"""
+
+QUALIFYING_TRAINING_ROWS = """
+            FROM races
+            INNER JOIN qualifying ON qualifying.raceId=races.raceId
+            LEFT JOIN history ON history.id=qualifying.qualifyId
+            WHERE qualifyingTrained is FALSE AND evaluationRace is not TRUE
+            AND races.year >= %s
+            AND qualifying.bestSeconds IS NOT NULL
+            ORDER BY qualifying.qualifyId ASC;"""
+
+def latest_average_query(source, partition, value, count, conditions, circuit=False,
+                         columns=None, joins=''):
+    """ Returns the query averaging the value over the last count rows of each
+        driver or team, up to and including the latest race before the given
+        race, for every row of that race. With circuit set, only races at the
+        circuit of the given race are averaged. """
+    table = source['table']
+    if source['id'] == 'qualifyId':
+        order = 'qualifying1.qualifyId DESC'
+    else:
+        order = '%s1.raceId DESC, %s1.%s DESC' % (table, table, source['id'])
+    circuit_join = ''
+    if circuit:
+        circuit_join = """
+                INNER JOIN races races1 ON races1.raceId={table}1.raceId
+                    AND races1.circuitId=(SELECT circuitId FROM races WHERE raceId = %s)""".format(
+                        table=table
+                    )
+    return """
+            WITH latest AS (
+                SELECT MAX(raceId) AS raceId
+                FROM {latest}
+                WHERE raceId < %s
+            ),
+            history AS (
+                SELECT
+                    {table}1.{partition} AS partitionId,
+                    {value} AS value,
+                    ROW_NUMBER() OVER (
+                        PARTITION BY {table}1.{partition}
+                        ORDER BY {order}
+                    ) AS recent
+                FROM {table} {table}1
+                INNER JOIN latest ON {table}1.raceId <= latest.raceId{circuit_join}
+                WHERE {conditions}
+            ),
+            averages AS (
+                SELECT partitionId, AVG(value) AS avg
+                FROM history
+                WHERE recent <= {count}
+                GROUP BY partitionId
+            )
+            SELECT {columns}
+            FROM {table}
+            INNER JOIN latest ON {table}.raceId=latest.raceId
+            LEFT JOIN averages ON averages.partitionId={table}.{partition}{joins};""".format(
+                latest=source['latest'], table=table, partition=partition, value=value,
+                order=order, circuit_join=circuit_join, conditions=' AND '.join(conditions),
+                count=count, columns=columns or table + '.driverId, averages.avg', joins=joins
+            )
+
+def training_average_query(source, partition, value, count, conditions, training_rows,
+                           circuit=False):
+    """ Returns the query averaging the value over the last count rows of each
+        driver or team before the race of every training row. The average of
+        the count rows up to each row is found in one pass, then the average
+        up to the row before each race is given to every row of the race. """
+    table = source['table']
+    partitions = ['%s1.%s' % (table, partition)]
+    circuit_join = ''
+    if circuit:
+        partitions.append('races1.circuitId')
+        circuit_join = """
+                INNER JOIN races races1 ON races1.raceId={table}1.raceId""".format(table=table)
+    return """
+            WITH running AS (
+                SELECT
+                    {table}1.{id} AS id,
+                    {table}1.raceId,
+                    {partition_columns},
+                    AVG({value}) OVER (
+                        PARTITION BY {partitions}
+                        ORDER BY {table}1.raceId, {table}1.{id}
+                        ROWS BETWEEN {preceding} PRECEDING AND CURRENT ROW
+                    ) AS avg
+                FROM {table} {table}1{circuit_join}
+                WHERE {conditions}
+            ),
+            previous AS (
+                SELECT
+                    id,
+                    raceId,
+                    {aliases},
+                    LAG(avg) OVER (PARTITION BY {aliases} ORDER BY raceId, id) AS avg
+                FROM running
+            ),
+            history AS (
+                SELECT
+                    id,
+                    FIRST_VALUE(avg) OVER (PARTITION BY {aliases}, raceId ORDER BY id) AS avg
+                FROM previous
+            )
+            SELECT history.avg""".format(
+                table=table, id=source['id'], value=value, preceding=count - 1,
+                partitions=', '.join(partitions), circuit_join=circuit_join,
+                conditions=' AND '.join(conditions),
+                partition_columns=', '.join(
+                    '%s AS partition%i' % (column, index) for index, column in enumerate(partitions)
+                ),
+                aliases=', '.join('partition%i' % index for index in range(len(partitions)))
+            ) + training_rows
+
+POSITION = 'results1.position'
+POSITION_CHANGE = 'results1.grid-results1.position'
+DELTA = 'qualifying1.deltaToPole'
+FINISHED = ['results1.position IS NOT NULL']
+FINISHED_FROM_GRID = ['results1.position IS NOT NULL', 'results1.grid IS NOT NULL']
+SET_LAP = ['qualifying1.bestSeconds IS NOT NULL']
+
+class WindowQueries:
+    """ Overrides the rolling average queries of the database with window
+        function versions, returning the same rows. """
+
+    def fetch_all(self, query, params):
+        """ Runs the query as a prepared statement, returning every row. """
+        cursor = self.query(query, params, prepared=True)
+        result = cursor.fetchall()
+        cursor.close()
+        return result
+
+    def get_race_averages(self, race):
+        """ Fetches the last averages for each driver. """
+        return self.fetch_all(
+            latest_average_query(RESULTS, 'driverId', POSITION, 3, FINISHED), (race,)
+        )
+
+    def get_race_averages_team(self, race):
+        """ Fetches the last averages for each driver based on team. """
+        return self.fetch_all(
+            latest_average_query(RESULTS, 'constructorId', POSITION, 6, FINISHED), (race,)
+        )
+
+    def get_circuit_averages(self, race):
+        """ Fetches averages for driver at this circuit. """
+        return self.fetch_all(
+            latest_average_query(RESULTS, 'driverId', POSITION, 3, FINISHED, circuit=True),
+            (race, race)
+        )
+
+    def get_circuit_averages_team(self, race):
+        """ Fetches averages for driver at this circuit per team. """
+        return self.fetch_all(
+            latest_average_query(RESULTS, 'constructorId', POSITION, 6, FINISHED, circuit=True),
+            (race, race)
+        )
+
+    def get_position_changes(self, race):
+        """ Fetches the last averages for each driver. """
+        return self.fetch_all(
+            latest_average_query(RESULTS, 'driverId', POSITION_CHANGE, 3, FINISHED_FROM_GRID),
+            (race,)
+        )
+
+    def get_position_changes_team(self, race):
+        """ Fetches the position change averages for the team. """
+        return self.fetch_all(
+            latest_average_query(RESULTS, 'constructorId', POSITION_CHANGE, 6, FINISHED),
+            (race,)
+        )
+
+    def get_qualifying_form_with_drivers(self, race_id):
+        """ Gets the pace averages for the qualifying at the given race. """
+        return self.fetch_all(
+            latest_average_query(
+                QUALIFYING, 'driverId', DELTA, 3, SET_LAP,
+                columns='drivers.*, constructors.constructorRef, '
+                        'constructors.constructorId, averages.avg',
+                joins="""
+            INNER JOIN drivers ON drivers.driverId = qualifying.driverId
+            INNER JOIN constructors ON constructors.constructorId=qualifying.constructorId"""
+            ),
+            (race_id,)
+        )
+
+    def get_qualifying_form_circuit(self, race_id):
+        """ Gets the pace averages at the circuit for the qualifying at the given race. """
+        return self.fetch_all(
+            latest_average_query(QUALIFYING, 'driverId', DELTA, 3, SET_LAP, circuit=True),
+            (race_id, race_id)
+        )
+
+    def get_qualifying_form_average_team(self, race_id):
+        """ Gets the pace averages for the team for the qualifying at the given race. """
+        return self.fetch_all(
+            latest_average_query(QUALIFYING, 'constructorId', DELTA, 6, SET_LAP), (race_id,)
+        )
+
+    def get_qualifying_form_circuit_team(self, race_id):
+        """ Gets the circuit pace averages for the team for the qualifying at the given race. """
+        return self.fetch_all(
+            latest_average_query(QUALIFYING, 'constructorId', DELTA, 6, SET_LAP, circuit=True),
+            (race_id, race_id)
+        )
+
+    def get_race_dataset_form(self):
+        """ Gets the form averages for the training set. """
+        return self.fetch_all(training_average_query(
+            RESULTS, 'driverId', POSITION, 3, FINISHED, RACE_TRAINING_ROWS
+        ), (START_YEAR,))
+
+    def get_race_dataset_form_circuit(self):
+        """ Gets the circuit averages for the training set. """
+        return self.fetch_all(training_average_query(
+            RESULTS, 'driverId', POSITION, 3, FINISHED, RACE_TRAINING_ROWS, circuit=True
+        ), (START_YEAR,))
+
+    def get_race_dataset_position_changes(self):
+        """ Gets the position changes for the training set. """
+        return self.fetch_all(training_average_query(
+            RESULTS, 'driverId', POSITION_CHANGE, 3, FINISHED_FROM_GRID, RACE_TRAINING_ROWS
+        ), (START_YEAR,))
+
+    def get_race_dataset_position_changes_team(self):
+        """ Gets the position changes for the team for the training set. """
+        return self.fetch_all(training_average_query(
+            RESULTS, 'constructorId', POSITION_CHANGE, 6, FINISHED, RACE_TRAINING_ROWS
+        ), (START_YEAR,))
+
+    def get_race_dataset_form_team(self):
+        """ Gets the form averages for the team for the training set. """
+        return self.fetch_all(training_average_query(
+            RESULTS, 'constructorId', POSITION, 6, FINISHED, RACE_TRAINING_ROWS
+        ), (START_YEAR,))
+
+    def get_race_dataset_form_team_circuit(self):
+        """ Gets the circuit form averages for the team for the training set. """
+        return self.fetch_all(training_average_query(
+            RESULTS, 'constructorId', POSITION, 6, FINISHED, RACE_TRAINING_ROWS, circuit=True
+        ), (START_YEAR,))
+
+    def get_qualifying_dataset_form(self):
+        """ Gets the pace averages for the qualifying training set. """
+        return self.fetch_all(training_average_query(
+            QUALIFYING, 'driverId', DELTA, 3, SET_LAP, QUALIFYING_TRAINING_ROWS
+        ), (START_YEAR,))
+
+    def get_qualifying_dataset_form_circuit(self):
+        """ Gets the pace averages at the particular circuit for the qualifying training set. """
+        return self.fetch_all(training_average_query(
+            QUALIFYING, 'driverId', DELTA, 3, SET_LAP, QUALIFYING_TRAINING_ROWS, circuit=True
+        ), (START_YEAR,))
+
+    def get_qualifying_dataset_form_team(self):
+        """ Gets the pace averages for the team for the qualifying training set. """
+        return self.fetch_all(training_average_query(
+            QUALIFYING, 'constructorId', DELTA, 6, SET_LAP, QUALIFYING_TRAINING_ROWS
+        ), (START_YEAR,))
+
+    def get_qualifying_dataset_form_team_circuit(self):
+        """ Gets the circuit pace averages for the team for the qualifying training set. """
+        return self.fetch_all(training_average_query(
+            QUALIFYING, 'constructorId', DELTA, 6, SET_LAP, QUALIFYING_TRAINING_ROWS, circuit=True
+        ), (START_YEAR,))
@@ -2,7 +2,7 @@
 
 import logging
 from flask import Flask
-from .predict import qualifying_prediction, race_prediction
+from .predict import qualifying_prediction, race_prediction, model_status
 from .info import (season_calendar, drivers_championship, constructors_championship,
                    race_results, qualifying_results)
 from ..common.db import Database
@@ -36,4 +36,6 @@ application.add_url_rule('/info/results/race/<int:race>', None, race_results)
 application.add_url_rule('/info/results/qualifying', None, qualifying_results)
 application.add_url_rule('/info/results/qualifying/<int:race>', None, qualifying_results)
 
+application.add_url_rule('/status', None, model_status)
+
 application.add_url_rule('/', None, lambda: 'Ok')
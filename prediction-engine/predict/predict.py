@@ -1,37 +1,70 @@
 """ The controllers for the prediction routes. """
 import logging
 import traceback
-from flask import abort, jsonify
+from flask import abort, jsonify, request
 from ..common.qualifying import predict as qualifying_predict
 from ..common.race import predict as race_predict
 from ..common.utils import ranking_to_dictionary
+from ..common.inference import inference_pool
+from ..common.models import race_model, qualifying_model, ModelVersionNotFound
 
 def qualifying_prediction(race_id=None):
-    """ The /predict/qualifying controller. """
+    """ The /predict/qualifying controller, optionally taking the model
+        version to use as the model query parameter. """
     try:
-        ranking, race_name, race_year, race_id = qualifying_predict(race_id)
+        model_version = request.args.get('model')
+        if model_version is not None:
+            # Load the version first, so an unknown version is found before any work
+            qualifying_model.load_version(model_version)
+        ranking, race_name, race_year, race_id = qualifying_predict(
+            race_id, model_version=model_version
+        )
         return jsonify({
             'name': race_name,
             'year': race_year,
             'id': race_id,
+            'model_version': model_version or qualifying_model.model_version(),
             'result': ranking_to_dictionary(ranking)
         })
+    except ModelVersionNotFound as err:
+        logging.error('Model version not found: %s', str(err))
+        abort(404, description="Model version not found")
     except Exception as err:
         logging.error('An error occurred retrieving qualifying prediction: %s', str(err))
         logging.debug(traceback.format_exc())
         abort(500, description="Internal Server Error")
 
 def race_prediction(race_id=None):
-    """ The /predict/race controller. """
+    """ The /predict/race controller, optionally taking the model
+        version to use as the model query parameter. """
     try:
-        ranking, race_name, race_year, race_id = race_predict(race_id)
+        model_version = request.args.get('model')
+        if model_version is not None:
+            # Load the version first, so an unknown version is found before any work
+            race_model.load_version(model_version)
+        ranking, race_name, race_year, race_id = race_predict(
+            race_id, model_version=model_version
+        )
         return jsonify({
             'name': race_name,
             'year': race_year,
             'id': race_id,
+            'model_version': model_version or race_model.model_version(),
             'result': ranking_to_dictionary(ranking)
         })
+    except ModelVersionNotFound as err:
+        logging.error('Model version not found: %s', str(err))
+        abort(404, description="Model version not found")
     except Exception as err:
         logging.error('An error occurred retrieving race prediction: %s', str(err))
         logging.debug(traceback.format_exc())
         abort(500, description="Internal Server Error")
+
+def model_status():
+    """ The /status controller, reporting the loaded version of each model
+        and the load on the inference pool. """
+    return jsonify({
+        'race_model': race_model.status(),
+        'qualifying_model': qualifying_model.status(),
+        'inference': inference_pool.metrics()
+    })
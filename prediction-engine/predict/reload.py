@@ -0,0 +1,35 @@
+""" Reloads the models in the background, so that new versions are picked
+    up within an interval of being uploaded, without restarting. """
+
+import os
+import logging
+import traceback
+import gevent
+from ..common.models import race_model, qualifying_model
+
+RELOAD_INTERVAL = int(os.getenv('MODEL_RELOAD_INTERVAL', '30'))
+
+def refresh_models():
+    """ Refreshes each model in a thread of the hub's pool, so that fetching
+        and loading never blocks the requests being served. """
+    for model in [race_model, qualifying_model]:
+        try:
+            gevent.get_hub().threadpool.apply(model.refresh)
+            model.reloading = True
+        except Exception as err:
+            logging.error('An error occurred reloading the model: %s', str(err))
+            logging.debug(traceback.format_exc())
+
+def reload_models():
+    """ Refreshes the models on each interval. """
+    while True:
+        refresh_models()
+        gevent.sleep(RELOAD_INTERVAL)
+
+def start_reloading():
+    """ Starts the reload greenlet, unless the interval is not positive. """
+    if RELOAD_INTERVAL <= 0:
+        logging.info("Model reloading is disabled")
+        return None
+    logging.info("Reloading models every %i seconds", RELOAD_INTERVAL)
+    return gevent.spawn(reload_models)
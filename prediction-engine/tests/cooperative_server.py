@@ -0,0 +1,24 @@
+""" Serves the prediction API for the cooperative I/O tests, with every
+    calendar query made slow. Run as a module, taking the port to serve on
+    and the seconds each calendar request waits on the database. """
+from ..common.cooperative import patch_io
+patch_io()
+
+import sys
+from gevent.pywsgi import WSGIServer
+from ..common.db import Database
+from ..predict.app import application
+
+db = Database.get_database()
+get_calendar = db.get_calendar
+
+def slow_get_calendar(year):
+    """ Waits on the database before fetching the calendar. """
+    cursor = db.query("SELECT SLEEP(%s);", (float(sys.argv[2]),))
+    cursor.fetchall()
+    cursor.close()
+    return get_calendar(year)
+
+db.get_calendar = slow_get_calendar
+
+WSGIServer(('127.0.0.1', int(sys.argv[1])), application, log=None).serve_forever()
@@ -0,0 +1,98 @@
+""" Tests the cooperative I/O mode of the servers """
+
+import os
+import sys
+import time
+import socket
+import subprocess
+import unittest
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import mysql.connector as mysql
+
+from .utils import *
+
+SQL_USER = os.getenv('MYSQL_USER')
+SQL_PASSWORD = os.getenv('MYSQL_PASSWORD')
+SQL_HOST = os.getenv('MYSQL_HOST')
+SQL_DATABASE = os.getenv('MYSQL_DB')
+
+# Number of requests made at once, and the seconds each waits on the database
+REQUESTS = 5
+QUERY_DELAY = 0.5
+
+db = mysql.connection.MySQLConnection(
+    user=SQL_USER,
+    password=SQL_PASSWORD,
+    host=SQL_HOST,
+    database=SQL_DATABASE
+)
+db.autocommit = True
+
+def free_port():
+    """ Returns a port which is not in use. """
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+class TestCooperative(unittest.TestCase):
+    """ Tests class. """
+
+    def setUp(self):
+        truncate_table(db, 'races')
+        truncate_table(db, 'circuits')
+        insert_initial_circuit_data(db)
+        insert_initial_data(db, 2018, 1, 'First GP')
+
+    def start_server(self, cooperative):
+        """ Starts the server in a new process, returning its URL once it accepts connections. """
+        port = free_port()
+        environment = dict(
+            os.environ,
+            COOPERATIVE_IO='true' if cooperative else 'false',
+            MYSQL_POOL_SIZE=str(REQUESTS)
+        )
+        server = subprocess.Popen(
+            [sys.executable, '-m', __package__+'.cooperative_server', str(port), str(QUERY_DELAY)],
+            cwd=os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+            env=environment
+        )
+        self.addCleanup(server.wait)
+        self.addCleanup(server.kill)
+        deadline = time.time() + 60
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                break
+            except OSError:
+                if server.poll() is not None or time.time() > deadline:
+                    self.fail('Server did not start')
+                time.sleep(0.1)
+        return 'http://127.0.0.1:%i/info/calendar' % port
+
+    def time_requests(self, url):
+        """ Makes the requests at once, returning the seconds taken by all of them. """
+        def get(_):
+            with urllib.request.urlopen(url, timeout=60) as response:
+                return response.status
+
+        # Warm up the server, so that the connections are opened first
+        with ThreadPoolExecutor(max_workers=REQUESTS) as executor:
+            list(executor.map(get, range(REQUESTS)))
+            start = time.time()
+            statuses = list(executor.map(get, range(REQUESTS)))
+        self.assertEqual(statuses, [200] * REQUESTS)
+        return time.time() - start
+
+    def test_requests_run_concurrently(self):
+        """ Tests that slow requests finish in roughly the time of one. """
+        elapsed = self.time_requests(self.start_server(True))
+        self.assertLess(elapsed, QUERY_DELAY * 2)
+
+    def test_requests_block_without_cooperative_io(self):
+        """ Tests that the requests run one at a time when not cooperative. """
+        elapsed = self.time_requests(self.start_server(False))
+        self.assertGreaterEqual(elapsed, QUERY_DELAY * REQUESTS)
+
+if __name__ == '__main__':
+    unittest.main()
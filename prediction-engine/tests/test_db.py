@@ -0,0 +1,243 @@
+""" Tests the database connection pool """
+
+import unittest
+from unittest import mock
+import numpy as np
+import mysql.connector as mysql
+
+from ..common import db as db_module
+from ..common.db import Database, ConnectionPool, PreparedCursor
+
+class TestConnectionPool(unittest.TestCase):
+    """ Tests class. """
+
+    def setUp(self):
+        self.database = Database.get_database()
+        self.original_pool = self.database.pool
+        self.database.pool = ConnectionPool(self.database.connect, size=2, timeout=0.5)
+
+    def tearDown(self):
+        self.database.pool = self.original_pool
+
+    def connection_id(self):
+        """ Returns the ID of the connection a query runs on. """
+        cursor = self.database.query("SELECT CONNECTION_ID();")
+        result = cursor.fetchone()[0]
+        cursor.close()
+        return result
+
+    def test_connection_returned_on_close(self):
+        """ Check a connection is reused once its cursor is closed. """
+        first = self.connection_id()
+        self.assertEqual(self.connection_id(), first)
+
+    def test_checkout_timeout(self):
+        """ Check a checkout fails once the pool is exhausted for the timeout. """
+        cursors = [self.database.query("SELECT 1;") for _ in range(2)]
+        with self.assertRaises(mysql.errors.PoolError):
+            self.database.query("SELECT 1;")
+        for cursor in cursors:
+            cursor.fetchall()
+            cursor.close()
+        self.connection_id()
+
+    def test_concurrent_cursors_use_separate_connections(self):
+        """ Check cursors open at the same time do not share a connection. """
+        first = self.database.query("SELECT CONNECTION_ID();")
+        second = self.database.query("SELECT CONNECTION_ID();")
+        self.assertNotEqual(first.fetchone()[0], second.fetchone()[0])
+        first.close()
+        second.close()
+
+    def test_session_uses_one_connection(self):
+        """ Check queries in a session share a connection. """
+        with self.database.session():
+            self.assertEqual(self.connection_id(), self.connection_id())
+            cursor = self.database.query("SELECT 1;")
+            cursor.fetchall()
+            cursor.close()
+
+    def test_dropped_connection_is_replaced(self):
+        """ Check a connection killed while idle is replaced on checkout. """
+        first = self.connection_id()
+        killer = self.database.connect()
+        cursor = killer.cursor()
+        cursor.execute("KILL CONNECTION %s;", (first,))
+        cursor.close()
+        killer.close()
+        with mock.patch.object(db_module, 'POOL_HEALTH_CHECK_IDLE', -1):
+            self.assertNotEqual(self.connection_id(), first)
+
+    def test_dropped_connection_is_reconnected(self):
+        """ Check a query on a dropped connection reconnects, without a health check. """
+        first = self.connection_id()
+        killer = self.database.connect()
+        cursor = killer.cursor()
+        cursor.execute("KILL CONNECTION %s;", (first,))
+        cursor.close()
+        killer.close()
+        with mock.patch.object(db_module, 'POOL_HEALTH_CHECK_IDLE', 3600):
+            self.assertNotEqual(self.connection_id(), first)
+
+class TestQueryColumns(unittest.TestCase):
+    """ Tests class. """
+
+    query = """
+        SELECT 1, 1.5, 'first'
+        UNION ALL SELECT NULL, NULL, NULL
+        UNION ALL SELECT 3, 2.25, 'third';"""
+
+    def setUp(self):
+        self.database = Database.get_database()
+
+    def test_columns_and_nulls(self):
+        """ Check each column is typed, with NULL values masked. """
+        (ids, id_nulls), (values, value_nulls), (names, name_nulls) = (
+            self.database.query_columns(self.query, dtypes=[np.int64, float, object])
+        )
+        self.assertEqual(ids.dtype, np.int64)
+        self.assertEqual(list(ids), [1, 0, 3])
+        self.assertEqual(list(id_nulls), [False, True, False])
+        self.assertEqual(list(values), [1.5, 0.0, 2.25])
+        self.assertEqual(list(value_nulls), [False, True, False])
+        self.assertEqual(list(names), ['first', None, 'third'])
+        self.assertEqual(list(name_nulls), [False, True, False])
+
+    def test_rows_streamed_in_chunks(self):
+        """ Check rows over several chunks are all read. """
+        with mock.patch.object(db_module, 'FETCH_CHUNK_SIZE', 2):
+            (ids, id_nulls), _, _ = self.database.query_columns(
+                self.query, dtypes=[np.int64, float, object]
+            )
+        self.assertEqual(list(ids), [1, 0, 3])
+        self.assertEqual(list(id_nulls), [False, True, False])
+
+    def test_wrong_number_of_dtypes(self):
+        """ Check the dtypes must match the columns, and the connection is reusable. """
+        with self.assertRaises(ValueError):
+            self.database.query_columns(self.query, dtypes=[np.int64])
+        self.assertEqual(len(self.database.query_columns("SELECT 1;", dtypes=[np.int64])[0][0]), 1)
+
+class TestPreparedStatements(unittest.TestCase):
+    """ Tests class. """
+
+    def setUp(self):
+        self.database = Database.get_database()
+
+    def fetch(self, *args, **kwargs):
+        """ Returns the first row of the query. """
+        cursor = self.database.query(*args, **kwargs)
+        result = cursor.fetchall()[0]
+        cursor.close()
+        return result
+
+    def statements_prepared(self):
+        """ Returns the number of statements prepared by the connection. """
+        return int(self.fetch("SHOW SESSION STATUS LIKE 'Com_stmt_prepare';")[1])
+
+    def test_statement_prepared_once(self):
+        """ Check a statement is prepared once per connection, and returns
+            the same result as the text query. """
+        with self.database.session():
+            before = self.statements_prepared()
+            for value in range(3):
+                self.assertEqual(
+                    self.fetch("SELECT %s + 1, 'name';", (value,), prepared=True),
+                    self.fetch("SELECT %s + 1, 'name';", (value,))
+                )
+            self.assertEqual(self.statements_prepared() - before, 1)
+
+    def test_statement_prepared_after_reconnect(self):
+        """ Check statements are prepared again on a connection which reconnected. """
+        self.assertEqual(self.fetch("SELECT %s + 1;", (1,), prepared=True), (2,))
+        connection_id = self.fetch("SELECT CONNECTION_ID();")[0]
+        killer = self.database.connect()
+        cursor = killer.cursor()
+        cursor.execute("KILL CONNECTION %s;", (connection_id,))
+        cursor.close()
+        killer.close()
+        with mock.patch.object(db_module, 'POOL_HEALTH_CHECK_IDLE', -1):
+            self.assertEqual(self.fetch("SELECT %s + 1;", (2,), prepared=True), (3,))
+
+    def test_prepared_statements_disabled(self):
+        """ Check prepared queries run as text queries when disabled. """
+        with self.database.session(), mock.patch.object(db_module, 'PREPARED_STATEMENTS', False):
+            before = self.statements_prepared()
+            self.assertEqual(self.fetch("SELECT %s + 1;", (1,), prepared=True), (2,))
+            self.assertEqual(self.statements_prepared(), before)
+
+class TestPreparedCursorInternals(unittest.TestCase):
+    """ Tests the private MySQLCursorPrepared attributes PreparedCursor relies
+        on, against a mocked connection, so that a connector upgrade which
+        changes them fails here rather than preparing every query again. """
+
+    def setUp(self):
+        self.connection = mock.create_autospec(
+            mysql.connection.MySQLConnection, instance=True
+        )
+        self.connection.charset = 'utf8'
+        self.connection.connection_id = 1
+        self.connection.cmd_stmt_prepare.side_effect = lambda operation: {
+            'statement_id': self.connection.cmd_stmt_prepare.call_count,
+            'parameters': [None],
+            'columns': []
+        }
+        self.connection.cmd_stmt_execute.return_value = {
+            'affected_rows': 0, 'insert_id': 0, 'warning_count': 0, 'status_flag': 0
+        }
+
+    def execute(self, sql, params):
+        """ Executes the statement on a new cursor, which is then closed. """
+        cursor = PreparedCursor(self.connection)
+        cursor.execute(sql, params)
+        cursor.close()
+
+    def test_statement_reused_across_cursors(self):
+        """ Check the statement is prepared once, and left open by closed cursors. """
+        self.execute("SELECT %s;", (1,))
+        self.execute("SELECT %s;", (2,))
+        self.connection.cmd_stmt_prepare.assert_called_once_with(b"SELECT ?;")
+        self.assertEqual(
+            [call[0][0] for call in self.connection.cmd_stmt_execute.call_args_list], [1, 1]
+        )
+        self.connection.cmd_stmt_close.assert_not_called()
+
+    def test_new_statement_prepared(self):
+        """ Check each statement is prepared separately. """
+        self.execute("SELECT %s;", (1,))
+        self.execute("SELECT %s + 1;", (1,))
+        self.assertEqual(self.connection.cmd_stmt_prepare.call_count, 2)
+        self.assertEqual(
+            [call[0][0] for call in self.connection.cmd_stmt_execute.call_args_list], [1, 2]
+        )
+
+class TestFeatureReplacement(unittest.TestCase):
+    """ Tests class. """
+
+    def setUp(self):
+        self.database = Database.get_database()
+        cursor = self.database.query("DELETE FROM raceFeatures WHERE raceId = 1;")
+        cursor.close()
+
+    def race_features(self):
+        """ Returns the drivers with materialized features for the race. """
+        cursor = self.database.query(
+            "SELECT driverId FROM raceFeatures WHERE raceId = 1 ORDER BY driverId;"
+        )
+        result = [row[0] for row in cursor.fetchall()]
+        cursor.close()
+        return result
+
+    def test_failed_replacement_keeps_features(self):
+        """ Check the features of a race are kept if replacing them fails. """
+        self.database.replace_race_features(1, [(1,) + (0,) * 7, (2,) + (0,) * 7])
+        self.assertEqual(self.race_features(), [1, 2])
+        # The repeated driver breaks the primary key, after the old rows are deleted
+        with self.assertRaises(mysql.Error):
+            self.database.replace_race_features(1, [(3,) + (0,) * 7, (3,) + (0,) * 7])
+        self.assertEqual(self.race_features(), [1, 2])
+        self.database.replace_race_features(1, [(3,) + (0,) * 7])
+        self.assertEqual(self.race_features(), [3])
+
+if __name__ == '__main__':
+    unittest.main()
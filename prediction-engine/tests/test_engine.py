@@ -0,0 +1,107 @@
+""" Tests the NumPy inference engine against the TensorFlow Estimators """
+
+import unittest
+import tempfile
+import numpy as np
+import tensorflow as tf
+
+from ..common.engine import (NumpyModel, hash_bucket, RACE_NUMERIC_FEATURES,
+                             QUALIFYING_NUMERIC_FEATURES, HASH_BUCKET_SIZES)
+from ..common.models import build_feature_columns, train_model, dataset_input_fn
+from ..common.export import export_race_model, export_qualifying_model
+
+RACES = ['australian', 'bahrain', 'chinese', 'abu dhabi', '']
+DRIVERS = ['hamilton', 'bottas', 'max_verstappen', 'vettel', 'leclerc']
+CONSTRUCTORS = ['mercedes', 'red_bull', 'ferrari', 'mclaren']
+
+def generate_features(numeric_features, rows=20):
+    """ Generates random features for the given columns. """
+    random = np.random.RandomState(0)
+    features = {key: random.uniform(-5, 20, rows) for key in numeric_features}
+    features['race'] = np.array([RACES[index % len(RACES)] for index in range(rows)])
+    features['driver'] = np.array([DRIVERS[index % len(DRIVERS)] for index in range(rows)])
+    features['constructor'] = np.array([
+        CONSTRUCTORS[index % len(CONSTRUCTORS)] for index in range(rows)
+    ])
+    return features
+
+def estimator_predictions(model, features):
+    """ Runs the features through Estimator.predict. """
+    input_fn = tf.estimator.inputs.numpy_input_fn(x=features, num_epochs=1, shuffle=False)
+    return list(model.predict(input_fn=input_fn))
+
+class TestEngine(unittest.TestCase):
+    """ Tests class. """
+
+    def test_hash_bucket(self):
+        """ Test hash buckets match TensorFlow. """
+        strings = RACES + DRIVERS + CONSTRUCTORS + ['a' * 17, 'b' * 40, 'c' * 100, 'é']
+        with tf.Session() as session:
+            for size in HASH_BUCKET_SIZES.values():
+                expected = session.run(tf.strings.to_hash_bucket_fast(strings, size))
+                self.assertEqual(
+                    [hash_bucket(string, size) for string in strings],
+                    expected.tolist()
+                )
+
+    def test_dataset_input_fn(self):
+        """ Test the streamed input yields every row once per epoch. """
+        features = generate_features(QUALIFYING_NUMERIC_FEATURES, rows=2500)
+        labels = np.arange(2500, dtype=float)
+        dataset = dataset_input_fn(features, labels, 2, 100)()
+        batch = tf.data.make_one_shot_iterator(dataset).get_next()
+        seen = []
+        with tf.Session() as session:
+            try:
+                while True:
+                    batch_features, batch_labels = session.run(batch)
+                    self.assertEqual(batch_features['driver'].dtype, object)
+                    seen.extend(batch_labels.tolist())
+            except tf.errors.OutOfRangeError:
+                pass
+        self.assertEqual(sorted(seen), sorted(labels.tolist() * 2))
+
+    def test_race_model_parity(self):
+        """ Test race classifier probabilities match the Estimator. """
+        features = generate_features(RACE_NUMERIC_FEATURES)
+        labels = np.array([str((index % 20) + 1) for index in range(20)])
+        model = tf.estimator.DNNClassifier(
+            model_dir=tempfile.mkdtemp(),
+            hidden_units=[50, 50],
+            feature_columns=build_feature_columns(RACE_NUMERIC_FEATURES),
+            n_classes=20,
+            label_vocabulary=[str(i) for i in range(1, 21)]
+        )
+        train_model(model, features, labels, 5, 5)
+
+        expected = estimator_predictions(model, features)
+        result = NumpyModel(export_race_model(model.model_dir))(features)
+
+        np.testing.assert_allclose(
+            result['probabilities'],
+            np.array([row['probabilities'] for row in expected]),
+            rtol=1e-5, atol=1e-6
+        )
+
+    def test_qualifying_model_parity(self):
+        """ Test qualifying regressor predictions match the Estimator. """
+        features = generate_features(QUALIFYING_NUMERIC_FEATURES)
+        labels = np.random.RandomState(1).uniform(0, 3, 20)
+        model = tf.estimator.DNNRegressor(
+            model_dir=tempfile.mkdtemp(),
+            hidden_units=[20, 20],
+            feature_columns=build_feature_columns(QUALIFYING_NUMERIC_FEATURES)
+        )
+        train_model(model, features, labels, 5, 5)
+
+        expected = estimator_predictions(model, features)
+        result = NumpyModel(export_qualifying_model(model.model_dir))(features)
+
+        np.testing.assert_allclose(
+            result['predictions'],
+            np.array([row['predictions'] for row in expected]),
+            rtol=1e-5, atol=1e-6
+        )
+
+if __name__ == '__main__':
+    unittest.main()
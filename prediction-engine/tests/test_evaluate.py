@@ -0,0 +1,64 @@
+""" Tests evaluating the races across a pool of workers """
+
+import random
+import unittest
+from unittest import mock
+from multiprocessing import dummy
+
+from ..common import evaluate as evaluate_module
+
+RACES = list(range(1, 8))
+DRIVERS = list(range(1, 11))
+
+def predict_many(race_ids, load_model=True):
+    """ Predicts a different order of the drivers for each race. """
+    result = {}
+    for race_id in race_ids:
+        ranking = list(DRIVERS)
+        random.Random(race_id).shuffle(ranking)
+        result[race_id] = ([[driver] for driver in ranking], '', 2019, race_id)
+    return result
+
+def get_race_results(race_id):
+    """ Returns rows of the driver and their position in the race, at the
+        column read by the evaluation. """
+    positions = list(range(1, len(DRIVERS) + 1))
+    random.Random(-race_id).shuffle(positions)
+    return [(driver,) + (None,) * 10 + (position,) for driver, position in zip(DRIVERS, positions)]
+
+class TestEvaluate(unittest.TestCase):
+    """ Tests class. """
+
+    def setUp(self):
+        database = mock.Mock()
+        database.get_race_results.side_effect = get_race_results
+        # Threads stand in for the spawned processes, so that they share the mocks
+        processes = mock.Mock()
+        processes.get_context.return_value.Pool = dummy.Pool
+        self.patches = [
+            mock.patch.object(evaluate_module, 'db', database),
+            mock.patch.object(evaluate_module, 'race_predict_many', side_effect=predict_many),
+            mock.patch.object(evaluate_module, 'multiprocessing', processes)
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+
+    def test_parallel_metrics_match_serial(self):
+        """ Check the merged metrics of each race are in the serial order. """
+        serial = evaluate_module.evaluate_races(True, RACES)
+        for workers in [2, 3, len(RACES), len(RACES) + 1]:
+            self.assertEqual(evaluate_module.evaluate_parallel(True, RACES, workers), serial)
+
+    def test_parallel_evaluation_matches_serial(self):
+        """ Check the evaluation figures are the same across workers. """
+        self.assertEqual(
+            evaluate_module.evaluate(True, RACES, workers=3),
+            evaluate_module.evaluate(True, RACES, workers=1)
+        )
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+""" Tests the feature engine against the dataset queries """
+
+import os
+import unittest
+import numpy as np
+import mysql.connector as mysql
+
+from .utils import *
+from ..common.db import Database
+from ..common.features import FeatureEngine
+
+SQL_USER = os.getenv('MYSQL_USER')
+SQL_PASSWORD = os.getenv('MYSQL_PASSWORD')
+SQL_HOST = os.getenv('MYSQL_HOST')
+SQL_DATABASE = os.getenv('MYSQL_DB')
+
+db = mysql.connection.MySQLConnection(
+    user=SQL_USER,
+    password=SQL_PASSWORD,
+    host=SQL_HOST,
+    database=SQL_DATABASE
+)
+db.autocommit = True
+
+def as_column(rows):
+    """ Converts single column query results to floats, with NaN for NULL. """
+    return [float(row[0]) if row[0] is not None else np.nan for row in rows]
+
+class TestFeatures(unittest.TestCase):
+    """ Tests class. """
+
+    def setUp(self):
+        truncate_table(db, 'races')
+        truncate_table(db, 'results')
+        truncate_table(db, 'qualifying')
+        truncate_table(db, 'drivers')
+        truncate_table(db, 'constructors')
+        truncate_table(db, 'driverStandings')
+        insert_history(db)
+        self.database = Database.get_database()
+        self.database.update_qualifying_deltas()
+        self.engine = FeatureEngine.load(self.database)
+
+    def assert_column(self, result, expected):
+        """ Check the engine column exactly matches the query. """
+        np.testing.assert_array_equal(np.array(result, dtype=float), np.array(expected))
+
+    def test_qualifying_deltas(self):
+        """ Check the stored deltas match the delta calculated from the laps. """
+        cursor = db.cursor()
+        cursor.execute(
+            """
+            SELECT
+                deltaToPole,
+                NULLIF((LEAST(IFNULL(qualifying.q1Seconds, ~0),
+                    IFNULL(qualifying.q2Seconds, ~0),
+                    IFNULL(qualifying.q3Seconds, ~0))), ~0)
+                    -((SELECT MIN(LEAST(IFNULL(qualifying1.q1Seconds, ~0),
+                        IFNULL(qualifying1.q2Seconds, ~0),
+                        IFNULL(qualifying1.q3Seconds, ~0)))
+                            FROM qualifying qualifying1
+                            WHERE qualifying1.raceId = qualifying.raceId))
+            FROM qualifying;"""
+        )
+        rows = cursor.fetchall()
+        cursor.close()
+        self.assertGreater(len(rows), 0)
+        self.assertEqual([row[0] for row in rows], [row[1] for row in rows])
+
+    def test_race_dataset(self):
+        """ Check the race dataset matches the race dataset queries. """
+        dataset = self.engine.race_dataset()
+        expected = self.database.get_race_dataset()
+        self.assertGreater(len(expected), 0)
+        self.assertEqual(list(dataset['race']), [row[0] for row in expected])
+        self.assertEqual(list(dataset['grid']), [row[1] for row in expected])
+        self.assertEqual(list(dataset['qualifying']), [float(row[2]) for row in expected])
+        self.assertEqual(list(dataset['result']), [row[3] for row in expected])
+        self.assertEqual(list(dataset['driver']), [row[4] for row in expected])
+        self.assertEqual(list(dataset['constructor']), [row[5] for row in expected])
+        self.assert_column(dataset['average_form'],
+                           as_column(self.database.get_race_dataset_form()))
+        self.assert_column(dataset['circuit_average_form'],
+                           as_column(self.database.get_race_dataset_form_circuit()))
+        self.assert_column(dataset['championship_standing'],
+                           as_column(self.database.get_race_dataset_standings()))
+        self.assert_column(dataset['position_changes'],
+                           as_column(self.database.get_race_dataset_position_changes()))
+        self.assert_column(dataset['average_form_team'],
+                           as_column(self.database.get_race_dataset_form_team()))
+        self.assert_column(dataset['circuit_average_form_team'],
+                           as_column(self.database.get_race_dataset_form_team_circuit()))
+        self.assert_column(dataset['position_changes_team'],
+                           as_column(self.database.get_race_dataset_position_changes_team()))
+
+    def test_qualifying_dataset(self):
+        """ Check the qualifying dataset matches the qualifying dataset queries. """
+        dataset = self.engine.qualifying_dataset()
+        expected = self.database.get_qualifying_dataset()
+        self.assertGreater(len(expected), 0)
+        self.assertEqual(list(dataset['race']), [row[0] for row in expected])
+        self.assertEqual(list(dataset['result']), [float(row[1]) for row in expected])
+        self.assertEqual(list(dataset['driver']), [row[2] for row in expected])
+        self.assertEqual(list(dataset['constructor']), [row[3] for row in expected])
+        self.assert_column(dataset['average_form'],
+                           as_column(self.database.get_qualifying_dataset_form()))
+        self.assert_column(dataset['circuit_average_form'],
+                           as_column(self.database.get_qualifying_dataset_form_circuit()))
+        self.assert_column(dataset['championship_standing'],
+                           as_column(self.database.get_qualifying_dataset_standings()))
+        self.assert_column(dataset['average_form_team'],
+                           as_column(self.database.get_qualifying_dataset_form_team()))
+        self.assert_column(dataset['circuit_average_form_team'],
+                           as_column(self.database.get_qualifying_dataset_form_team_circuit()))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+""" Tests the inference pool """
+
+import time
+import unittest
+import gevent
+
+from ..common.inference import InferencePool
+
+def busy(seconds):
+    """ Keeps the CPU busy for the given seconds. """
+    end = time.time() + seconds
+    while time.time() < end:
+        pass
+    return seconds
+
+class TestInference(unittest.TestCase):
+    """ Tests class. """
+
+    def test_run_returns_result(self):
+        """ Check the result of the function is returned, and the task counted. """
+        pool = InferencePool(1)
+        self.assertEqual(pool.run(sorted, [3, 1, 2]), [1, 2, 3])
+        metrics = pool.metrics()
+        self.assertEqual(metrics['completed'], 1)
+        self.assertEqual(metrics['queue_depth'], 0)
+        self.assertEqual(metrics['running'], 0)
+
+    def test_run_raises_errors(self):
+        """ Check errors raised by the function reach the caller. """
+        pool = InferencePool(1)
+        with self.assertRaises(ZeroDivisionError):
+            pool.run(lambda: 1 / 0)
+        self.assertEqual(pool.metrics()['completed'], 1)
+
+    def test_run_inline_without_threads(self):
+        """ Check the function runs in the caller when there are no threads. """
+        pool = InferencePool(0)
+        self.assertEqual(pool.run(busy, 0), 0)
+        self.assertIsNone(pool.pool)
+
+    def test_tasks_queue_for_threads(self):
+        """ Check tasks beyond the threads wait, and the queue depth reports them. """
+        pool = InferencePool(1)
+        tasks = [gevent.spawn(pool.run, busy, 0.2) for _ in range(2)]
+        gevent.sleep(0.1)
+        metrics = pool.metrics()
+        self.assertEqual(metrics['running'], 1)
+        self.assertEqual(metrics['queue_depth'], 1)
+        gevent.joinall(tasks, raise_error=True)
+        metrics = pool.metrics()
+        self.assertEqual(metrics['completed'], 2)
+        self.assertEqual(metrics['queue_depth'], 0)
+        self.assertGreater(metrics['max_wait'], 0.1)
+
+    def test_event_loop_stays_responsive(self):
+        """ Check other greenlets keep running while inference is computed. """
+        pool = InferencePool(1)
+        delays = []
+
+        def tick():
+            """ Records how late each short sleep wakes up. """
+            for _ in range(20):
+                start = time.time()
+                gevent.sleep(0.01)
+                delays.append(time.time() - start - 0.01)
+
+        task = gevent.spawn(pool.run, busy, 0.3)
+        gevent.joinall([task, gevent.spawn(tick)], raise_error=True)
+        self.assertLess(max(delays), 0.1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+""" Tests the schema migrations """
+
+import unittest
+
+from ..common.db import Database
+from ..common.migrations import (migrate, get_schema_version, index_exists, execute,
+                                 table_engine, MIGRATIONS, COMPOSITE_INDEXES,
+                                 REDUNDANT_INDEXES, CLUSTERED_KEYS, MYISAM_TABLES,
+                                 COMPOSITE_INDEXES_VERSION, INNODB_VERSION)
+
+class TestMigrations(unittest.TestCase):
+    """ Tests class. """
+
+    def setUp(self):
+        self.database = Database.get_database()
+
+    def tearDown(self):
+        migrate(self.database)
+
+    def applied_versions(self):
+        """ Returns the versions recorded in the schema version table. """
+        return [row[0] for row in execute(
+            self.database, "SELECT version FROM schema_version ORDER BY version;"
+        )]
+
+    def primary_key(self, table):
+        """ Returns the columns of the primary key of the table in order. """
+        return [row[0] for row in execute(
+            self.database,
+            """
+            SELECT column_name
+            FROM information_schema.statistics
+            WHERE table_schema = DATABASE()
+                AND table_name = %s
+                AND index_name = 'PRIMARY'
+            ORDER BY seq_in_index;""",
+            (table,)
+        )]
+
+    def column_exists(self, table, column):
+        """ Returns whether the table exists with the given column. """
+        return execute(
+            self.database,
+            """
+            SELECT COUNT(*)
+            FROM information_schema.columns
+            WHERE table_schema = DATABASE()
+                AND table_name = %s
+                AND column_name = %s;""",
+            (table, column)
+        )[0][0] > 0
+
+    def assert_indexes(self):
+        """ Checks the composite indexes exist, other than those made
+            redundant by the clustered keys. """
+        for index in COMPOSITE_INDEXES:
+            self.assertEqual(
+                index_exists(self.database, index[0], index[1]),
+                index not in REDUNDANT_INDEXES,
+                index[1]
+            )
+
+    def test_migrations_applied_on_connect(self):
+        """ Check every migration is recorded once connected. """
+        self.assertEqual(self.applied_versions(), [number for number, _, _, _ in MIGRATIONS])
+        self.assert_indexes()
+
+    def test_tables_clustered_by_driver(self):
+        """ Check the tables are InnoDB, with the history tables clustered by driver or team. """
+        for table in MYISAM_TABLES:
+            self.assertEqual(table_engine(self.database, table), 'InnoDB', table)
+        for table, _, key in CLUSTERED_KEYS:
+            self.assertEqual(self.primary_key(table), key)
+
+    def test_revert_to_myisam(self):
+        """ Check reverting the conversion restores the surrogate primary keys. """
+        self.assertEqual(migrate(self.database, INNODB_VERSION - 1), INNODB_VERSION - 1)
+        for table in MYISAM_TABLES:
+            self.assertEqual(table_engine(self.database, table), 'MyISAM', table)
+        for table, id_column, _ in CLUSTERED_KEYS:
+            self.assertEqual(self.primary_key(table), [id_column])
+        for table, name, _ in COMPOSITE_INDEXES:
+            self.assertTrue(index_exists(self.database, table, name), name)
+        self.assertEqual(migrate(self.database), MIGRATIONS[-1][0])
+        self.test_tables_clustered_by_driver()
+
+    def test_migrate_is_applied_once(self):
+        """ Check migrating again leaves the schema unchanged. """
+        version = get_schema_version(self.database)
+        self.assertEqual(migrate(self.database), version)
+        self.assertEqual(self.applied_versions(), [number for number, _, _, _ in MIGRATIONS])
+
+    def test_revert_composite_indexes(self):
+        """ Check reverting the indexes drops them, and migrating adds them again. """
+        version = COMPOSITE_INDEXES_VERSION - 1
+        self.assertEqual(migrate(self.database, version), version)
+        self.assertEqual(self.applied_versions(), list(range(1, version + 1)))
+        for table, name, _ in COMPOSITE_INDEXES:
+            self.assertFalse(index_exists(self.database, table, name), name)
+        self.assertEqual(migrate(self.database), MIGRATIONS[-1][0])
+        self.assert_indexes()
+
+    def test_revert_to_baseline(self):
+        """ Check the first migration holds the tables as they were before
+            versioned migrations, with the later columns and tables added again. """
+        self.assertEqual(migrate(self.database, 1), 1)
+        self.assertFalse(self.column_exists('qualifying', 'deltaToPole'))
+        self.assertFalse(self.column_exists('raceFeatures', 'raceId'))
+        self.assertFalse(self.column_exists('qualifyingFeatures', 'raceId'))
+        self.assertEqual(migrate(self.database), MIGRATIONS[-1][0])
+        self.assertTrue(self.column_exists('qualifying', 'deltaToPole'))
+        self.assertTrue(self.column_exists('raceFeatures', 'raceId'))
+        self.assertTrue(self.column_exists('qualifyingFeatures', 'raceId'))
+
+    def test_baseline_cannot_be_reverted(self):
+        """ Check the migration creating the tables is not reverted. """
+        with self.assertRaises(ValueError):
+            migrate(self.database, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+""" Tests the batched race and qualifying predictions """
+
+import os
+import unittest
+from unittest import mock
+import numpy as np
+import mysql.connector as mysql
+
+from .utils import *
+from ..common.db import Database
+from ..common import race, qualifying
+from ..common.models import race_model, qualifying_model
+
+SQL_USER = os.getenv('MYSQL_USER')
+SQL_PASSWORD = os.getenv('MYSQL_PASSWORD')
+SQL_HOST = os.getenv('MYSQL_HOST')
+SQL_DATABASE = os.getenv('MYSQL_DB')
+
+db = mysql.connection.MySQLConnection(
+    user=SQL_USER,
+    password=SQL_PASSWORD,
+    host=SQL_HOST,
+    database=SQL_DATABASE
+)
+db.autocommit = True
+
+# Races of the last season of the history, and a following race without qualifying
+RACES = [13, 14, 15, 16, 17, 18, 19]
+
+def driver_number(driver):
+    """ Returns the number of a driver reference inserted by insert_history. """
+    return int(driver[len('driver'):])
+
+def fake_race_model(features, load_model=True, model_version=None):
+    """ Gives each row a distinct probability peak, based on its driver and features. """
+    return [
+        {'probabilities': np.roll(0.5 ** np.arange(20), driver_number(driver) - 1)
+                          * (1 + features['average_form'][index] / 1000)}
+        for index, driver in enumerate(features['driver'])
+    ]
+
+def fake_qualifying_model(features, load_model=True, model_version=None):
+    """ Predicts a distinct time for each row, based on its driver and features. """
+    return [
+        {'predictions': np.array([features['average_form'][index] + driver_number(driver) / 1000])}
+        for index, driver in enumerate(features['driver'])
+    ]
+
+class TestPredictMany(unittest.TestCase):
+    """ Tests class. """
+
+    def setUp(self):
+        truncate_table(db, 'races')
+        truncate_table(db, 'results')
+        truncate_table(db, 'qualifying')
+        truncate_table(db, 'drivers')
+        truncate_table(db, 'constructors')
+        truncate_table(db, 'driverStandings')
+        truncate_table(db, 'raceFeatures')
+        truncate_table(db, 'qualifyingFeatures')
+        truncate_table(db, 'racePredictionLog')
+        truncate_table(db, 'qualifyingPredictionLog')
+        insert_history(db)
+        insert_initial_data(db, 2002, 1, 'Race 1 Grand Prix')
+        cursor = db.cursor()
+        cursor.execute("UPDATE qualifying SET position = driverId;")
+        cursor.close()
+        Database.get_database().update_qualifying_deltas()
+        self.race_model = mock.patch.object(race_model, 'predict', side_effect=fake_race_model)
+        self.qualifying_model = mock.patch.object(
+            qualifying_model, 'predict', side_effect=fake_qualifying_model
+        )
+        self.race_predict = self.race_model.start()
+        self.qualifying_predict = self.qualifying_model.start()
+
+    def tearDown(self):
+        self.race_model.stop()
+        self.qualifying_model.stop()
+
+    def test_qualifying_predict_many(self):
+        """ Check the batch matches predicting each race, with one model call. """
+        result = qualifying.predict_many(RACES, load_model=False)
+        self.assertEqual(self.qualifying_predict.call_count, 1)
+        self.assertEqual(sorted(result), RACES)
+        for race_id in RACES:
+            self.assertEqual(
+                result[race_id], qualifying.predict(race_id, disable_cache=True, load_model=False)
+            )
+
+    def test_race_predict_many(self):
+        """ Check the batch matches predicting each race, with one call of each model. """
+        result = race.predict_many(RACES, load_model=False)
+        self.assertEqual(self.race_predict.call_count, 1)
+        # Only the race without qualifying results has its qualifying predicted
+        self.assertEqual(self.qualifying_predict.call_count, 1)
+        self.assertEqual(sorted(result), RACES)
+        for race_id in RACES:
+            self.assertEqual(
+                result[race_id], race.predict(race_id, disable_cache=True, load_model=False)
+            )
+
+    def test_predict_many_without_races(self):
+        """ Check no races gives no predictions, without calling the models. """
+        self.assertEqual(race.predict_many([]), {})
+        self.assertEqual(qualifying.predict_many([]), {})
+        self.race_predict.assert_not_called()
+        self.qualifying_predict.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -64,7 +64,7 @@ class TestInfoRoutes(unittest.TestCase):
                  'driver_quali_result': 0.123, 'driver_ref': 'hamilton',
                  'driver_surname': '', 'driver_wiki': 'hamilton'}
                 ],
-             'year': 2019}
+             'model_version': None, 'year': 2019}
         )
 
     def test_qualifying_prediction_route_with_id(self):
@@ -92,7 +92,7 @@ class TestInfoRoutes(unittest.TestCase):
                  'driver_quali_result': 0.123, 'driver_ref': 'hamilton',
                  'driver_surname': '', 'driver_wiki': 'hamilton'}
                 ],
-             'year': 2019}
+             'model_version': None, 'year': 2019}
         )
 
     def test_race_prediction_route(self):
@@ -125,7 +125,7 @@ class TestInfoRoutes(unittest.TestCase):
                  'driver_quali_result': None, 'driver_ref': 'hamilton',
                  'driver_surname': '', 'driver_wiki': 'hamilton'}
             ],
-             'year': 2019}
+             'model_version': None, 'year': 2019}
         )
 
     def test_race_prediction_route_with_id(self):
@@ -158,8 +158,25 @@ class TestInfoRoutes(unittest.TestCase):
                  'driver_quali_result': None, 'driver_ref': 'hamilton',
                  'driver_surname': '', 'driver_wiki': 'hamilton'}
             ],
-             'year': 2019}
+             'model_version': None, 'year': 2019}
         )
 
+    def test_model_status_route(self):
+        """ Test the model status route. """
+        response = self.app.get('/status')
+        json_response = json.loads(response.get_data(as_text=True))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(json_response), ['inference', 'qualifying_model', 'race_model'])
+        self.assertEqual(
+            sorted(json_response['race_model']),
+            ['artifact', 'checkpoint', 'loaded_at', 'reloading', 'version', 'versions']
+        )
+
+    def test_unknown_model_version(self):
+        """ Test an unknown model version is not found. """
+        insert_initial_data(db, 2019, 4)
+        response = self.app.get('/predict/race/1?model=latest')
+        self.assertEqual(response.status_code, 404)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,92 @@
+""" Tests the race ranking modes """
+
+import itertools
+import unittest
+import numpy as np
+
+from ..common.ranking import results_to_ranking, get_probability_matrix
+
+def tuple_ranking(predictions, number_of_drivers):
+    """ The original ranking, repeatedly taking the max over a list of tuples. """
+    by_position = {}
+    for pred_dict in predictions:
+        for position in range(0, number_of_drivers):
+            if position not in by_position:
+                by_position[position] = []
+            by_position[position].append(pred_dict['probabilities'][position].item())
+
+    tuples = []
+    for position, values in by_position.items():
+        total = sum(values)
+        tuples.extend([
+            (position, index, (value / total) if total > 0 else 0)
+            for index, value in enumerate(values)
+        ])
+
+    ranked_drivers = []
+    ranked_positions = []
+    ranking = []
+    while len(ranking) < number_of_drivers:
+        max_tuple = max(tuples, key=lambda item: item[2])
+        ranked_positions.append(max_tuple[0])
+        ranked_drivers.append(max_tuple[1])
+        ranking.append(max_tuple)
+        tuples = [item for item in tuples
+                  if item[0] not in ranked_positions and item[1] not in ranked_drivers]
+    return sorted(ranking, key=lambda item: item[0])
+
+def generate_predictions(number_of_drivers, random, concentration=0.3):
+    """ Generates random class probabilities for each driver. """
+    return [
+        {'probabilities': probabilities}
+        for probabilities in random.dirichlet(
+            np.ones(20) * concentration, number_of_drivers
+        ).astype(np.float32)
+    ]
+
+class TestRanking(unittest.TestCase):
+    """ Tests class. """
+
+    def test_greedy_matches_tuples(self):
+        """ Test the greedy ranking matches the original tuple ranking. """
+        random = np.random.RandomState(0)
+        for number_of_drivers in range(1, 21):
+            predictions = generate_predictions(number_of_drivers, random)
+            # Rounding gives ties, and a zero column gives a position with no probability
+            for pred_dict in predictions:
+                pred_dict['probabilities'] = np.round(pred_dict['probabilities'], 1)
+                pred_dict['probabilities'][number_of_drivers - 1] = 0
+            expected = tuple_ranking(predictions, number_of_drivers)
+            result = results_to_ranking(predictions, number_of_drivers, 'greedy')
+            self.assertEqual([item[:2] for item in result], [item[:2] for item in expected])
+            np.testing.assert_allclose([item[2] for item in result],
+                                       [item[2] for item in expected])
+
+    def test_optimal_maximises_log_probability(self):
+        """ Test the optimal ranking matches a brute force search. """
+        random = np.random.RandomState(1)
+        for number_of_drivers in range(1, 7):
+            predictions = generate_predictions(number_of_drivers, random, 1)
+            matrix = get_probability_matrix(predictions, number_of_drivers)
+            best = max(
+                itertools.permutations(range(number_of_drivers)),
+                key=lambda drivers: sum(
+                    np.log(matrix[position, driver]) for position, driver in enumerate(drivers)
+                )
+            )
+            result = results_to_ranking(predictions, number_of_drivers, 'optimal')
+            self.assertEqual([item[0] for item in result], list(range(number_of_drivers)))
+            self.assertEqual([item[1] for item in result], list(best))
+
+    def test_large_grids(self):
+        """ Test every driver gets a position on grids larger than the classes. """
+        random = np.random.RandomState(2)
+        for number_of_drivers in [22, 26]:
+            predictions = generate_predictions(number_of_drivers, random)
+            for mode in ['greedy', 'optimal']:
+                result = results_to_ranking(predictions, number_of_drivers, mode)
+                self.assertEqual(sorted(item[1] for item in result),
+                                 list(range(number_of_drivers)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,174 @@
+""" Tests reloading the resident models in the background """
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from contextlib import contextmanager
+
+from ..common import models
+from ..common.models import ResidentModel, ModelVersionNotFound
+from ..predict import reload
+
+class TestReload(unittest.TestCase):
+    """ Tests class. """
+
+    def setUp(self):
+        self.model_dir = tempfile.mkdtemp()
+        self.fetches = 0
+        self.loads = 0
+        self.model = ResidentModel(self.fetch, None, [], self.fetch_version)
+        self.model.load_predictor = self.load_version_name
+        self.version_dirs = {}
+
+    def tearDown(self):
+        shutil.rmtree(self.model_dir)
+        for version_dir in self.version_dirs.values():
+            shutil.rmtree(version_dir, ignore_errors=True)
+
+    def fetch(self, load_model=True):
+        """ Returns the model directory, counting the number of fetches. """
+        self.fetches += 1
+        return self.model_dir
+
+    def load_version_name(self, model_dir, version):
+        """ Stands in for the loaded predictor with the checkpoint name, counting the loads. """
+        self.loads += 1
+        return version
+
+    def load_predictor(self, model_dir, version):
+        """ Returns a predictor giving the number of rows, counting the loads. """
+        self.loads += 1
+        return lambda features: {'rows': [len(features['grid'])] * len(features['grid'])}
+
+    @contextmanager
+    def fetch_version(self, artifact):
+        """ Holds a directory for the version, with a checkpoint named after it. """
+        if artifact not in self.version_dirs:
+            self.version_dirs[artifact] = tempfile.mkdtemp()
+            self.write_checkpoint(artifact[:8], self.version_dirs[artifact])
+        yield self.version_dirs[artifact]
+
+    def write_checkpoint(self, version, model_dir=None):
+        """ Writes the checkpoint state file of the model. """
+        with open(os.path.join(model_dir or self.model_dir, 'checkpoint'), 'w') as checkpoint_file:
+            checkpoint_file.write('model_checkpoint_path: "%s"\n' % version)
+
+    def test_requests_use_loaded_model(self):
+        """ Check the model is fetched and loaded once, with requests using
+            the loaded model until it is refreshed. """
+        self.write_checkpoint('model.ckpt-1')
+        self.assertEqual(self.model.load(), 'model.ckpt-1')
+        self.assertEqual(self.model.load(), 'model.ckpt-1')
+        self.assertEqual(self.fetches, 1)
+        self.assertEqual(self.loads, 1)
+
+        self.write_checkpoint('model.ckpt-2')
+        self.assertEqual(self.model.load(), 'model.ckpt-1')
+        self.assertEqual(self.model.refresh(), 'model.ckpt-2')
+        self.assertEqual(self.model.load(), 'model.ckpt-2')
+        self.assertEqual(self.fetches, 2)
+        self.assertEqual(self.loads, 2)
+
+    def test_predictions_load_once(self):
+        """ Check two predictions fetch and load the model once. """
+        self.write_checkpoint('model.ckpt-1')
+        self.model.load_predictor = self.load_predictor
+        features = {'grid': [1, 2]}
+        self.model.predict(features)
+        self.assertEqual(self.model.predict(features), [{'rows': 2}, {'rows': 2}])
+        self.assertEqual(self.fetches, 1)
+        self.assertEqual(self.loads, 1)
+
+    def test_local_model_reloaded_on_change(self):
+        """ Check a local model is reloaded once its checkpoint changes. """
+        self.write_checkpoint('model.ckpt-1')
+        self.assertEqual(self.model.load(False), 'model.ckpt-1')
+        self.assertEqual(self.model.load(False), 'model.ckpt-1')
+        self.assertEqual(self.loads, 1)
+        self.write_checkpoint('model.ckpt-2')
+        self.assertEqual(self.model.load(False), 'model.ckpt-2')
+        self.assertEqual(self.loads, 2)
+
+    def test_refresh_swaps_model(self):
+        """ Check the background refresh swaps in the new version. """
+        self.write_checkpoint('model.ckpt-1')
+        with mock.patch.object(reload, 'race_model', self.model), \
+                mock.patch.object(reload, 'qualifying_model', self.model):
+            reload.refresh_models()
+            self.assertTrue(self.model.reloading)
+            self.assertEqual(self.model.status()['version'], 'model.ckpt-1')
+
+            self.write_checkpoint('model.ckpt-2')
+            self.assertEqual(self.model.load(), 'model.ckpt-1')
+            reload.refresh_models()
+            self.assertEqual(self.model.load(), 'model.ckpt-2')
+            self.assertEqual(self.model.status()['version'], 'model.ckpt-2')
+
+    def test_versions_are_evicted(self):
+        """ Check versions are held alongside the current model, evicting
+            the least recently used once over the memory budget. """
+        self.write_checkpoint('model.ckpt-1')
+        self.model.load()
+        first, second, third = ['a' * 64, 'b' * 64, 'c' * 64]
+        # Each directory holds just its checkpoint state file, of 34 to 38 bytes, so the
+        # budget holds the current model and two other versions
+        with mock.patch.object(models, 'MODEL_MEMORY_BUDGET', 120), \
+                mock.patch.object(models, 'remove_model_version') as remove:
+            self.assertEqual(self.model.load_version(first), 'a' * 8)
+            self.assertEqual(self.model.load_version(second), 'b' * 8)
+            self.assertEqual(self.model.load_version(first), 'a' * 8)
+            self.assertEqual(list(self.model.versions), [second, first])
+            remove.assert_not_called()
+            self.model.load_version(third)
+            self.assertEqual(list(self.model.versions), [first, third])
+            remove.assert_called_once_with(self.version_dirs[second])
+            self.assertEqual(self.model.load(), 'model.ckpt-1')
+
+    def test_versions_served_while_refreshing(self):
+        """ Check held versions are returned while a refresh is loading the model. """
+        self.write_checkpoint('model.ckpt-1')
+        self.model.load()
+        self.model.load_version('a' * 64)
+        loading = threading.Event()
+        requested = threading.Event()
+        loaded = threading.Event()
+
+        def load_slowly(model_dir, version):
+            """ Waits to finish loading until the version has been requested. """
+            loading.set()
+            requested.wait(5)
+            loaded.set()
+            return version
+
+        self.model.load_predictor = load_slowly
+        self.write_checkpoint('model.ckpt-2')
+        refresh = threading.Thread(target=self.model.refresh)
+        refresh.start()
+        self.assertTrue(loading.wait(5))
+        self.assertEqual(self.model.load_version('a' * 64), 'a' * 8)
+        self.assertEqual(self.model.load(), 'model.ckpt-1')
+        self.assertFalse(loaded.is_set())
+        requested.set()
+        refresh.join()
+        self.assertEqual(self.model.load(), 'model.ckpt-2')
+
+    def test_unknown_version_is_not_found(self):
+        """ Check a version which is not a content hash, or cannot be fetched, is not found. """
+        with self.assertRaises(ModelVersionNotFound):
+            self.model.load_version('latest')
+        self.model.fetch_version = mock.Mock(side_effect=IOError('Missing'))
+        with self.assertRaises(ModelVersionNotFound):
+            self.model.load_version('d' * 64)
+
+    def test_failed_version_is_not_held(self):
+        """ Check a version which fails to load raises its error, and is not held. """
+        self.model.load_predictor = mock.Mock(side_effect=ValueError('Corrupt'))
+        with self.assertRaises(ValueError):
+            self.model.load_version('e' * 64)
+        self.assertEqual(list(self.model.versions), [])
+
+if __name__ == '__main__':
+    unittest.main()
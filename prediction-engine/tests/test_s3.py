@@ -0,0 +1,334 @@
+""" Tests fetching and uploading the models, against a local store and a mocked bucket """
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import boto3
+
+try:
+    from moto import mock_aws as mock_s3
+except ImportError:
+    from moto import mock_s3
+
+from ..common import s3 as model_store
+from ..common import transfer
+from ..common.store import ModelStore, S3ModelStore, LocalModelStore, MANIFEST
+
+BUCKET = 'test-model-bucket'
+
+class ModelStoreTests:
+    """ Tests shared by each of the model stores. """
+
+    def make_store(self):
+        """ Returns the store to test. """
+        raise NotImplementedError
+
+    def break_store(self):
+        """ Makes the store unreachable. """
+        raise NotImplementedError
+
+    def setUp(self):
+        self.file_dir = tempfile.mkdtemp() + '/'
+        self.store = self.make_store()
+        self.patches = [
+            mock.patch.object(model_store, 'store', self.store),
+            mock.patch.object(model_store, 'FILE_DIR', self.file_dir)
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        shutil.rmtree(self.file_dir)
+
+    def write_model(self, contents):
+        """ Writes a checkpoint file into the local race model directory. """
+        model_dir = self.file_dir + model_store.RACE_MODEL
+        os.makedirs(model_dir, exist_ok=True)
+        with open(os.path.join(model_dir, 'checkpoint'), 'w') as checkpoint_file:
+            checkpoint_file.write(contents)
+
+    def read_model(self):
+        """ Reads the checkpoint file of the local race model. """
+        model_dir = self.file_dir + model_store.RACE_MODEL
+        with open(os.path.join(model_dir, 'checkpoint')) as checkpoint_file:
+            return checkpoint_file.read()
+
+    def upload_elsewhere(self, contents):
+        """ Uploads a new model, as if it had been trained elsewhere. """
+        self.write_model(contents)
+        model_store.upload_race_model()
+        os.remove(model_store.version_path(model_store.RACE_MODEL))
+
+    def test_unchanged_model_is_not_downloaded(self):
+        """ Check the model is only downloaded when its content hash changes. """
+        self.write_model('first')
+        model_store.upload_race_model()
+        model_store.delete_race_model()
+
+        with mock.patch.object(self.store, 'open_read', wraps=self.store.open_read) as download:
+            model_store.fetch_race_model()
+            self.assertEqual(self.read_model(), 'first')
+            model_store.fetch_race_model()
+            self.assertEqual(download.call_count, 1)
+
+            self.upload_elsewhere('second')
+            self.write_model('stale')
+            model_store.fetch_race_model()
+            self.assertEqual(download.call_count, 2)
+            self.assertEqual(self.read_model(), 'second')
+
+    def test_uploaded_model_is_not_downloaded(self):
+        """ Check the model just uploaded is not downloaded again. """
+        self.write_model('first')
+        model_store.upload_race_model()
+        with mock.patch.object(self.store, 'open_read') as download:
+            model_store.fetch_race_model()
+            download.assert_not_called()
+
+    def test_identical_model_is_not_uploaded(self):
+        """ Check an unchanged model is only recorded in the manifest. """
+        self.write_model('model_checkpoint_path: "model.ckpt-1"\n')
+        model_store.upload_race_model()
+        manifest = self.store.read_manifest()
+        self.assertEqual(
+            sorted(manifest), [model_store.RACE_MODEL, model_store.RACE_MODEL + '_serving']
+        )
+        with mock.patch.object(self.store, 'open_write') as upload:
+            model_store.upload_race_model()
+            upload.assert_not_called()
+        self.assertEqual(self.store.read_manifest(), manifest)
+
+        self.write_model('model_checkpoint_path: "model.ckpt-2"\n')
+        model_store.upload_race_model()
+        self.assertNotEqual(
+            self.store.read_manifest()[model_store.RACE_MODEL], manifest[model_store.RACE_MODEL]
+        )
+
+    def test_unreachable_store_uses_local_model(self):
+        """ Check the local model is used if the store cannot be reached. """
+        self.write_model('first')
+        model_store.upload_race_model()
+        self.break_store()
+        self.assertEqual(
+            model_store.fetch_race_model(), self.file_dir + model_store.RACE_MODEL
+        )
+        self.assertEqual(self.read_model(), 'first')
+
+    def test_versions_are_published_atomically(self):
+        """ Check each fetch is extracted into a new version, and that the
+            versions in use are kept until released. """
+        self.upload_elsewhere('first')
+        first_dir = model_store.fetch_race_model()
+        self.assertTrue(os.path.islink(self.file_dir + model_store.RACE_MODEL))
+        self.assertEqual(self.read_model(), 'first')
+
+        with model_store.model_reference(first_dir):
+            for contents in ['second', 'third', 'fourth']:
+                self.upload_elsewhere(contents)
+                model_dir = model_store.fetch_race_model()
+                self.assertEqual(self.read_model(), contents)
+            self.assertTrue(os.path.isdir(first_dir))
+
+        model_store.collect_versions(model_store.RACE_MODEL)
+        self.assertFalse(os.path.isdir(first_dir))
+        self.assertTrue(os.path.isdir(model_dir))
+        self.assertEqual(len(os.listdir(model_store.versions_dir(model_store.RACE_MODEL))),
+                         model_store.VERSIONS_KEPT)
+
+        model_store.delete_race_model()
+        self.assertFalse(os.path.lexists(self.file_dir + model_store.RACE_MODEL))
+        self.assertEqual(os.listdir(model_store.versions_dir(model_store.RACE_MODEL)), [])
+
+    def test_fetched_versions_are_reused_and_removed(self):
+        """ Check a version is extracted once while held, and removed once
+            released, or if it fails to load. """
+        self.upload_elsewhere('first')
+        version = self.store.read_manifest()[model_store.RACE_MODEL]
+        self.upload_elsewhere('second')
+        model_store.fetch_race_model()
+        versions = os.listdir(model_store.versions_dir(model_store.RACE_MODEL))
+        with mock.patch.object(self.store, 'open_read', wraps=self.store.open_read) as download:
+            with model_store.fetch_model_version(model_store.RACE_MODEL, version) as model_dir:
+                with model_store.fetch_model_version(model_store.RACE_MODEL, version) as held:
+                    self.assertEqual(held, model_dir)
+                model_store.remove_model_version(model_dir)
+                self.assertTrue(os.path.isdir(model_dir))
+            self.assertEqual(download.call_count, 1)
+        with open(os.path.join(model_dir, 'checkpoint')) as checkpoint_file:
+            self.assertEqual(checkpoint_file.read(), 'first')
+
+        model_store.remove_model_version(model_dir)
+        self.assertFalse(os.path.exists(os.path.dirname(model_dir)))
+        with self.assertRaises(ValueError):
+            with model_store.fetch_model_version(model_store.RACE_MODEL, version) as model_dir:
+                raise ValueError('Failed to load')
+        self.assertFalse(os.path.exists(os.path.dirname(model_dir)))
+        self.assertEqual(os.listdir(model_store.versions_dir(model_store.RACE_MODEL)), versions)
+
+    def test_missing_version_leaves_no_directory(self):
+        """ Check fetching a version which is not stored makes no directory. """
+        self.upload_elsewhere('first')
+        model_store.fetch_race_model()
+        versions = os.listdir(model_store.versions_dir(model_store.RACE_MODEL))
+        with self.assertRaises(IOError):
+            with model_store.fetch_model_version(model_store.RACE_MODEL, 'f' * 64):
+                pass
+        self.assertEqual(os.listdir(model_store.versions_dir(model_store.RACE_MODEL)), versions)
+        self.assertEqual(model_store.version_locks, {})
+
+    def test_trained_model_moved_into_versions(self):
+        """ Check a model left by training is moved aside in the layout of the
+            fetched versions, and collected with them. """
+        self.upload_elsewhere('first')
+        self.write_model('trained')
+        model_store.fetch_race_model()
+        versions_dir = model_store.versions_dir(model_store.RACE_MODEL)
+        local = [name for name in os.listdir(versions_dir)
+                 if name.startswith(model_store.LOCAL_VERSION + '.')]
+        self.assertEqual(len(local), 1)
+        local_dir = os.path.join(versions_dir, local[0], model_store.RACE_MODEL)
+        with open(os.path.join(local_dir, 'checkpoint')) as checkpoint_file:
+            self.assertEqual(checkpoint_file.read(), 'trained')
+        self.assertIsNone(model_store.artifact_version(local_dir))
+
+        model_store.collect_versions(model_store.RACE_MODEL, 0)
+        self.assertFalse(os.path.exists(os.path.dirname(local_dir)))
+
+    def test_serving_model_holds_latest_checkpoint(self):
+        """ Check the serving model only holds the latest checkpoint and weights. """
+        self.write_model(
+            'model_checkpoint_path: "model.ckpt-20"\n'
+            'all_model_checkpoint_paths: "model.ckpt-10"\n'
+            'all_model_checkpoint_paths: "model.ckpt-20"\n'
+        )
+        model_dir = self.file_dir + model_store.RACE_MODEL
+        names = [
+            'graph.pbtxt', 'events.out.tfevents.1', 'weights.npz',
+            'model.ckpt-10.index', 'model.ckpt-10.data-00000-of-00001', 'model.ckpt-10.meta',
+            'model.ckpt-20.index', 'model.ckpt-20.data-00000-of-00001', 'model.ckpt-20.meta'
+        ]
+        for name in names:
+            with open(os.path.join(model_dir, name), 'wb') as model_file:
+                model_file.write(os.urandom(1024))
+
+        size, serving_size = model_store.upload_race_model()
+        self.assertLess(serving_size, size)
+        model_store.delete_race_model()
+
+        serving_dir = model_store.fetch_race_serving_model()
+        self.assertEqual(sorted(os.listdir(serving_dir)), [
+            'checkpoint', 'model.ckpt-20.data-00000-of-00001', 'model.ckpt-20.index',
+            'weights.npz'
+        ])
+        self.assertEqual(model_store.read_checkpoint_version(serving_dir), 'model.ckpt-20')
+        self.assertEqual(sorted(os.listdir(model_store.fetch_race_model())),
+                         sorted(names + ['checkpoint']))
+
+    def test_serving_model_falls_back_to_full_model(self):
+        """ Check the full model is served if no serving model was uploaded. """
+        self.write_model('first')
+        model_store.upload_race_model()
+        model_store.delete_race_model()
+        self.assertEqual(model_store.fetch_race_serving_model(),
+                         model_store.fetch_race_model())
+
+    def test_missing_model_raises(self):
+        """ Check an error is raised if there is no model anywhere. """
+        with self.assertRaises(Exception):
+            model_store.fetch_race_model()
+
+class TestLocalStore(ModelStoreTests, unittest.TestCase):
+    """ Tests class for the local store. """
+
+    def make_store(self):
+        self.store_dir = tempfile.mkdtemp()
+        return LocalModelStore(self.store_dir)
+
+    def break_store(self):
+        shutil.rmtree(self.store_dir)
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.store_dir, ignore_errors=True)
+
+class TestS3Store(ModelStoreTests, unittest.TestCase):
+    """ Tests class for the S3 store, against a mocked bucket. """
+
+    def make_store(self):
+        self.mock = mock_s3()
+        self.mock.start()
+        self.client = boto3.client('s3', region_name='us-east-1')
+        self.client.create_bucket(Bucket=BUCKET)
+        store = S3ModelStore(BUCKET)
+        store.client = self.client
+        return store
+
+    def break_store(self):
+        self.client.delete_object(Bucket=BUCKET, Key=MANIFEST)
+        self.client.delete_bucket(Bucket=BUCKET)
+
+    def tearDown(self):
+        super().tearDown()
+        self.mock.stop()
+
+    def test_large_model_is_streamed(self):
+        """ Check a model spanning several parts is uploaded as a multipart
+            upload and downloaded as byte ranges, without a local archive. """
+        self.write_model('first')
+        model_dir = self.file_dir + model_store.RACE_MODEL
+        contents = os.urandom(12 * 1024 * 1024)
+        with open(os.path.join(model_dir, 'model.ckpt-1.data'), 'wb') as data_file:
+            data_file.write(contents)
+
+        with mock.patch.object(transfer, 'PART_SIZE', 5 * 1024 * 1024), \
+                mock.patch.object(transfer, 'CONCURRENCY', 2), \
+                mock.patch.object(self.client, 'upload_part',
+                                  wraps=self.client.upload_part) as upload_part, \
+                mock.patch.object(self.client, 'get_object',
+                                  wraps=self.client.get_object) as get_object:
+            model_store.upload_race_model()
+            model_store.delete_race_model()
+            model_dir = model_store.fetch_race_model()
+            self.assertEqual(upload_part.call_count, 3)
+            # The manifest is read on upload and fetch, then each range is fetched
+            self.assertEqual(get_object.call_count, 5)
+
+        with open(os.path.join(model_dir, 'model.ckpt-1.data'), 'rb') as data_file:
+            self.assertEqual(data_file.read(), contents)
+        self.assertEqual(self.read_model(), 'first')
+        self.assertEqual(
+            [name for name in os.listdir(self.file_dir) if name.endswith('.tar.gz')], []
+        )
+
+    def test_failed_upload_is_aborted(self):
+        """ Check a failed upload leaves the previous model in place. """
+        self.write_model('first')
+        model_store.upload_race_model()
+        manifest = self.store.read_manifest()
+        self.write_model('second')
+        with mock.patch.object(self.client, 'upload_part', side_effect=IOError('Failed')):
+            with self.assertRaises(IOError):
+                model_store.upload_race_model()
+        self.assertEqual(self.store.read_manifest(), manifest)
+        self.assertEqual(
+            self.client.list_multipart_uploads(Bucket=BUCKET).get('Uploads', []), []
+        )
+
+class TestModelStore(unittest.TestCase):
+    """ Tests class for the store interface. """
+
+    def test_missing_method_fails_on_creation(self):
+        """ Check a store not implementing every method cannot be created. """
+        class IncompleteStore(ModelStore):
+            def size(self, key):
+                return None
+
+        with self.assertRaises(TypeError):
+            IncompleteStore()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+""" Tests the training set snapshots """
+
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import mysql.connector as mysql
+
+from .utils import *
+from ..common.db import Database
+from ..common import snapshot
+from ..common.race import build_training_set
+
+SQL_USER = os.getenv('MYSQL_USER')
+SQL_PASSWORD = os.getenv('MYSQL_PASSWORD')
+SQL_HOST = os.getenv('MYSQL_HOST')
+SQL_DATABASE = os.getenv('MYSQL_DB')
+
+db = mysql.connection.MySQLConnection(
+    user=SQL_USER,
+    password=SQL_PASSWORD,
+    host=SQL_HOST,
+    database=SQL_DATABASE
+)
+db.autocommit = True
+
+class TestSnapshot(unittest.TestCase):
+    """ Tests class. """
+
+    def setUp(self):
+        truncate_table(db, 'races')
+        truncate_table(db, 'results')
+        truncate_table(db, 'qualifying')
+        truncate_table(db, 'drivers')
+        truncate_table(db, 'constructors')
+        truncate_table(db, 'driverStandings')
+        insert_history(db)
+        self.database = Database.get_database()
+        self.database.update_qualifying_deltas()
+        self.snapshot_dir = tempfile.mkdtemp()
+        snapshot.SNAPSHOT_DIR = self.snapshot_dir
+        self.builds = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.snapshot_dir)
+
+    def build(self, database):
+        """ Builds the race training set, counting the number of builds. """
+        self.builds += 1
+        return build_training_set(database)
+
+    def test_snapshot_is_reused(self):
+        """ Check the snapshot is loaded memory mapped while the data is unchanged. """
+        features, labels = snapshot.load_training_set('race', self.database, self.build)
+        loaded_features, loaded_labels = snapshot.load_training_set(
+            'race', self.database, self.build
+        )
+        self.assertEqual(self.builds, 1)
+        self.assertIsInstance(loaded_labels, np.memmap)
+        np.testing.assert_array_equal(loaded_labels, labels)
+        self.assertEqual(sorted(loaded_features), sorted(features))
+        for key, values in features.items():
+            np.testing.assert_array_equal(loaded_features[key], values)
+
+    def test_snapshot_is_rebuilt(self):
+        """ Check the snapshot is rebuilt once new results are added. """
+        snapshot.load_training_set('race', self.database, self.build)
+        insert_initial_results_data(db, 1, 1, 1, 1)
+        snapshot.load_training_set('race', self.database, self.build)
+        self.assertEqual(self.builds, 2)
+        self.assertEqual(len(os.listdir(self.snapshot_dir)), 1)
+
+    def test_snapshot_is_rebuilt_after_backfill(self):
+        """ Check the snapshot is rebuilt once rows are updated in place. """
+        cursor = db.cursor()
+        cursor.execute("UPDATE qualifying SET deltaToPole = NULL;")
+        cursor.close()
+        snapshot.load_training_set('race', self.database, self.build)
+        self.database.update_qualifying_deltas()
+        snapshot.load_training_set('race', self.database, self.build)
+        self.assertEqual(self.builds, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -34,6 +34,8 @@ class TestUpdateDatabase(unittest.TestCase):
         truncate_table(db, 'constructors')
         truncate_table(db, 'driverStandings')
         truncate_table(db, 'constructorStandings')
+        truncate_table(db, 'raceFeatures')
+        truncate_table(db, 'qualifyingFeatures')
 
     def test_check_for_calendar_updates(self):
         """ Check calendar is updated. """
@@ -92,6 +94,49 @@ class TestUpdateDatabase(unittest.TestCase):
                                    'http://en.wikipedia.org/wiki/Max_Verstappen', 1,
                                    'red_bull', '', None, ''))
 
+    def test_check_for_races_refreshes_features(self):
+        """ Check features for the following race are materialized. """
+        insert_initial_data(db, 2019, 4)
+        insert_initial_data(db, 2019, 5)
+        insert_initial_data(db, 2019, 6)
+        insert_initial_results_data(db)
+        insert_initial_driver_data(db)
+        insert_initial_constructor_data(db)
+        result = check_for_races()
+        self.assertEqual(result, 20)
+        self.assertEqual(len(get_race_feature_data(db, 3)), 0)
+        self.assertEqual(refresh_features([2]), 1)
+        data = get_race_feature_data(db, 3)
+        self.assertEqual(len(data), 20)
+        self.assertEqual(data[0], (3, 1, Decimal('2.0000'), Decimal('2.0000'), None,
+                                   Decimal('-1.0000'), Decimal('1.5000'), Decimal('1.5000'),
+                                   Decimal('0.0000')))
+        self.assertEqual(data[1], (3, 2, Decimal('1.0000'), Decimal('1.0000'), None,
+                                   Decimal('1.0000'), Decimal('1.5000'), Decimal('1.5000'),
+                                   Decimal('0.0000')))
+        self.assertEqual(len(get_race_feature_data(db, 2)), 0)
+
+    def test_refresh_features_of_next_race(self):
+        """ Check only the race following each changed race is refreshed, with
+            the stale features of later races removed. """
+        for race_round in range(1, 6):
+            insert_initial_data(db, 2019, race_round)
+        insert_initial_results_data(db, 1, 1, 1, 1)
+        insert_initial_results_data(db, 2, 1, 1, 1)
+        insert_initial_driver_data(db)
+        insert_initial_constructor_data(db)
+        cursor = db.cursor()
+        cursor.execute("INSERT INTO raceFeatures (raceId, driverId) VALUES (4, 1);")
+        cursor.execute(
+            "INSERT INTO qualifyingFeatures (raceId, driverId, constructorId) VALUES (5, 1, 1);"
+        )
+        cursor.close()
+        self.assertEqual(refresh_features([1, 2, None]), 2)
+        self.assertEqual(len(get_race_feature_data(db, 2)), 1)
+        self.assertEqual(len(get_race_feature_data(db, 3)), 1)
+        self.assertEqual(len(get_race_feature_data(db, 4)), 0)
+        self.assertEqual(len(get_qualifying_feature_data(db, 5)), 0)
+
     def test_check_for_races_with_missing_season(self):
         """ Check no data is handled gracefully. """
         insert_initial_data(db, 2019, 4)
@@ -115,24 +160,42 @@ class TestUpdateDatabase(unittest.TestCase):
         self.assertEqual(len(data), 20)
         self.assertEqual(data[0], (2, 2, 1, 2, 77, 1, '1:16.979', '1:15.924', '1:15.406',
                                    Decimal('76.979'), Decimal('75.924'), Decimal('75.406'),
-                                   1, 'bottas', None, None, '', '', None, None, '', 2,
+                                   Decimal('75.406'), Decimal('0.000'), 1, 'bottas', None, None, '', '', None, None, '', 2,
                                    'mercedes', 'Mercedes', 'German',
                                    'http://en.wikipedia.org/wiki/Mercedes-Benz_in_Formula_One'))
         self.assertEqual(data[1], (3, 2, 2, 2, 44, 2, '1:17.292', '1:16.038', '1:16.040',
-                                   Decimal('77.292'), Decimal('76.038'), Decimal('76.040'), 2,
-                                   'hamilton', 44, 'HAM', 'Lewis', 'Hamilton',
+                                   Decimal('77.292'), Decimal('76.038'), Decimal('76.040'),
+                                   Decimal('76.038'), Decimal('0.632'), 2, 'hamilton', 44, 'HAM', 'Lewis', 'Hamilton',
                                    datetime.date(1985, 1, 7), 'British',
                                    'http://en.wikipedia.org/wiki/Lewis_Hamilton', 2, 'mercedes',
                                    'Mercedes', 'German',
                                    'http://en.wikipedia.org/wiki/Mercedes-Benz_in_Formula_One'))
         self.assertEqual(data[2], (4, 2, 3, 3, 5, 3, '1:17.425', '1:16.667', '1:16.272',
-                                   Decimal('77.425'), Decimal('76.667'), Decimal('76.272'), 3,
-                                   'vettel', 5, 'VET', 'Sebastian', 'Vettel',
+                                   Decimal('77.425'), Decimal('76.667'), Decimal('76.272'),
+                                   Decimal('76.272'), Decimal('0.866'), 3, 'vettel', 5, 'VET', 'Sebastian', 'Vettel',
                                    datetime.date(1987, 7, 3),
                                    'German', 'http://en.wikipedia.org/wiki/Sebastian_Vettel', 3,
                                    'ferrari', 'Ferrari', 'Italian',
                                    'http://en.wikipedia.org/wiki/Scuderia_Ferrari'))
 
+    def test_check_for_qualifying_refreshes_features(self):
+        """ Check qualifying features for the following race are materialized. """
+        insert_initial_data(db, 2019, 4)
+        insert_initial_data(db, 2019, 5)
+        insert_initial_data(db, 2019, 6)
+        insert_initial_qualifying_data(db)
+        insert_initial_driver_data(db)
+        insert_initial_constructor_data(db)
+        result = check_for_qualifying()
+        self.assertEqual(result, 20)
+        self.assertEqual(refresh_features([2]), 1)
+        data = get_qualifying_feature_data(db, 3)
+        self.assertEqual(len(data), 20)
+        self.assertEqual(data[0], (3, 1, 2, Decimal('0'), Decimal('0'), None,
+                                   Decimal('0.316'), Decimal('0.316')))
+        self.assertEqual(data[1], (3, 2, 2, Decimal('0.632'), Decimal('0.632'), None,
+                                   Decimal('0.316'), Decimal('0.316')))
+
     def test_check_for_qualifying_with_missing_season(self):
         """ Check no data is handled gracefully. """
         insert_initial_data(db, 2019, 4)
@@ -0,0 +1,58 @@
+""" Tests the window function queries against the subqueries they replace """
+
+import os
+import unittest
+import mysql.connector as mysql
+
+from .utils import *
+from ..common.db import Database
+from ..common.window_queries import WindowQueries, SERVING_QUERIES, TRAINING_QUERIES
+
+SQL_USER = os.getenv('MYSQL_USER')
+SQL_PASSWORD = os.getenv('MYSQL_PASSWORD')
+SQL_HOST = os.getenv('MYSQL_HOST')
+SQL_DATABASE = os.getenv('MYSQL_DB')
+
+db = mysql.connection.MySQLConnection(
+    user=SQL_USER,
+    password=SQL_PASSWORD,
+    host=SQL_HOST,
+    database=SQL_DATABASE
+)
+db.autocommit = True
+
+class TestWindowQueries(unittest.TestCase):
+    """ Tests class. """
+
+    def setUp(self):
+        truncate_table(db, 'races')
+        truncate_table(db, 'results')
+        truncate_table(db, 'qualifying')
+        truncate_table(db, 'drivers')
+        truncate_table(db, 'constructors')
+        truncate_table(db, 'driverStandings')
+        insert_history(db)
+        self.database = Database.get_database()
+        self.database.update_qualifying_deltas()
+
+    def test_serving_queries(self):
+        """ Check the window queries return the same rows for every race. """
+        for name in SERVING_QUERIES:
+            # The rows of the latest race are not ordered, so are compared sorted
+            for race in range(1, 20):
+                with self.subTest(query=name, race=race):
+                    self.assertEqual(
+                        sorted(getattr(WindowQueries, name)(self.database, race), key=repr),
+                        sorted(getattr(Database, name)(self.database, race), key=repr)
+                    )
+
+    def test_training_queries(self):
+        """ Check the window queries return the same training columns. """
+        for name in TRAINING_QUERIES:
+            with self.subTest(query=name):
+                result = getattr(WindowQueries, name)(self.database)
+                self.assertGreater(len([row for row in result if row[0] is not None]), 0)
+                self.assertEqual(result, getattr(Database, name)(self.database))
+
+if __name__ == '__main__':
+    unittest.main()
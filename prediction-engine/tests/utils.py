@@ -1,5 +1,7 @@
 """ Utility functions used in the tests. """
 
+import random
+
 def truncate_table(db, table):
     """ Cleares the given table. """
     cursor = db.cursor()
@@ -183,3 +185,72 @@ def get_constructor_standing_data(db):
     result = cursor.fetchall()
     cursor.close()
     return result
+
+def get_race_feature_data(db, race_id):
+    """ Get materialized race features for checking changes. """
+    cursor = db.cursor()
+    cursor.execute("""
+        SELECT * FROM raceFeatures
+        WHERE raceId = %s
+        ORDER BY driverId ASC;""", (race_id,))
+    result = cursor.fetchall()
+    cursor.close()
+    return result
+
+def get_qualifying_feature_data(db, race_id):
+    """ Get materialized qualifying features for checking changes. """
+    cursor = db.cursor()
+    cursor.execute("""
+        SELECT * FROM qualifyingFeatures
+        WHERE raceId = %s
+        ORDER BY driverId ASC;""", (race_id,))
+    result = cursor.fetchall()
+    cursor.close()
+    return result
+
+def insert_history(db, seasons=(1999, 2000, 2001), rounds=6, drivers=8):
+    """ Insert several seasons of races, results, qualifying and standings. """
+    generator = random.Random(0)
+    cursor = db.cursor()
+    for driver in range(1, drivers + 1):
+        cursor.execute("INSERT INTO drivers (driverRef, url) VALUES (%s, %s)",
+                       ('driver' + str(driver), 'driver' + str(driver)))
+        cursor.execute("INSERT INTO constructors (constructorRef, name) VALUES (%s, %s)",
+                       ('team' + str(driver), 'team' + str(driver)))
+    race_id = 0
+    for year in seasons:
+        for round_no in range(1, rounds + 1):
+            race_id += 1
+            cursor.execute(
+                """INSERT INTO races
+                    (year, round, date, name, circuitId, raceTrained, qualifyingTrained)
+                    VALUES (%s, %s, NOW(), %s, %s, FALSE, FALSE)""",
+                (year, round_no, 'Race ' + str(round_no % 4) + ' Grand Prix', round_no % 4)
+            )
+            grid = list(range(1, drivers + 1))
+            generator.shuffle(grid)
+            for driver in range(1, drivers + 1):
+                position = generator.choice([grid[driver - 1], driver, None])
+                cursor.execute(
+                    """INSERT INTO results
+                        (raceId, driverId, constructorId, grid, position)
+                        VALUES (%s, %s, %s, %s, %s)""",
+                    (race_id, driver, driver, grid[driver - 1], position)
+                )
+                laps = [
+                    generator.choice([None, generator.randint(70000, 90000) / 1000.0])
+                    for _ in range(3)
+                ]
+                cursor.execute(
+                    """INSERT INTO qualifying
+                        (raceId, driverId, constructorId, q1Seconds, q2Seconds, q3Seconds)
+                        VALUES (%s, %s, %s, %s, %s, %s)""",
+                    (race_id, driver, driver, laps[0], laps[1], laps[2])
+                )
+                cursor.execute(
+                    """INSERT INTO driverStandings (raceId, driverId, position)
+                        VALUES (%s, %s, %s)""",
+                    (race_id, driver, generator.choice([driver, None]))
+                )
+    db.commit()
+    cursor.close()
@@ -1,12 +1,16 @@
 """ Module for running evaluations for both models. """
 
+import os
 import logging
 from .utils import evaluation_comparison
 
+# Processes evaluating at once, each loading its own copy of the model
+WORKERS = int(os.getenv('EVALUATION_WORKERS', '1'))
+
 if __name__ == '__main__':
     logging.basicConfig()
     logging.root.setLevel(logging.INFO)
     logging.info('---- Race performance ----')
-    evaluation_comparison(race=True)
+    evaluation_comparison(race=True, workers=WORKERS)
     logging.info('---- Qualifying performance ----')
-    evaluation_comparison(race=False)
+    evaluation_comparison(race=False, workers=WORKERS)
@@ -0,0 +1,13 @@
+""" Module for exporting the local checkpoints for the NumPy engine. """
+
+import logging
+from ..common.export import export_race_model, export_qualifying_model
+from ..common.s3 import fetch_race_model, fetch_qualifying_model
+
+if __name__ == '__main__':
+    logging.basicConfig()
+    logging.root.setLevel(logging.INFO)
+    logging.info("Exporting race model")
+    export_race_model(fetch_race_model(False))
+    logging.info("Exporting qualifying model")
+    export_qualifying_model(fetch_qualifying_model(False))
@@ -21,9 +21,9 @@ def evaluate_competition(race):
 
     return results
 
-def evaluation_comparison(race=True):
+def evaluation_comparison(race=True, workers=1):
     """ Evaluate network and then competition. """
-    results = evaluate(race)
+    results = evaluate(race, workers=workers)
     logging.info("------- Network evaluation results -----")
     print_results(results)
     competition = evaluate_competition(race)
@@ -0,0 +1,14 @@
+""" Module for populating the values derived when records are inserted,
+    which is needed once for existing databases. """
+
+import logging
+from ..common.db import Database
+from .update_database import refresh_all_features
+
+if __name__ == '__main__':
+    logging.basicConfig()
+    logging.root.setLevel(logging.INFO)
+    logging.info("Storing the qualifying deltas of all races")
+    Database.get_database().update_qualifying_deltas()
+    logging.info("Refreshing the materialized features of all races")
+    refresh_all_features()
@@ -1,12 +1,19 @@
 """ Sets up the application with the Pywsgi web server, which
     is required to handle concurrent requests. """
+from ..common.cooperative import patch_io, check_cooperative
+patch_io()
+
+# Imported once patched, so that every connection is opened on a cooperative socket
 import logging
 from gevent.pywsgi import WSGIServer
+from ..common.db import Database
 from .app import application
 
 PORT = 80
 
 logging.info("Application starting on port %i", PORT)
 
+check_cooperative(Database.get_database())
+
 http_server = WSGIServer(('0.0.0.0', PORT), application)
 http_server.serve_forever()
@@ -128,6 +128,85 @@ def insert_constructor_standings(race_id, results):
             total_inserted += 1
     return total_inserted
 
+def first_value(rows):
+    """ Returns the first value of each driver, converting tuples to a dictionary. """
+    return {key: values[0][0] for key, values in tuples_to_dictionary(rows).items()}
+
+def refresh_race_features(race_id):
+    """ Recomputes the materialized race features used to predict the given race. """
+    race_averages = first_value(db.get_race_averages(race_id))
+    circuit_averages = first_value(db.get_circuit_averages(race_id))
+    standings = first_value(db.get_championship_positions(race_id))
+    position_changes = first_value(db.get_position_changes(race_id))
+    race_averages_team = first_value(db.get_race_averages_team(race_id))
+    circuit_averages_team = first_value(db.get_circuit_averages_team(race_id))
+    position_changes_team = first_value(db.get_position_changes_team(race_id))
+
+    features = [
+        (
+            driver,
+            average,
+            circuit_averages.get(driver),
+            standings.get(driver),
+            position_changes.get(driver),
+            race_averages_team.get(driver),
+            circuit_averages_team.get(driver),
+            position_changes_team.get(driver)
+        )
+        for driver, average in race_averages.items()
+    ]
+    return db.replace_race_features(race_id, features)
+
+def refresh_qualifying_features(race_id):
+    """ Recomputes the materialized qualifying features used to predict the given race. """
+    averages_with_driver = db.get_qualifying_form_with_drivers(race_id)
+    circuit_averages = first_value(db.get_qualifying_form_circuit(race_id))
+    standings = first_value(db.get_qualifying_championship_positions(race_id))
+    average_form_team = first_value(db.get_qualifying_form_average_team(race_id))
+    circuit_averages_team = first_value(db.get_qualifying_form_circuit_team(race_id))
+
+    features = []
+    added_drivers = set()
+    for result in averages_with_driver:
+        driver = result[0]
+        if driver in added_drivers:
+            continue
+        added_drivers.add(driver)
+        features.append((
+            driver,
+            result[-2],
+            result[-1],
+            circuit_averages.get(driver),
+            standings.get(driver),
+            average_form_team.get(driver),
+            circuit_averages_team.get(driver)
+        ))
+    return db.replace_qualifying_features(race_id, features)
+
+def refresh_races(race_ids):
+    """ Refreshes the materialized features of each of the given races. """
+    for race in race_ids:
+        refresh_race_features(race)
+        refresh_qualifying_features(race)
+    logging.info("Refreshed features for %s races", str(len(race_ids)))
+    return len(race_ids)
+
+def refresh_features(race_ids):
+    """ Refreshes the materialized features of the race following each of the
+        given races, being the races whose history changed with their new
+        records. The features of later races would be stale, so are removed,
+        and these use the live queries until they are next. """
+    next_races = sorted(
+        {db.get_next_race_id(race_id) for race_id in race_ids if race_id is not None} - {None}
+    )
+    if len(next_races) > 0:
+        db.delete_features_after(next_races[-1])
+    return refresh_races(next_races)
+
+def refresh_all_features():
+    """ Refreshes the materialized features of every race. """
+    return refresh_races(db.get_race_ids_after(0))
+
 def lap_to_seconds(lap):
     """ Converts lap string to seconds """
     parts = lap.split(':')
@@ -164,6 +243,8 @@ def insert_qualifying_results(race_id, results):
         )
         if inserted == 1:
             total_inserted += 1
+    if total_inserted > 0:
+        db.update_qualifying_deltas(race_id)
     return total_inserted
 
 
@@ -282,3 +363,7 @@ def check_for_database_updates():
     logging.info("Added %s driver standings records", str(drivers_standings))
     constructor_standings = check_for_constructor_standings()
     logging.info("Added %s constructor standings records", str(constructor_standings))
+    # Features are refreshed once all records are added, for the races after
+    # the latest results and qualifying, as only their history has changed
+    if calendar + races + qualifying + drivers_standings > 0:
+        refresh_features([db.get_last_race_id(), db.get_last_qualifying_race_id()])